@@ -1,5 +1,15 @@
 from .util import *
 from .query import *
+from .cache import *
+from .aio import *
+from .limits import *
+from .batch import *
+from .agent_index import *
+from .bitmap_index import *
+from .snapshot import *
+from .prepared import *
+from .agent_stats import *
+from .router import *
 
 
 def get_ro_source_info():
@@ -0,0 +1,310 @@
+__all__ = ['AgentIndex', 'set_agent_index', 'get_agent_index',
+           'rank_hashes']
+
+import os
+import json
+import logging
+from argparse import ArgumentParser
+
+import numpy as np
+from numpy.lib.format import open_memmap
+from sqlalchemy import literal
+
+from indra.util import batch_iter
+
+from indra_db.util import get_ro
+from indra_db.schemas.readonly_schema import ro_role_map
+
+logger = logging.getLogger(__name__)
+
+
+class AgentIndex(object):
+    """An in-memory index from agents to the hashes of their statements.
+
+    The index is built from the agent tables of a readonly dump (name_meta,
+    text_meta, and other_meta), and saved as a directory of numpy arrays. The
+    arrays are memory-mapped when the index is loaded, so several processes
+    on one host (e.g. the workers of the API) share a single copy.
+
+    For each namespace and regularized agent ID, the index holds the hashes of
+    the statements with that agent, sorted by hash, along with the role and
+    agent number of the agent in each. The evidence counts and beliefs of all
+    the statements are held in arrays sorted by hash, so that results may be
+    ranked without the database.
+
+    Parameters
+    ----------
+    directory : str
+        The directory the index was loaded from.
+    keys : dict
+        A dict of dicts, giving the [start, end) span of the agent arrays
+        for each namespace and regularized agent ID.
+    arrays : dict
+        The numpy arrays of the index, by name.
+    dump_id : Optional[str]
+        The id of the readonly dump the index was built from.
+    """
+    version = 1
+    array_dtypes = {'agent_hashes': np.int64, 'agent_roles': np.int8,
+                    'agent_nums': np.int16, 'stmt_hashes': np.int64,
+                    'stmt_ev_counts': np.int32, 'stmt_beliefs': np.float32}
+
+    def __init__(self, directory, keys, arrays, dump_id=None):
+        self.directory = directory
+        self.dump_id = dump_id
+        self._keys = keys
+        self.agent_hashes = arrays['agent_hashes']
+        self.agent_roles = arrays['agent_roles']
+        self.agent_nums = arrays['agent_nums']
+        self.stmt_hashes = arrays['stmt_hashes']
+        self.stmt_ev_counts = arrays['stmt_ev_counts']
+        self.stmt_beliefs = arrays['stmt_beliefs']
+
+    @classmethod
+    def load(cls, directory, ro=None):
+        """Load (memory-map) an index previously built in directory.
+
+        If a database manager `ro` is given, a warning is logged if the index
+        was not built from the dump installed in it.
+        """
+        with open(os.path.join(directory, 'index.json'), 'r') as f:
+            index_json = json.load(f)
+        if index_json['version'] != cls.version:
+            raise ValueError(f"Index in {directory} has version "
+                             f"{index_json['version']}, but version "
+                             f"{cls.version} is required. Rebuild the index.")
+        arrays = {name: np.load(os.path.join(directory, name + '.npy'),
+                                mmap_mode='r')
+                  for name in cls.array_dtypes.keys()}
+        logger.info(f"Loaded agent index from {directory} with "
+                    f"{len(arrays['agent_hashes'])} agents of "
+                    f"{len(arrays['stmt_hashes'])} statements.")
+        index = cls(directory, index_json['keys'], arrays,
+                    index_json.get('dump_id'))
+        if ro is not None and not index.matches(ro):
+            logger.warning(f"Agent index in {directory} was built from dump "
+                           f"{index.dump_id}, not the installed dump, and "
+                           f"will be ignored.")
+        return index
+
+    @classmethod
+    def build(cls, directory, ro=None, batch_size=100000):
+        """Build an index from a readonly database, and save it in directory.
+
+        Parameters
+        ----------
+        directory : str
+            The directory in which the index files are written. It is created
+            if it does not exist.
+        ro : Optional[DatabaseManager]
+            A database manager handle that has valid Readonly tables built. By
+            default, the primary readonly database is used.
+        batch_size : int
+            The number of rows streamed from the database at a time.
+        """
+        if ro is None:
+            ro = get_ro('primary')
+        os.makedirs(directory, exist_ok=True)
+
+        def new_array(name, size):
+            return open_memmap(os.path.join(directory, name + '.npy'),
+                               mode='w+', dtype=cls.array_dtypes[name],
+                               shape=(size,))
+
+        # Get the evidence counts and beliefs of all the statements.
+        sm = ro.SourceMeta
+        stmt_q = (ro.session.query(sm.mk_hash, sm.ev_count, sm.belief)
+                  .order_by(sm.mk_hash))
+        num_stmts = stmt_q.count()
+        logger.info(f"Indexing {num_stmts} statements.")
+        stmt_arrays = [new_array(name, num_stmts) for name
+                       in ['stmt_hashes', 'stmt_ev_counts', 'stmt_beliefs']]
+        pos = 0
+        for rows in batch_iter(stmt_q.yield_per(batch_size), batch_size,
+                               list):
+            for arr, values in zip(stmt_arrays, zip(*rows)):
+                arr[pos:pos + len(rows)] = values
+            pos += len(rows)
+
+        # Get the agents, grouped by namespace and ID, sorted by hash.
+        # PostgreSQL rejects constants in ORDER BY, so the namespace is only
+        # ordered on where it is a real column.
+        agent_queries = []
+        for meta, ns_col, ns_order in [
+                (ro.NameMeta, literal('NAME'), []),
+                (ro.TextMeta, literal('TEXT'), []),
+                (ro.OtherMeta, ro.OtherMeta.db_name, [ro.OtherMeta.db_name])]:
+            agent_queries.append(
+                ro.session.query(ns_col, meta.db_id, meta.mk_hash,
+                                 meta.role_num, meta.ag_num)
+                  .order_by(*ns_order, meta.db_id, meta.mk_hash)
+            )
+        num_agents = sum(q.count() for q in agent_queries)
+        logger.info(f"Indexing {num_agents} agents.")
+        agent_arrays = [new_array(name, num_agents) for name
+                        in ['agent_hashes', 'agent_roles', 'agent_nums']]
+        keys = {}
+        pos = 0
+        for agent_q in agent_queries:
+            span = None
+            for rows in batch_iter(agent_q.yield_per(batch_size),
+                                      batch_size, list):
+                for i, (ns, db_id, mk_hash, role_num, ag_num) \
+                        in enumerate(rows, pos):
+                    ns_keys = keys.setdefault(ns or '', {})
+                    if span is None or ns_keys.get(db_id or '') is not span:
+                        if span is not None:
+                            span[1] = i
+                        span = [i, None]
+                        ns_keys[db_id or ''] = span
+                    for arr, value in zip(agent_arrays,
+                                          [mk_hash, role_num, ag_num]):
+                        arr[i] = value
+                pos += len(rows)
+            if span is not None:
+                span[1] = pos
+
+        for arr in stmt_arrays + agent_arrays:
+            arr.flush()
+        with open(os.path.join(directory, 'index.json'), 'w') as f:
+            json.dump({'version': cls.version, 'dump_id': ro.get_dump_id(),
+                       'keys': keys}, f)
+        logger.info(f"Agent index written to {directory}.")
+        return cls.load(directory)
+
+    def matches(self, ro):
+        """Check whether the index was built from the dump installed in ro."""
+        return self.dump_id is not None and self.dump_id == ro.get_dump_id()
+
+    def get_hashes(self, namespace, regularized_id, role=None,
+                   agent_num=None) -> np.ndarray:
+        """Get the sorted, unique hashes of statements with the given agent."""
+        span = self._keys.get(namespace, {}).get(regularized_id)
+        if span is None:
+            return np.empty(0, dtype=np.int64)
+        start, end = span
+        mask = np.ones(end - start, dtype=bool)
+        if role is not None:
+            role_num = ro_role_map.get_int(role)
+            mask &= self.agent_roles[start:end] == role_num
+        if agent_num is not None:
+            mask &= self.agent_nums[start:end] == agent_num
+        return np.unique(self.agent_hashes[start:end][mask])
+
+    def rank(self, hashes, sort_by, limit=None, offset=None, after=None):
+        """Sort hashes (descending) by ev_count or belief, and then by hash.
+
+        Parameters
+        ----------
+        hashes : np.ndarray
+            A sorted array of unique hashes.
+        sort_by : str
+            'ev_count' or 'belief'.
+        limit : Optional[int]
+            The maximum number of hashes to return.
+        offset : Optional[int]
+            The number of (sorted) hashes to skip.
+        after : Optional[tuple]
+            The sort value and hash of a row: only rows after it in the sort
+            order are returned.
+
+        Returns
+        -------
+        hashes, ev_counts, beliefs : np.ndarray
+            The sorted hashes, and their evidence counts and beliefs.
+        """
+        idx = np.searchsorted(self.stmt_hashes, hashes)
+        found = idx < len(self.stmt_hashes)
+        found[found] = self.stmt_hashes[idx[found]] == hashes[found]
+        idx = idx[found]
+        return rank_hashes(hashes[found], self.stmt_ev_counts[idx],
+                           self.stmt_beliefs[idx], sort_by, limit, offset,
+                           after)
+
+
+def rank_hashes(hashes, ev_counts, beliefs, sort_by, limit=None, offset=None,
+                after=None):
+    """Sort hashes (descending) by ev_count or belief, and then by hash.
+
+    Parameters
+    ----------
+    hashes, ev_counts, beliefs : np.ndarray
+        The hashes, and their evidence counts and beliefs.
+    sort_by : str
+        'ev_count' or 'belief'.
+    limit : Optional[int]
+        The maximum number of hashes to return.
+    offset : Optional[int]
+        The number of (sorted) hashes to skip.
+    after : Optional[tuple]
+        The sort value and hash of a row: only rows after it in the sort order
+        are returned.
+
+    Returns
+    -------
+    hashes, ev_counts, beliefs : np.ndarray
+        The sorted hashes, and their evidence counts and beliefs.
+    """
+    sort_vals = ev_counts if sort_by == 'ev_count' else beliefs
+    if after is not None:
+        after_val = sort_vals.dtype.type(after[0])
+        past = (sort_vals < after_val) \
+            | ((sort_vals == after_val) & (hashes < after[1]))
+        hashes, ev_counts, beliefs, sort_vals = \
+            hashes[past], ev_counts[past], beliefs[past], sort_vals[past]
+
+    order = np.lexsort((hashes, sort_vals))[::-1]
+    if offset:
+        order = order[offset:]
+    if limit is not None:
+        order = order[:limit]
+    return hashes[order], ev_counts[order], beliefs[order]
+
+
+_agent_index = None
+
+
+def set_agent_index(index):
+    """Set the agent index used to answer simple agent queries.
+
+    Parameters
+    ----------
+    index : Optional[AgentIndex]
+        The index to use. If None, all queries go to the database (the
+        default). Queries on a database with another dump than that of the
+        index do not use it.
+    """
+    global _agent_index
+    _agent_index = index
+
+
+def get_agent_index(ro=None):
+    """Get the agent index currently in use, if any.
+
+    Parameters
+    ----------
+    ro : Optional[DatabaseManager]
+        If given, the index is only returned if it was built from the dump
+        installed in this database.
+    """
+    if _agent_index is not None and ro is not None and not _agent_index.matches(ro):
+        logger.debug("The agent index is of another dump, so it is ignored.")
+        return None
+    return _agent_index
+
+
+def main():
+    parser = ArgumentParser(
+        description="Build an index from agents to statement hashes from the "
+                    "readonly database, for use by the query API."
+    )
+    parser.add_argument('directory',
+                        help="The directory in which to save the index.")
+    parser.add_argument('--readonly', default='primary',
+                        help="The label of the readonly database to index.")
+    args = parser.parse_args()
+    AgentIndex.build(args.directory, get_ro(args.readonly))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+__all__ = ['get_agent_summary', 'get_agent_completions']
+
+import logging
+
+from sqlalchemy import desc
+
+from indra_db.util import get_ro, regularize_agent_id
+from indra_db.client.readonly.router import routed
+
+logger = logging.getLogger(__name__)
+
+
+@routed
+def get_agent_summary(agent_id, namespace='NAME', ro=None):
+    """Get the pre-computed statistics of the statements with an agent.
+
+    This is a single lookup in the readonly agent_stats table, so it is far
+    faster than an aggregation over the statements of the agent.
+
+    Parameters
+    ----------
+    agent_id : str
+        The ID of the agent, e.g. "TP53" for the NAME namespace.
+    namespace : str
+        The namespace of the agent ID, e.g. NAME (default), TEXT, or HGNC.
+    ro : Optional[DatabaseManager]
+        A database manager handle. The default is the primary readonly, as
+        indicated by environment variables or the config file.
+
+    Returns
+    -------
+    summary : Optional[dict]
+        The statistics of the agent: the number of statements (num_stmts),
+        their total evidence (ev_count) and maximum belief (max_belief), the
+        number of statements in which the agent has each role (role_counts),
+        and the up to 10 agents (by name) it most often appears with
+        (top_partners), as [name, num_stmts, ev_count] lists. None if the
+        agent is in no statements.
+    """
+    if ro is None:
+        ro = get_ro('primary')
+
+    stats = ro.AgentStats
+    regularized_id = regularize_agent_id(agent_id, namespace)
+    row = (ro.session.query(stats)
+           .filter(stats.db_id == regularized_id,
+                   stats.db_name == namespace)
+           .first())
+    if row is None:
+        return None
+    return _summary_from_row(row)
+
+
+@routed
+def get_agent_completions(prefix, namespace='NAME', limit=10, ro=None):
+    """Get the summaries of the agents whose IDs start with a prefix.
+
+    This is meant for autocompletion: the agents are sorted by their total
+    evidence count, descending.
+
+    Parameters
+    ----------
+    prefix : str
+        The start of the agent IDs, e.g. "MAP2K".
+    namespace : str
+        The namespace of the agent IDs, e.g. NAME (default), TEXT, or HGNC.
+    limit : int
+        The maximum number of agents to return. Default is 10.
+    ro : Optional[DatabaseManager]
+        A database manager handle. The default is the primary readonly, as
+        indicated by environment variables or the config file.
+
+    Returns
+    -------
+    summaries : list[dict]
+        The summaries (see `get_agent_summary`) of the matching agents.
+    """
+    if ro is None:
+        ro = get_ro('primary')
+
+    stats = ro.AgentStats
+    regularized_prefix = regularize_agent_id(prefix, namespace)
+    q = (ro.session.query(stats)
+         .filter(stats.db_name == namespace,
+                 stats.db_id.startswith(regularized_prefix, autoescape=True))
+         .order_by(desc(stats.ev_count), stats.db_id)
+         .limit(limit))
+    return [_summary_from_row(row) for row in q.all()]
+
+
+def _summary_from_row(row):
+    return {'namespace': row.db_name, 'agent_id': row.db_id,
+            'num_stmts': row.num_stmts, 'ev_count': row.ev_count,
+            'max_belief': row.max_belief, 'role_counts': row.role_counts,
+            'top_partners': row.top_partners}
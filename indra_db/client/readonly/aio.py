@@ -0,0 +1,138 @@
+__all__ = ['AsyncReadonlyDatabase', 'compile_for_asyncpg']
+
+import re
+import json
+import asyncio
+import logging
+from itertools import count
+
+from sqlalchemy.orm import Query as OrmQuery
+from sqlalchemy.dialects.postgresql.psycopg2 import PGDialect_psycopg2
+
+from indra_db.util import get_ro
+
+try:
+    import asyncpg
+    WITH_ASYNCPG = True
+except ImportError:
+    WITH_ASYNCPG = False
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncReadonlyDatabase(object):
+    """A pool of asynchronous connections to a readonly database.
+
+    Queries build their SQL with the usual readonly database manager. The SQL
+    is then compiled and run on this pool using asyncpg, so that one process
+    may have many readonly queries in flight at once.
+
+    Parameters
+    ----------
+    ro : Optional[ReadonlyDatabaseManager]
+        The manager of the readonly database, used to build the SQL and to
+        get the connection details. By default, the primary readonly database
+        is used.
+    min_size : int
+        The number of connections the pool is initialized with. Default is 1.
+    max_size : int
+        The maximum number of connections in the pool. Default is 10.
+
+    Example
+    -------
+    To get the hashes of several queries at once:
+
+    >> async with AsyncReadonlyDatabase() as ro_async:
+    >>     results = await asyncio.gather(*[q.aget_hashes(ro_async, limit=10)
+    >>                                      for q in queries])
+    """
+    def __init__(self, ro=None, min_size=1, max_size=10):
+        if not WITH_ASYNCPG:
+            raise RuntimeError("Cannot run queries asynchronously: `asyncpg` "
+                               "is not available.")
+        if ro is None:
+            ro = get_ro('primary')
+            if ro is None:
+                raise RuntimeError("No readonly database is available.")
+        self.ro = ro
+        self.min_size = min_size
+        self.max_size = max_size
+        self.source_names = None
+        self._pool = None
+
+    async def open(self):
+        """Open the connection pool, if it is not already open.
+
+        The source names of the readonly database, needed to unpack results,
+        are also loaded, in a thread so as not to block the event loop.
+        """
+        if self._pool is None:
+            self.source_names = await asyncio.get_event_loop()\
+                .run_in_executor(None, self.ro.get_source_names)
+            url = self.ro.url
+            logger.info(f"Opening async connection pool to {url.host}.")
+            self._pool = await asyncpg.create_pool(
+                host=url.host, port=url.port, user=url.username,
+                password=url.password, database=url.database,
+                min_size=self.min_size, max_size=self.max_size,
+                init=_init_connection
+            )
+        return self
+
+    async def close(self):
+        """Close the connection pool."""
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def fetch(self, selectable):
+        """Run a SQLAlchemy selectable or ORM query and get all the rows."""
+        await self.open()
+        sql, params = compile_for_asyncpg(selectable)
+        async with self._pool.acquire() as conn:
+            return await conn.fetch(sql, *params)
+
+
+async def _init_connection(conn):
+    # Decode JSON columns into python objects, as psycopg2 does.
+    for type_name in ['json', 'jsonb']:
+        await conn.set_type_codec(type_name, encoder=json.dumps,
+                                  decoder=json.loads, schema='pg_catalog')
+
+
+_dialect = PGDialect_psycopg2(paramstyle='format')
+
+
+def compile_for_asyncpg(selectable):
+    """Compile a SQLAlchemy selectable into SQL and parameters for asyncpg.
+
+    The SQL is compiled with positional parameters, which are then rewritten
+    into the numbered ($1, $2, ...) form used by asyncpg.
+
+    Returns
+    -------
+    sql : str
+        The SQL of the selectable.
+    params : list
+        The values of the parameters, in order.
+    """
+    if isinstance(selectable, OrmQuery):
+        selectable = selectable.statement
+    compiled = selectable.compile(dialect=_dialect)
+    params = [compiled.params[name] for name in compiled.positiontup]
+
+    param_nums = count(1)
+
+    def replace_param(match):
+        if match.group() == '%%':
+            return '%'
+        return f'${next(param_nums)}'
+
+    sql = re.sub(r'%%|%s', replace_param, compiled.string)
+    return sql, params
@@ -0,0 +1,145 @@
+__all__ = ['run_batch']
+
+import logging
+
+import requests
+from sqlalchemy import select, literal, union_all, desc, func
+
+from indra import get_config
+
+from indra_db.util import get_ro
+from indra_db.client.readonly.query import QueryResult, ApiError
+from indra_db.client.readonly.router import routed
+from indra_db.client.readonly.limits import query_limits
+
+logger = logging.getLogger(__name__)
+
+
+@routed
+def run_batch(queries, ro=None, result_type='hashes', limit=None,
+              sort_by='ev_count', batch_size=100, timeout=None,
+              cancel_handle=None):
+    """Get the results of many queries, with one round trip per batch.
+
+    The SQL of the queries in each batch is combined into a single statement
+    (a UNION ALL of the queries, each tagged with its position in the list),
+    and the rows are then split back out for each query.
+
+    Parameters
+    ----------
+    queries : list[Query]
+        The queries whose results are wanted.
+    ro : Optional[DatabaseManager]
+        A database manager handle that has valid Readonly tables built. If
+        not given, and the primary readonly database is not available, the
+        batch is sent to the web API.
+    result_type : str
+        Either 'hashes' (default), to get a QueryResult of hashes for each
+        query (as from `Query.get_hashes`), or 'count', to get the number of
+        statements for each query (as from `Query.count`).
+    limit : Optional[int]
+        The maximum number of hashes to get for each query.
+    sort_by : str
+        'ev_count' or 'belief': select the parameter by which the hashes of
+        each query are sorted.
+    batch_size : int
+        The number of queries combined in each SQL statement. Default is 100.
+    timeout : Optional[float]
+        The maximum time, in seconds, the database may spend on each SQL
+        statement. If exceeded, a QueryTimeoutError is raised.
+    cancel_handle : Optional[QueryCancelHandle]
+        A handle with which the batch may be cancelled from another thread,
+        in which case a QueryCancelledError is raised.
+
+    Returns
+    -------
+    results : list
+        The results, in the same order as the queries.
+    """
+    if result_type not in {'hashes', 'count'}:
+        raise ValueError(f"Invalid result type for a batch: {result_type}")
+    if sort_by != 'ev_count':
+        sort_by = 'belief'
+
+    if ro is None:
+        ro = get_ro('primary')
+    if ro is None:
+        return _run_batch_rest(queries, result_type, limit, sort_by)
+
+    results = [None] * len(queries)
+    with query_limits(ro, timeout, cancel_handle):
+        for start in range(0, len(queries), batch_size):
+            batch = list(enumerate(queries[start:start + batch_size], start))
+            logger.debug(f"Running batch of {len(batch)} queries for "
+                         f"{result_type}.")
+            if result_type == 'hashes':
+                _run_hash_batch(ro, batch, results, limit, sort_by)
+            else:
+                _run_count_batch(ro, batch, results)
+    return results
+
+
+def _run_hash_batch(ro, batch, results, limit, sort_by):
+    selections = []
+    sort_lists = {}
+    for idx, query in batch:
+        if query.empty:
+            results[idx] = QueryResult.empty(set(), limit, None,
+                                             query.to_json(), 'hashes')
+            continue
+        mk_hashes_q, sort_lists[idx] = \
+            query._get_ranked_hash_query(ro, sort_by, limit)
+        mk_hashes_sq = mk_hashes_q.subquery()
+        selections.append(select([mk_hashes_sq.c.mk_hash,
+                                  mk_hashes_sq.c.ev_count,
+                                  mk_hashes_sq.c.belief,
+                                  literal(idx).label('query_idx')]))
+    if not selections:
+        return
+
+    batch_sq = union_all(*selections).alias('batch')
+    batch_q = (select([batch_sq])
+               .order_by(batch_sq.c.query_idx, desc(batch_sq.c[sort_by]),
+                         desc(batch_sq.c.mk_hash)))
+    rows_by_idx = {idx: [] for idx in sort_lists.keys()}
+    for row in ro.session.execute(batch_q):
+        rows_by_idx[row.query_idx].append(row)
+
+    queries = dict(batch)
+    for idx, rows in rows_by_idx.items():
+        results[idx] = queries[idx]._make_hash_result(rows, limit, None,
+                                                      sort_lists[idx])
+
+
+def _run_count_batch(ro, batch, results):
+    selections = []
+    for idx, query in batch:
+        if query.empty:
+            results[idx] = 0
+            continue
+        mk_hashes_sq = query.normalized().build_hash_query(ro).subquery()
+        selections.append(
+            select([func.count(mk_hashes_sq.c.mk_hash.distinct())
+                    .label('num_stmts'),
+                    literal(idx).label('query_idx')])
+        )
+    if not selections:
+        return
+
+    for row in ro.session.execute(union_all(*selections)):
+        results[row.query_idx] = row.num_stmts
+
+
+def _run_batch_rest(queries, result_type, limit, sort_by):
+    logger.info("Using remote API to resolve batch of queries.")
+    url = get_config('INDRA_DB_REST_URL', failure_ok=False)
+    resp = requests.post(f'{url}/batch/{result_type}',
+                         json={'queries': [q.to_json() for q in queries],
+                               'limit': limit, 'sort_by': sort_by})
+    if resp.status_code != 200:
+        raise ApiError(f"REST API failed with ({resp.status_code}): "
+                       f"{resp.text}")
+    res_json = resp.json()
+    if result_type == 'count':
+        return res_json['results']
+    return [QueryResult.from_json(r) for r in res_json['results']]
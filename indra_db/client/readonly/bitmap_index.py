@@ -0,0 +1,333 @@
+__all__ = ['HashBitmapIndex', 'set_bitmap_index', 'get_bitmap_index']
+
+import os
+import json
+import mmap
+import logging
+from threading import Lock
+from argparse import ArgumentParser
+
+import numpy as np
+from numpy.lib.format import open_memmap
+from cachetools import LRUCache
+from sqlalchemy import literal
+
+from indra.util import batch_iter
+
+from indra_db.util import get_ro
+
+try:
+    from pyroaring import BitMap, FrozenBitMap
+    WITH_ROARING = True
+except ImportError:
+    WITH_ROARING = False
+
+logger = logging.getLogger(__name__)
+
+
+class HashBitmapIndex(object):
+    """Compressed bitmaps of the statements of frequent agents, MeSH, sources.
+
+    The statements of a readonly dump are numbered densely, in order of hash,
+    so that a set of statements can be held as a roaring bitmap of their
+    numbers. Bitmaps are precomputed for every agent and MeSH ID in at least
+    `min_stmts` statements, and for every source, and saved in a directory
+    along with the sorted hashes.
+
+    Queries made of these constraints, including inverted ones, can then be
+    resolved by bitmap algebra, without the `EXCEPT` against a whole table
+    that the database needs for an inversion. Only the surviving hashes are
+    sent to the database, to be ranked and to get their content.
+
+    This requires the optional pyroaring package.
+
+    Parameters
+    ----------
+    directory : str
+        The directory the index was loaded from.
+    keys : dict
+        The [start, end) span of the serialized bitmap in the bitmap file for
+        each agent (by namespace and regularized ID), MeSH ID (by type and
+        number), and source.
+    stmt_hashes : np.ndarray
+        The sorted hashes of all the statements in the dump.
+    bitmap_data : bytes-like
+        The contents of the bitmap file.
+    dump_id : Optional[str]
+        The id of the readonly dump the index was built from.
+    cache_size : int
+        The number of bitmaps held deserialized. Default is 1000.
+    """
+    version = 1
+
+    def __init__(self, directory, keys, stmt_hashes, bitmap_data,
+                 dump_id=None, cache_size=1000):
+        if not WITH_ROARING:
+            raise RuntimeError("The bitmap index requires pyroaring to be "
+                               "installed.")
+        self.directory = directory
+        self.dump_id = dump_id
+        self.stmt_hashes = stmt_hashes
+        self._keys = keys
+        self._bitmap_data = bitmap_data
+        self._cache = LRUCache(maxsize=cache_size)
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self.stmt_hashes)
+
+    @classmethod
+    def load(cls, directory, cache_size=1000, ro=None):
+        """Load (memory-map) an index previously built in directory.
+
+        If a database manager `ro` is given, a warning is logged if the index
+        was not built from the dump installed in it.
+        """
+        with open(os.path.join(directory, 'index.json'), 'r') as f:
+            index_json = json.load(f)
+        if index_json['version'] != cls.version:
+            raise ValueError(f"Index in {directory} has version "
+                             f"{index_json['version']}, but version "
+                             f"{cls.version} is required. Rebuild the index.")
+        stmt_hashes = np.load(os.path.join(directory, 'stmt_hashes.npy'),
+                              mmap_mode='r')
+        with open(os.path.join(directory, 'bitmaps.bin'), 'rb') as f:
+            if os.fstat(f.fileno()).st_size:
+                bitmap_data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                bitmap_data = b''
+        num_bitmaps = sum(len(ns_keys) for group in index_json['keys'].values()
+                          for ns_keys in group.values())
+        logger.info(f"Loaded bitmap index from {directory} with {num_bitmaps} "
+                    f"bitmaps of {len(stmt_hashes)} statements.")
+        index = cls(directory, index_json['keys'], stmt_hashes, bitmap_data,
+                    index_json.get('dump_id'), cache_size)
+        if ro is not None and not index.matches(ro):
+            logger.warning(f"Bitmap index in {directory} was built from dump "
+                           f"{index.dump_id}, not the installed dump, and "
+                           f"will be ignored.")
+        return index
+
+    @classmethod
+    def build(cls, directory, ro=None, min_stmts=1000, batch_size=100000):
+        """Build an index from a readonly database, and save it in directory.
+
+        Parameters
+        ----------
+        directory : str
+            The directory in which the index files are written. It is created
+            if it does not exist.
+        ro : Optional[DatabaseManager]
+            A database manager handle that has valid Readonly tables built. By
+            default, the primary readonly database is used.
+        min_stmts : int
+            The minimum number of statements of an agent or MeSH ID for its
+            bitmap to be saved. Default is 1000.
+        batch_size : int
+            The number of rows streamed from the database at a time.
+        """
+        if not WITH_ROARING:
+            raise RuntimeError("The bitmap index requires pyroaring to be "
+                               "installed.")
+        if ro is None:
+            ro = get_ro('primary')
+        os.makedirs(directory, exist_ok=True)
+
+        # Number the statements by their position in order of hash.
+        sm = ro.SourceMeta
+        stmt_q = ro.session.query(sm.mk_hash).order_by(sm.mk_hash)
+        num_stmts = stmt_q.count()
+        logger.info(f"Numbering {num_stmts} statements.")
+        stmt_hashes = open_memmap(os.path.join(directory, 'stmt_hashes.npy'),
+                                  mode='w+', dtype=np.int64,
+                                  shape=(num_stmts,))
+        pos = 0
+        for rows in batch_iter(stmt_q.yield_per(batch_size), batch_size,
+                               list):
+            stmt_hashes[pos:pos + len(rows)] = [h for h, in rows]
+            pos += len(rows)
+        stmt_hashes.flush()
+
+        # Each query gives the group and key of a bitmap, and a hash in it,
+        # sorted by group and key.
+        # PostgreSQL rejects constants in ORDER BY, so the namespace is only
+        # ordered on where it is a real column.
+        group_queries = []
+        for meta, ns_col, ns_order in [
+                (ro.NameMeta, literal('NAME'), []),
+                (ro.TextMeta, literal('TEXT'), []),
+                (ro.OtherMeta, ro.OtherMeta.db_name, [ro.OtherMeta.db_name])]:
+            group_queries.append(
+                ('agents', min_stmts,
+                 ro.session.query(ns_col, meta.db_id, meta.mk_hash)
+                   .order_by(*ns_order, meta.db_id))
+            )
+        for meta, mesh_type in [(ro.MeshTermMeta, 'D'),
+                                (ro.MeshConceptMeta, 'C')]:
+            group_queries.append(
+                ('mesh', min_stmts,
+                 ro.session.query(literal(mesh_type), meta.mesh_num,
+                                  meta.mk_hash)
+                   .order_by(meta.mesh_num))
+            )
+        for src in sorted(ro.get_source_names()):
+            group_queries.append(
+                ('sources', 0,
+                 ro.session.query(literal(''), literal(src), sm.mk_hash)
+                   .filter(getattr(sm, src) > 0))
+            )
+
+        keys = {'agents': {}, 'mesh': {}, 'sources': {}}
+        with open(os.path.join(directory, 'bitmaps.bin'), 'wb') as f:
+            def save_bitmap(group, sub_group, key, hashes, min_size):
+                ids, found = _get_ids(stmt_hashes, hashes)
+                bitmap = BitMap(ids[found])
+                if len(bitmap) < min_size:
+                    return
+                start = f.tell()
+                f.write(bitmap.serialize())
+                # The keys are strings in JSON, e.g. the numbers of MeSH IDs.
+                key = '' if key is None else str(key)
+                keys[group].setdefault(sub_group or '', {})[key] = \
+                    [start, f.tell()]
+
+            for group, min_size, group_q in group_queries:
+                logger.info(f"Building bitmaps of {group}: {group_q}")
+                current = None
+                hashes = []
+                for rows in batch_iter(group_q.yield_per(batch_size),
+                                       batch_size, list):
+                    for sub_group, key, mk_hash in rows:
+                        if (sub_group, key) != current:
+                            if current is not None:
+                                save_bitmap(group, *current,
+                                            np.array(hashes, dtype=np.int64),
+                                            min_size)
+                            current = (sub_group, key)
+                            hashes = []
+                        hashes.append(mk_hash)
+                if current is not None:
+                    save_bitmap(group, *current,
+                                np.array(hashes, dtype=np.int64), min_size)
+
+        with open(os.path.join(directory, 'index.json'), 'w') as f:
+            json.dump({'version': cls.version, 'dump_id': ro.get_dump_id(),
+                       'min_stmts': min_stmts, 'keys': keys}, f)
+        logger.info(f"Bitmap index written to {directory}.")
+        return cls.load(directory)
+
+    def matches(self, ro):
+        """Check whether the index was built from the dump installed in ro."""
+        return self.dump_id is not None and self.dump_id == ro.get_dump_id()
+
+    def _get_bitmap(self, group, sub_group, key):
+        """Get a saved bitmap, or None if there is none with the key."""
+        span = self._keys[group].get(sub_group, {}).get(key)
+        if span is None:
+            return None
+        cache_key = (group, sub_group, key)
+        with self._lock:
+            bitmap = self._cache.get(cache_key)
+        if bitmap is None:
+            start, end = span
+            bitmap = FrozenBitMap.deserialize(self._bitmap_data[start:end])
+            with self._lock:
+                self._cache[cache_key] = bitmap
+        return bitmap
+
+    def get_agent_bitmap(self, namespace, regularized_id):
+        """Get the bitmap of the statements with an agent, if it is saved."""
+        return self._get_bitmap('agents', namespace, regularized_id)
+
+    def get_mesh_bitmap(self, mesh_type, mesh_num):
+        """Get the bitmap of the statements with a MeSH ID, if it is saved."""
+        return self._get_bitmap('mesh', mesh_type, str(mesh_num))
+
+    def get_source_bitmap(self, source):
+        """Get the bitmap of the statements with evidence from a source."""
+        return self._get_bitmap('sources', '', source)
+
+    def get_hash_bitmap(self, hashes):
+        """Get the bitmap of the statements with the given hashes."""
+        ids, found = _get_ids(self.stmt_hashes, hashes)
+        return FrozenBitMap(ids[found])
+
+    def complement(self, bitmap):
+        """Get the bitmap of all the statements not in bitmap."""
+        return bitmap.flip(0, len(self))
+
+    def get_hashes(self, bitmap) -> np.ndarray:
+        """Get the sorted array of the hashes of the statements in bitmap."""
+        ids = np.frombuffer(bitmap.to_array(), dtype=np.uint32)
+        return self.stmt_hashes[ids]
+
+    def contains(self, bitmap, hashes) -> np.ndarray:
+        """Get a boolean array marking which of the hashes are in bitmap."""
+        ids, found = _get_ids(self.stmt_hashes, hashes)
+        hits = bitmap & BitMap(ids[found])
+        found[found] = np.isin(ids[found],
+                               np.frombuffer(hits.to_array(), dtype=np.uint32))
+        return found
+
+
+def _get_ids(stmt_hashes, hashes):
+    """Get the numbers of hashes, and a mask of those that were found."""
+    hashes = np.asarray(hashes, dtype=np.int64)
+    ids = np.searchsorted(stmt_hashes, hashes)
+    found = ids < len(stmt_hashes)
+    found[found] = stmt_hashes[ids[found]] == hashes[found]
+    return ids.astype(np.uint32), found
+
+
+_bitmap_index = None
+
+
+def set_bitmap_index(index):
+    """Set the bitmap index used to pre-filter queries.
+
+    Parameters
+    ----------
+    index : Optional[HashBitmapIndex]
+        The index to use. If None, all queries go to the database as they are
+        (the default). Queries on a database with another dump than that of
+        the index do not use it.
+    """
+    global _bitmap_index
+    _bitmap_index = index
+
+
+def get_bitmap_index(ro=None):
+    """Get the bitmap index currently in use, if any.
+
+    Parameters
+    ----------
+    ro : Optional[DatabaseManager]
+        If given, the index is only returned if it was built from the dump
+        installed in this database.
+    """
+    if _bitmap_index is not None and ro is not None and not _bitmap_index.matches(ro):
+        logger.debug("The bitmap index is of another dump, so it is ignored.")
+        return None
+    return _bitmap_index
+
+
+def main():
+    parser = ArgumentParser(
+        description="Build bitmaps of the statements of frequent agents, MeSH "
+                    "IDs, and sources from the readonly database, for use by "
+                    "the query API."
+    )
+    parser.add_argument('directory',
+                        help="The directory in which to save the index.")
+    parser.add_argument('--readonly', default='primary',
+                        help="The label of the readonly database to index.")
+    parser.add_argument('--min-stmts', type=int, default=1000,
+                        help="The minimum number of statements of an agent or "
+                             "MeSH ID for its bitmap to be saved.")
+    args = parser.parse_args()
+    HashBitmapIndex.build(args.directory, get_ro(args.readonly),
+                          args.min_stmts)
+
+
+if __name__ == '__main__':
+    main()
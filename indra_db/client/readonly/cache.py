@@ -0,0 +1,305 @@
+__all__ = ['ResultCache', 'MemoryResultCache', 'DiskResultCache',
+           'set_result_cache', 'get_result_cache', 'clear_result_cache']
+
+import os
+import json
+import pickle
+import logging
+import hashlib
+from inspect import signature
+from functools import wraps
+from threading import Lock
+
+from cachetools import LRUCache
+
+from indra_db.util import get_ro
+
+logger = logging.getLogger(__name__)
+
+
+class ResultCache(object):
+    """The core class for the caches of query results; not functional on its own.
+
+    Results are stored as pickled bytes, keyed by a digest of the query JSON,
+    the parameters of the call, and the identity of the readonly dump.
+
+    Parameters
+    ----------
+    backend : Optional[ResultCache]
+        Another cache, generally slower and larger (e.g. on disk), which is
+        consulted when this cache misses, and to which new results are also
+        written.
+    """
+    def __init__(self, backend=None):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Get the result stored under key, or None if there is no such key."""
+        data = self._get_bytes(key)
+        if data is None and self.backend is not None:
+            data = self.backend._get_bytes(key)
+            if data is not None:
+                self._put_bytes(key, data)
+        if data is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return pickle.loads(data)
+
+    def put(self, key, result):
+        """Store a result under the given key."""
+        data = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        self._put_bytes(key, data)
+        if self.backend is not None:
+            self.backend._put_bytes(key, data)
+
+    def clear(self):
+        """Remove all the entries from this cache, and its backend."""
+        self._clear()
+        if self.backend is not None:
+            self.backend.clear()
+
+    def _get_bytes(self, key):
+        raise NotImplementedError()
+
+    def _put_bytes(self, key, data):
+        raise NotImplementedError()
+
+    def _clear(self):
+        raise NotImplementedError()
+
+
+class MemoryResultCache(ResultCache):
+    """An in-process least-recently-used cache bounded by size in bytes.
+
+    Parameters
+    ----------
+    max_bytes : int
+        The maximum total size of the (pickled) results held in the cache.
+        Default is 256 MB. Results larger than this are never cached.
+    backend : Optional[ResultCache]
+        A cache to fall back on, for example a DiskResultCache.
+    """
+    def __init__(self, max_bytes=2**28, backend=None):
+        super(MemoryResultCache, self).__init__(backend)
+        self.max_bytes = max_bytes
+        self._lru = LRUCache(maxsize=max_bytes, getsizeof=len)
+        self._lock = Lock()
+
+    def _get_bytes(self, key):
+        with self._lock:
+            return self._lru.get(key)
+
+    def _put_bytes(self, key, data):
+        if len(data) > self.max_bytes:
+            logger.debug(f"Result of {len(data)} bytes is too large to cache.")
+            return
+        with self._lock:
+            self._lru[key] = data
+
+    def _clear(self):
+        with self._lock:
+            self._lru.clear()
+
+    @property
+    def size(self):
+        """The total number of bytes currently held in the cache."""
+        return self._lru.currsize
+
+
+class DiskResultCache(ResultCache):
+    """A cache that stores results as files in a directory.
+
+    The directory may be shared, for example by several worker processes or,
+    over a network file system, by several hosts.
+
+    The files are touched when read, and once this process has written more
+    than a tenth of `max_bytes`, the least recently used files are removed
+    until the directory holds no more than `max_bytes`.
+
+    Parameters
+    ----------
+    directory : str
+        The path to the directory where the results are stored. It will be
+        created if it does not exist.
+    max_bytes : int
+        The maximum total size of the results held in the directory. Default
+        is 4 GB. Results larger than this are never cached.
+    backend : Optional[ResultCache]
+        A cache to fall back on.
+    """
+    suffix = '.pkl'
+
+    def __init__(self, directory, max_bytes=2**32, backend=None):
+        super(DiskResultCache, self).__init__(backend)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._bytes_since_evict = 0
+        self._lock = Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.evict()
+
+    def _get_path(self, key):
+        return os.path.join(self.directory, key + self.suffix)
+
+    def _get_bytes(self, key):
+        path = self._get_path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return data
+
+    def _put_bytes(self, key, data):
+        if len(data) > self.max_bytes:
+            logger.debug(f"Result of {len(data)} bytes is too large to cache.")
+            return
+
+        # Write to a temporary file and move it into place, so that readers in
+        # other processes never see a partial file.
+        path = self._get_path(key)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._bytes_since_evict += len(data)
+            due = self._bytes_since_evict > self.max_bytes // 10
+            if due:
+                self._bytes_since_evict = 0
+        if due:
+            self.evict()
+
+    def evict(self):
+        """Remove the least recently used results beyond max_bytes."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(self.suffix):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        if total <= self.max_bytes:
+            return
+        logger.info(f"Evicting results from {self.directory}, which holds "
+                    f"{total} bytes.")
+        for _, size, path in sorted(entries):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def _clear(self):
+        for fname in os.listdir(self.directory):
+            if fname.endswith(self.suffix):
+                try:
+                    os.remove(os.path.join(self.directory, fname))
+                except FileNotFoundError:
+                    pass
+
+
+_result_cache = None
+
+
+def set_result_cache(cache):
+    """Set the cache used for the results of Query methods.
+
+    Parameters
+    ----------
+    cache : Optional[ResultCache]
+        The cache to use. If None, results will not be cached (the default).
+    """
+    global _result_cache
+    _result_cache = cache
+
+
+def get_result_cache():
+    """Get the cache currently used for the results of Query methods."""
+    return _result_cache
+
+
+def clear_result_cache():
+    """Invalidate all cached results, for example when a new dump is loaded."""
+    if _result_cache is not None:
+        logger.info("Clearing the query result cache.")
+        _result_cache.clear()
+
+
+def _get_param_key(value, ro):
+    """Get a JSON-able representation of a parameter for use in a key."""
+    # Evidence filters are defined by functions, so use the SQL they produce.
+    if hasattr(value, 'get_clause'):
+        clause = value.get_clause(ro)
+        return str(clause.compile(compile_kwargs={'literal_binds': True}))
+    elif isinstance(value, (set, frozenset)):
+        return sorted(value)
+    return value
+
+
+# Parameters which limit how a query is run, but do not affect its result.
+_UNKEYED_PARAMS = {'timeout', 'cancel_handle'}
+
+
+def make_result_key(query, method_name, ro, params):
+    """Get the key of a Query method call result."""
+    key_json = {'query': query.normalized().to_json(),
+                'method': method_name,
+                'params': {k: _get_param_key(v, ro) for k, v in params.items()
+                           if k not in _UNKEYED_PARAMS},
+                'dump': ro.get_dump_id()}
+    key_str = json.dumps(key_json, sort_keys=True, default=str)
+    return hashlib.sha256(key_str.encode('utf-8')).hexdigest()
+
+
+def cached_result(get_method):
+    """Decorate a Query method such that its results are cached.
+
+    The results are only cached if a cache has been set with
+    `set_result_cache`, and the query is being run directly on a readonly
+    database.
+    """
+    method_sig = signature(get_method)
+
+    @wraps(get_method)
+    def get_cached(query, *args, **kwargs):
+        cache = get_result_cache()
+        if cache is None or query._print_only:
+            return get_method(query, *args, **kwargs)
+
+        # Get the complete set of parameters, and the database.
+        bound = method_sig.bind(query, *args, **kwargs)
+        bound.apply_defaults()
+        params = dict(bound.arguments)
+        params.pop('self')
+        ro = params.pop('ro')
+        if ro is None:
+            ro = get_ro('primary')
+
+        # If there is no direct database access, there is no dump to key on.
+        if ro is None:
+            return get_method(query, ro, **params)
+
+        key = make_result_key(query, get_method.__name__, ro, params)
+        result = cache.get(key)
+        if result is not None:
+            logger.debug(f"Found {get_method.__name__} result in cache.")
+            return result
+
+        result = get_method(query, ro, **params)
+        if result is not None:
+            cache.put(key, result)
+        return result
+
+    return get_cached
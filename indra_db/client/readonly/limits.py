@@ -0,0 +1,167 @@
+__all__ = ['QueryCancelHandle', 'query_limits']
+
+import logging
+from inspect import signature
+from functools import wraps
+from threading import Lock
+from contextlib import contextmanager
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+from indra_db.util import get_ro
+from indra_db.exceptions import QueryTimeoutError, QueryCancelledError
+
+logger = logging.getLogger(__name__)
+
+
+# The SQLSTATE of the error raised when a statement is cancelled, whether due
+# to the statement_timeout or to pg_cancel_backend.
+QUERY_CANCELED_CODE = '57014'
+
+
+class QueryCancelHandle(object):
+    """A handle with which a running query may be cancelled.
+
+    Pass the handle to one of the Query methods (e.g. `get_statements`), and
+    call `cancel` from another thread, for example when the client waiting on
+    the results has gone away. A query whose parts run on several connections
+    at once is cancelled on all of them.
+    """
+    def __init__(self):
+        self.cancelled = False
+        self._ro = None
+        self._backend_pids = set()
+        self._lock = Lock()
+
+    def attach(self, ro, session=None):
+        """Record a database backend that is running the query.
+
+        The backend is that of `session`, by default `ro.session`. Its pid is
+        returned, with which to detach it.
+        """
+        if session is None:
+            session = ro.session
+        backend_pid = session.execute(text('SELECT pg_backend_pid()'))\
+            .scalar()
+        with self._lock:
+            if self.cancelled:
+                raise QueryCancelledError()
+            self._ro = ro
+            self._backend_pids.add(backend_pid)
+        return backend_pid
+
+    def detach(self, backend_pid):
+        """Forget a database backend, once its part of the query is done."""
+        # This waits for any cancellation in progress, so that a cancellation
+        # can never hit a later query using the same connection.
+        with self._lock:
+            self._backend_pids.discard(backend_pid)
+
+    def cancel(self) -> bool:
+        """Cancel the query.
+
+        Returns
+        -------
+        signalled : bool
+            True if a running query was signalled to stop.
+        """
+        with self._lock:
+            self.cancelled = True
+            if not self._backend_pids:
+                return False
+            session = self._ro.new_session()
+            try:
+                signalled = False
+                for backend_pid in sorted(self._backend_pids):
+                    logger.info(f"Cancelling query on backend {backend_pid}.")
+                    signalled |= session.execute(
+                        text('SELECT pg_cancel_backend(:pid)'),
+                        {'pid': backend_pid}
+                    ).scalar()
+                return signalled
+            finally:
+                session.close()
+
+
+@contextmanager
+def query_limits(ro, timeout=None, cancel_handle=None, session=None):
+    """Bound the time spent on the queries run within this context.
+
+    Parameters
+    ----------
+    ro : DatabaseManager
+        The database on whose session the queries are run.
+    timeout : Optional[float]
+        The maximum time, in seconds, each statement may take. This is applied
+        with `SET LOCAL statement_timeout`, so it lasts only as long as the
+        current transaction. If exceeded, a QueryTimeoutError is raised.
+    cancel_handle : Optional[QueryCancelHandle]
+        A handle with which the queries may be cancelled, in which case a
+        QueryCancelledError is raised.
+    session : Optional[sqlalchemy.orm.Session]
+        The session on which the queries are run, if not `ro.session`.
+    """
+    if timeout is None and cancel_handle is None:
+        yield
+        return
+
+    if session is None:
+        session = ro.session
+
+    if timeout is not None:
+        timeout_ms = max(int(timeout * 1000), 1)
+        session.execute(text(f'SET LOCAL statement_timeout = {timeout_ms}'))
+
+    try:
+        backend_pid = None
+        if cancel_handle is not None:
+            backend_pid = cancel_handle.attach(ro, session)
+        try:
+            yield
+        finally:
+            # Forget the backend before anything else is run on it, so that a
+            # late cancellation cannot hit the reset of the timeout.
+            if backend_pid is not None:
+                cancel_handle.detach(backend_pid)
+    except DBAPIError as err:
+        # Ending the transaction also ends the SET LOCAL.
+        session.rollback()
+        if getattr(err.orig, 'pgcode', None) != QUERY_CANCELED_CODE:
+            raise
+        if cancel_handle is not None and cancel_handle.cancelled:
+            raise QueryCancelledError() from err
+        raise QueryTimeoutError(timeout) from err
+    except BaseException:
+        session.rollback()
+        raise
+    else:
+        if timeout is not None:
+            session.execute(text('SET LOCAL statement_timeout TO DEFAULT'))
+
+
+def with_query_limits(get_method):
+    """Decorate a Query method to apply its timeout and cancel_handle."""
+    method_sig = signature(get_method)
+
+    @wraps(get_method)
+    def get_limited(query, *args, **kwargs):
+        bound = method_sig.bind(query, *args, **kwargs)
+        timeout = bound.arguments.get('timeout')
+        cancel_handle = bound.arguments.get('cancel_handle')
+        if timeout is None and cancel_handle is None or query._print_only:
+            return get_method(query, *args, **kwargs)
+
+        # Make sure the limits are applied to the session that will be used.
+        if bound.arguments.get('ro') is None:
+            bound.arguments['ro'] = get_ro('primary')
+        ro = bound.arguments['ro']
+
+        # Queries through the web service are bounded by the service itself.
+        if ro is None:
+            return get_method(*bound.args, **bound.kwargs)
+
+        with query_limits(ro, timeout, cancel_handle):
+            return get_method(*bound.args, **bound.kwargs)
+
+    return get_limited
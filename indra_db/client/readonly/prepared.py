@@ -0,0 +1,272 @@
+__all__ = ['PreparedQueryCache', 'set_prepared_cache', 'get_prepared_cache']
+
+import re
+import logging
+import hashlib
+from threading import Lock
+
+from cachetools import LRUCache
+from sqlalchemy import text
+from sqlalchemy.exc import CompileError
+from sqlalchemy.sql import visitors
+from sqlalchemy.sql.elements import BindParameter, ColumnElement
+from sqlalchemy.sql.selectable import GenerativeSelect
+
+logger = logging.getLogger(__name__)
+
+
+class PreparedQueryCache(object):
+    """A cache of compiled query SQL, run as server-side prepared statements.
+
+    Statements are keyed by the shape of the query they were built from (see
+    `Query._get_shape`) and a fingerprint of the structure of the SQL
+    expression, which leaves out the values of bound parameters. The first
+    statement of each shape is compiled once, and prepared on each readonly
+    connection with `PREPARE`. Later statements of the same shape are not
+    compiled at all: their parameter values are read off the expression and
+    passed to `EXECUTE`, so PostgreSQL may also reuse the plan.
+
+    Note that prepared statements belong to a database session, so they
+    cannot be used through a pooler that shares sessions between clients
+    (e.g. pgbouncer in transaction mode).
+
+    Parameters
+    ----------
+    max_shapes : int
+        The maximum number of compiled statements held. Default is 500.
+    max_params : int
+        Statements with more bound parameters than this, such as queries for
+        long lists of hashes, are executed normally. Default is 100.
+    max_per_connection : int
+        The maximum number of statements prepared on one connection. When it
+        is reached, all the statements on the connection are deallocated.
+        Default is 200.
+    """
+    def __init__(self, max_shapes=500, max_params=100, max_per_connection=200):
+        self.max_params = max_params
+        self.max_per_connection = max_per_connection
+        self.hits = 0
+        self.misses = 0
+        self._statements = LRUCache(maxsize=max_shapes)
+        self._lock = Lock()
+
+    def execute(self, ro, shape, statement):
+        """Execute a statement, using a prepared statement where possible.
+
+        Parameters
+        ----------
+        ro : DatabaseManager
+            The database on whose session the statement is executed.
+        shape : tuple
+            The shape of the query from which the statement was built.
+        statement : sqlalchemy.sql.Select or sqlalchemy.orm.Query
+            The statement to execute.
+
+        Returns
+        -------
+        result : sqlalchemy.engine.ResultProxy
+            The result of the execution.
+        """
+        statement = getattr(statement, 'statement', statement)
+        conn = ro.session.connection()
+        binds, fingerprint = _scan_statement(statement)
+        if len(binds) > self.max_params:
+            return conn.execute(statement)
+
+        key = (shape, fingerprint)
+        with self._lock:
+            prepared = self._statements.get(key)
+        if prepared is None:
+            self.misses += 1
+            prepared = _PreparedStatement.compile(statement, binds,
+                                                  conn.dialect)
+            with self._lock:
+                self._statements[key] = prepared
+        else:
+            self.hits += 1
+
+        # Some statements (e.g. with expanding parameters) cannot be prepared.
+        if not prepared:
+            return conn.execute(statement)
+
+        # Prepare the statement on this connection, if it has not been already.
+        prepared_names = conn.info.setdefault('prepared_statements', set())
+        if prepared.name not in prepared_names:
+            cursor = conn.connection.cursor()
+            try:
+                if len(prepared_names) >= self.max_per_connection:
+                    cursor.execute('DEALLOCATE ALL')
+                    prepared_names.clear()
+                logger.debug(f"Preparing statement {prepared.name}.")
+                cursor.execute(prepared.prepare_sql)
+            finally:
+                cursor.close()
+            prepared_names.add(prepared.name)
+
+        return conn.execute(text(prepared.execute_sql),
+                            prepared.get_params(binds))
+
+    def clear(self):
+        """Forget all the compiled statements.
+
+        Statements already prepared on connections remain until those
+        connections are closed.
+        """
+        with self._lock:
+            self._statements.clear()
+
+
+class _PreparedStatement(object):
+    """The SQL to prepare and execute a statement of a given shape."""
+    def __init__(self, name, prepare_sql, execute_sql, positions, processors):
+        self.name = name
+        self.prepare_sql = prepare_sql
+        self.execute_sql = execute_sql
+        self._positions = positions
+        self._processors = processors
+
+    def __bool__(self):
+        return self.name is not None
+
+    @classmethod
+    def unpreparable(cls):
+        return cls(None, None, None, [], [])
+
+    @classmethod
+    def compile(cls, statement, binds, dialect):
+        """Compile a statement, mapping its parameters to their positions."""
+        compiled = statement.compile(dialect=dialect)
+
+        # Every parameter in the SQL must be one found in the expression, or
+        # the values of later statements could not be found.
+        bind_names = [compiled.bind_names.get(bind) for bind in binds]
+        if None in bind_names \
+                or set(bind_names) != set(compiled.bind_names.values()) \
+                or any(bind.expanding for bind in binds):
+            logger.debug("Statement cannot be prepared.")
+            return cls.unpreparable()
+
+        # Replace the named parameters with numbered ones, in order of
+        # appearance.
+        param_names = []
+
+        def number_param(match):
+            if match.group(1) not in param_names:
+                param_names.append(match.group(1))
+            return f'${param_names.index(match.group(1)) + 1}'
+
+        sql = re.sub(r'%\(([^)]+)\)s', number_param, compiled.string)
+        sql = sql.replace('%%', '%')
+
+        positions = [bind_names.index(name) for name in param_names]
+        processors = []
+        param_types = []
+        for pos in positions:
+            bind_type = binds[pos].type
+            processors.append(bind_type.bind_processor(dialect))
+            try:
+                param_types.append(dialect.type_compiler.process(bind_type))
+            except CompileError:
+                param_types.append('unknown')
+
+        # Names are truncated by PostgreSQL past 63 characters.
+        sql_digest = hashlib.sha256(sql.encode('utf-8')).hexdigest()
+        name = 'indra_db_' + sql_digest[:48]
+        if param_types:
+            prepare_sql = f'PREPARE {name} ({", ".join(param_types)}) AS {sql}'
+            args = ', '.join(f':p{i}' for i in range(len(positions)))
+            execute_sql = f'EXECUTE {name} ({args})'
+        else:
+            prepare_sql = f'PREPARE {name} AS {sql}'
+            execute_sql = f'EXECUTE {name}'
+        return cls(name, prepare_sql, execute_sql, positions, processors)
+
+    def get_params(self, binds):
+        """Get the parameters of EXECUTE from the binds of a statement."""
+        params = {}
+        for i, (pos, processor) in enumerate(zip(self._positions,
+                                                 self._processors)):
+            value = binds[pos].effective_value
+            if processor is not None:
+                value = processor(value)
+            params[f'p{i}'] = value
+        return params
+
+
+# The attributes of SQL expression elements that define their structure.
+_STRUCTURE_ATTRS = ['name', 'operator', 'modifier', 'negate', 'keyword',
+                    'isouter', 'full', 'is_literal', 'text']
+
+
+def _strip_anon_id(name):
+    # Anonymous names include an object id, which differs every time.
+    return re.sub(r'%\(\d+ ', '%(', name)
+
+
+def _get_structure_token(elem):
+    """Get a hashable description of an element, excluding any values."""
+    token = [elem.__class__.__name__]
+    for attr in _STRUCTURE_ATTRS:
+        value = getattr(elem, attr, None)
+        if isinstance(value, str):
+            value = _strip_anon_id(value)
+        elif value is not None and not isinstance(value, bool):
+            value = getattr(value, '__name__', str(value))
+        token.append(value)
+    table_name = getattr(getattr(elem, 'table', None), 'name', None)
+    token.append(_strip_anon_id(table_name) if table_name else table_name)
+    if isinstance(elem, ColumnElement):
+        token.append(repr(elem.type))
+    return tuple(token)
+
+
+def _scan_statement(statement):
+    """Get the binds of a statement, in order, and a fingerprint of its shape.
+
+    Statements with equal fingerprints compile to the same SQL, with their
+    binds in the same positions. The fingerprint is a sha256 digest of the
+    structure, so that distinct shapes do not collide.
+    """
+    binds = []
+    tokens = []
+    for elem in visitors.iterate(statement, {}):
+        if isinstance(elem, BindParameter):
+            binds.append(elem)
+            tokens.append(('bind', repr(elem.type)))
+            continue
+        tokens.append(_get_structure_token(elem))
+
+        # Limits and offsets are not among the children of a select.
+        if isinstance(elem, GenerativeSelect):
+            for clause in [elem._limit_clause, elem._offset_clause]:
+                if isinstance(clause, BindParameter):
+                    binds.append(clause)
+                tokens.append(clause is None)
+            distinct = getattr(elem, '_distinct', False)
+            if isinstance(distinct, (list, tuple)):
+                tokens.append(tuple(str(col) for col in distinct))
+            else:
+                tokens.append(bool(distinct))
+    tokens_str = repr(tuple(tokens))
+    return binds, hashlib.sha256(tokens_str.encode('utf-8')).hexdigest()
+
+
+_prepared_cache = None
+
+
+def set_prepared_cache(cache):
+    """Set the cache of prepared statements used to run Query methods.
+
+    Parameters
+    ----------
+    cache : Optional[PreparedQueryCache]
+        The cache to use. If None, all statements are compiled and sent as
+        plain SQL (the default).
+    """
+    global _prepared_cache
+    _prepared_cache = cache
+
+
+def get_prepared_cache():
+    """Get the cache of prepared statements currently in use, if any."""
+    return _prepared_cache
@@ -3,16 +3,28 @@ __all__ = ['StatementQueryResult', 'Query', 'Intersection', 'Union',
            'HasSources', 'HasOnlySource', 'HasReadings', 'HasDatabases',
            'SourceQuery', 'SourceIntersection', 'HasType', 'IntrusiveQuery',
            'HasNumAgents', 'HasNumEvidence', 'FromPapers', 'EvidenceFilter',
-           'AgentJsonExpander', 'FromAgentJson', 'EmptyQuery']
+           'AgentJsonExpander', 'FromAgentJson', 'EmptyQuery',
+           'EvidenceQueryResult', 'get_evidence']
 
 import json
+import base64
 import logging
 import requests
+import numpy as np
+from functools import reduce
 from itertools import combinations
+from concurrent.futures import ThreadPoolExecutor
 from typing import Union as TypeUnion, Optional, Iterable as TypeIterable
 from collections import OrderedDict, Iterable, defaultdict
 from sqlalchemy import desc, true, select, or_, except_, func, null, and_, \
-    String, union, intersect
+    String, union, intersect, tuple_, cast, literal, any_, bindparam, \
+    BigInteger, Integer, not_, exists, literal_column
+from sqlalchemy.dialects.postgresql import ARRAY, array
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.base import Executable
+from sqlalchemy.sql.elements import UnaryExpression, ClauseElement
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Query as OrmQuery
 
 from indra import get_config
 from indra.statements import stmts_from_json, get_statement_by_name, \
@@ -20,11 +32,42 @@ from indra.statements import stmts_from_json, get_statement_by_name, \
 
 from indra_db.schemas.readonly_schema import ro_role_map, ro_type_map, \
     SOURCE_GROUPS
-from indra_db.util import regularize_agent_id, get_ro
+from indra_db.util import regularize_agent_id, get_ro, loads_json
+from indra_db.exceptions import IndraDbException
+from indra_db.client.readonly.cache import cached_result
+from indra_db.client.readonly.limits import with_query_limits, query_limits
+from indra_db.client.readonly.agent_index import get_agent_index, rank_hashes
+from indra_db.client.readonly.bitmap_index import get_bitmap_index
+from indra_db.client.readonly.prepared import get_prepared_cache
+from indra_db.client.readonly.router import routed
 
 logger = logging.getLogger(__name__)
 
 
+# The number of hashes per evidence lookup, and the maximum number of lookups
+# run in parallel, in the 'two_phase' strategy of get_statements.
+TWO_PHASE_BATCH_SIZE = 100
+TWO_PHASE_MAX_WORKERS = 4
+
+# In the 'auto' strategy of get_hashes, queries estimated to cost less than
+# HASH_STRATEGY_MIN_COST are run as a single statement. Costlier intersections
+# with a limit of at most TOP_K_MAX_LIMIT use the 'top_k' strategy, and other
+# merged queries are fanned out if their components (run FAN_OUT_MAX_WORKERS
+# at a time) are estimated to cost less than FAN_OUT_COST_RATIO times as much.
+HASH_STRATEGY_MIN_COST = 1e5
+TOP_K_MAX_LIMIT = 1000
+FAN_OUT_COST_RATIO = 0.5
+FAN_OUT_MAX_WORKERS = 4
+
+# The minimum number of rows fetched at a time in the 'top_k' strategy.
+TOP_K_MIN_BATCH = 100
+
+# If a bitmap index resolves a query to at most BITMAP_MAX_HASHES statements,
+# only their hashes are sent to the database. Otherwise, get_hashes walks the
+# statements in order, keeping those in the bitmap.
+BITMAP_MAX_HASHES = 10000
+
+
 class QueryResult(object):
     """The generic result of a query.
 
@@ -45,6 +88,9 @@ class QueryResult(object):
         The belief score of each element.
     query_json : dict
         A description of the query that was used.
+    next_cursor : Optional[str]
+        An opaque token marking the position of the last result, which may be
+        passed as the `cursor` of a query to get the next page of results.
 
     Attributes
     ----------
@@ -55,6 +101,8 @@ class QueryResult(object):
         The limit that was applied to this query.
     next_offset : int
         The next offset that would be appropriate if this is a paging query.
+    next_cursor : str
+        The cursor that would get the next page if this is a paging query.
     evidence_counts : dict
         The count of evidence for each element.
     belief_scores : dict
@@ -64,7 +112,7 @@ class QueryResult(object):
     """
     def __init__(self, results: TypeIterable, limit: int, offset: int,
                  offset_comp: int, evidence_counts: dict, belief_scores: dict,
-                 query_json: dict, result_type: str):
+                 query_json: dict, result_type: str, next_cursor: str = None):
         if not isinstance(results, Iterable) or isinstance(results, str):
             raise ValueError("Input `results` is expected to be an iterable, "
                              "and not a string.")
@@ -82,8 +130,10 @@ class QueryResult(object):
         self.offset_comp = offset_comp
         if limit is None or offset_comp < limit:
             self.next_offset = None
+            self.next_cursor = None
         else:
             self.next_offset = (0 if offset is None else offset) + offset_comp
+            self.next_cursor = next_cursor
         self.query_json = query_json
 
     @classmethod
@@ -93,12 +143,15 @@ class QueryResult(object):
     @classmethod
     def from_json(cls, json_dict) \
             -> TypeUnion['QueryResult', 'StatementQueryResult',
-                         'AgentQueryResult']:
-        # Build a StatementQueryResult or AgentQueryResult if appropriate
+                         'AgentQueryResult', 'EvidenceQueryResult']:
+        # Build a StatementQueryResult, AgentQueryResult, or
+        # EvidenceQueryResult if appropriate
         if json_dict['result_type'] == 'statements':
             return StatementQueryResult.from_json(json_dict)
         elif json_dict['result_type'] == 'agents':
             return AgentQueryResult.from_json(json_dict)
+        elif json_dict['result_type'] == 'evidence':
+            return EvidenceQueryResult.from_json(json_dict)
         return cls._parse_json(json_dict)
 
     @classmethod
@@ -106,9 +159,11 @@ class QueryResult(object):
         # Filter out some calculated values.
         next_offset = json_dict.pop('next_offset', None)
         total_evidence = json_dict.pop('total_evidence', None)
+        next_cursor = json_dict.pop('next_cursor', None)
 
         # Build the class
         nc = cls(**json_dict)
+        nc.next_cursor = next_cursor
 
         # Convert result keys into integers, if appropriate
         if isinstance(nc.results, dict):
@@ -139,6 +194,7 @@ class QueryResult(object):
             json_results = self.results
         return {'results': json_results, 'limit': self.limit,
                 'offset': self.offset, 'next_offset': self.next_offset,
+                'next_cursor': self.next_cursor,
                 'query_json': self.query_json,
                 'evidence_counts': self.evidence_counts,
                 'belief_scores': self.belief_scores,
@@ -171,6 +227,12 @@ class StatementQueryResult(QueryResult):
         The counts of evidence from each source for each element.
     query_json : dict
         The JSON representation of the query that was used.
+    next_cursor : Optional[str]
+        An opaque token that may be used as the `cursor` to get the next page.
+    num_ranked : Optional[int]
+        The number of statements ranked for the page, including any that were
+        dropped for lack of evidence after an evidence filter. This decides
+        whether there may be another page. By default, the number of results.
 
     Attributes
     ----------
@@ -184,12 +246,15 @@ class StatementQueryResult(QueryResult):
     """
     def __init__(self, results: dict, limit: int, offset: int,
                  evidence_counts: dict, belief_scores: dict,
-                 returned_evidence: int, source_counts: dict, query_json: dict):
+                 returned_evidence: int, source_counts: dict, query_json: dict,
+                 next_cursor: str = None, num_ranked: int = None):
+        if num_ranked is None:
+            num_ranked = len(results)
         super(StatementQueryResult, self).__init__(results, limit,
-                                                   offset, len(results),
+                                                   offset, num_ranked,
                                                    evidence_counts,
                                                    belief_scores, query_json,
-                                                   'statements')
+                                                   'statements', next_cursor)
         self.returned_evidence = returned_evidence
         self.source_counts = source_counts
 
@@ -208,7 +273,7 @@ class StatementQueryResult(QueryResult):
     def from_json(cls, json_dict):
         json_dict = json_dict.copy()
         result_type = json_dict.pop('result_type')
-        json_dict.pop('offset_comp', None)
+        json_dict['num_ranked'] = json_dict.pop('offset_comp', None)
         if result_type != 'statements':
             raise ValueError(f'Invalid result type {result_type} for this '
                              f'result class {cls}')
@@ -252,12 +317,187 @@ class AgentQueryResult(QueryResult):
         nc.complexes_covered = {int(h) for h in nc.complexes_covered}
 
 
+class EvidenceQueryResult(QueryResult):
+    """The result of a query for a page of the evidence of one statement.
+
+    Parameters
+    ----------
+    results : dict
+        The evidence JSONs, keyed by the IDs of their raw statements, in
+        ascending order of ID.
+    limit : int
+        The limit that was applied to the evidence.
+    mk_hash : int
+        The hash of the statement.
+    evidence_counts : dict
+        The total count of evidence of the statement (before any evidence
+        filter), keyed by its hash.
+    belief_scores : dict
+        The belief score of the statement, keyed by its hash.
+    query_json : dict
+        The JSON representation of the query that was used.
+    next_cursor : Optional[str]
+        An opaque token that may be used as the `cursor` to get the next page
+        of evidence.
+    """
+    def __init__(self, results: dict, limit: int, mk_hash: int,
+                 evidence_counts: dict, belief_scores: dict,
+                 query_json: dict, next_cursor: str = None):
+        super(EvidenceQueryResult, self).__init__(results, limit, None,
+                                                  len(results),
+                                                  evidence_counts,
+                                                  belief_scores, query_json,
+                                                  'evidence', next_cursor)
+        self.mk_hash = mk_hash
+
+    @classmethod
+    def empty(cls, mk_hash: int, limit: int, query_json: dict):
+        return cls({}, limit, mk_hash, {}, {}, query_json)
+
+    def json(self) -> dict:
+        """Get the JSON dump of the results."""
+        json_dict = super(EvidenceQueryResult, self).json()
+        json_dict['mk_hash'] = str(self.mk_hash)
+        return json_dict
+
+    @classmethod
+    def from_json(cls, json_dict):
+        json_dict = json_dict.copy()
+        result_type = json_dict.pop('result_type')
+        json_dict.pop('offset_comp', None)
+        json_dict.pop('offset', None)
+        if result_type != 'evidence':
+            raise ValueError(f'Invalid result type {result_type} for this '
+                             f'result class {cls}')
+        nc = super(EvidenceQueryResult, cls)._parse_json(json_dict)
+        nc.mk_hash = int(nc.mk_hash)
+        nc.results = {int(k): v for k, v in nc.results.items()}
+        nc.evidence_counts = {int(k): v
+                              for k, v in nc.evidence_counts.items()}
+        nc.belief_scores = {int(k): v for k, v in nc.belief_scores.items()}
+        return nc
+
+
 def _make_agent_dict(ag_dict):
     return {n: ag_dict[str(n)]
             for n in range(int(max(ag_dict.keys())) + 1)
             if str(n) in ag_dict}
 
 
+def _encode_cursor(values: list) -> str:
+    """Pack the sort key values of a row into an opaque cursor token."""
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8'))\
+        .decode('ascii')
+
+
+def _decode_cursor(cursor: str, num_values: int) -> list:
+    """Unpack a cursor token into the sort key values it holds."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, UnicodeError):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    if not isinstance(values, list) or len(values) != num_values:
+        raise ValueError(f"Cursor does not match the sort order: {cursor}")
+    return values
+
+
+def _get_order_cols(order_params):
+    """Get the columns and whether they are descending from order params."""
+    order_cols = []
+    for param in order_params:
+        if isinstance(param, UnaryExpression) \
+                and param.modifier is operators.desc_op:
+            order_cols.append((param.element, True))
+        else:
+            order_cols.append((param, False))
+    return order_cols
+
+
+def _seek_past_cursor(query, order_params, cursor=None):
+    """Filter a query to the rows that sort strictly after the cursor.
+
+    The order params must make the order total (e.g. end with mk_hash), so
+    that this keyset "seek" is equivalent to an offset, but does not require
+    the database to generate and discard all the preceding rows.
+    """
+    if cursor is None:
+        return query
+    order_cols = _get_order_cols(order_params)
+    values = [cast(literal(v, col.type), col.type) for v, (col, _)
+              in zip(_decode_cursor(cursor, len(order_cols)), order_cols)]
+
+    # If all the columns are sorted the same way, a row comparison works, and
+    # makes best use of any indices.
+    if all(is_desc for _, is_desc in order_cols):
+        return query.filter(tuple_(*[c for c, _ in order_cols])
+                            < tuple_(*values))
+    elif not any(is_desc for _, is_desc in order_cols):
+        return query.filter(tuple_(*[c for c, _ in order_cols])
+                            > tuple_(*values))
+
+    # Otherwise build up the lexicographic comparison by hand.
+    clauses = []
+    for i, (col, is_desc) in enumerate(order_cols):
+        prev_eqs = [c == v for (c, _), v in zip(order_cols[:i], values[:i])]
+        past = col < values[i] if is_desc else col > values[i]
+        clauses.append(and_(*prev_eqs, past))
+    return query.filter(or_(*clauses))
+
+
+def _make_cursor(order_params, row_dict):
+    """Make a cursor token from the sort key values of a row."""
+    return _encode_cursor([row_dict[col.key] for col, _
+                           in _get_order_cols(order_params)])
+
+
+def _get_relation_keys(activity, is_active):
+    """Get the keys by which the activity and is_active of relations sort.
+
+    Either may be NULL, which never compares as past a cursor, so relations
+    are ordered by these non-NULL stand-ins instead.
+    """
+    return (func.coalesce(activity, '').label('activity_key'),
+            func.coalesce(cast(is_active, Integer), -1).label('is_active_key'))
+
+
+def _get_relation_order(rel_cols, sort_by):
+    """Get a total order of relations, from the columns of a subquery."""
+    sort_col = rel_cols.ev_count if sort_by == 'ev_count' else rel_cols.belief
+    return [desc(sort_col), rel_cols.type_num, rel_cols.agent_json,
+            rel_cols.agent_count, rel_cols.activity_key,
+            rel_cols.is_active_key]
+
+
+class _Explain(Executable, ClauseElement):
+    """A construct to get the plan of a selection from PostgreSQL."""
+    def __init__(self, statement, analyze=False):
+        self.statement = statement
+        self.analyze = analyze
+
+
+@compiles(_Explain, 'postgresql')
+def _compile_explain(element, compiler, **kwargs):
+    options = 'ANALYZE, FORMAT JSON' if element.analyze else 'FORMAT JSON'
+    statement_sql = compiler.process(element.statement, **kwargs)
+    return f"EXPLAIN ({options}) {statement_sql}"
+
+
+def _explain(ro, selectable, analyze=False) -> dict:
+    """Get the estimated (and optionally actual) rows and cost of a query."""
+    if hasattr(selectable, 'statement'):
+        selectable = selectable.statement
+    plan_json = ro.session.execute(_Explain(selectable, analyze)).scalar()
+    if isinstance(plan_json, str):
+        plan_json = json.loads(plan_json)
+    plan = plan_json[0]['Plan']
+    ret = {'rows': plan['Plan Rows'], 'cost': plan['Total Cost'],
+           'plan': plan}
+    if analyze:
+        ret['actual_rows'] = plan['Actual Rows']
+        ret['actual_time'] = plan['Actual Total Time']
+    return ret
+
+
 class ApiError(Exception):
     pass
 
@@ -276,6 +516,7 @@ class AgentJsonSQL:
                                   ro.AgentInteractions.is_active,
                                   ro.AgentInteractions.src_json).distinct()
         self.agg_q = None
+        self._last_row = None
         if not with_complex_dups:
             self.filter(ro.AgentInteractions.is_complex_dup.isnot(True))
         return
@@ -305,6 +546,12 @@ class AgentJsonSQL:
     def run(self):
         raise NotImplementedError
 
+    def get_cursor(self, order_params):
+        """Get the cursor marking the last row returned by `run`."""
+        if self._last_row is None:
+            return None
+        return _make_cursor(order_params, self._last_row._asdict())
+
     def print(self):
         print(self.agg_q)
 
@@ -317,15 +564,18 @@ class InteractionSQL(AgentJsonSQL):
         if sort_by == 'ev_count':
             return [desc(ro.AgentInteractions.ev_count),
                     ro.AgentInteractions.type_num,
-                    ro.AgentInteractions.agent_json]
+                    ro.AgentInteractions.agent_json,
+                    ro.AgentInteractions.mk_hash]
         else:
             return [desc(ro.AgentInteractions.belief),
                     ro.AgentInteractions.type_num,
-                    ro.AgentInteractions.agent_json]
+                    ro.AgentInteractions.agent_json,
+                    ro.AgentInteractions.mk_hash]
 
     def run(self):
         logger.debug(f"Executing query (interaction):\n{self.q}")
         names = self.agg_q.all()
+        self._last_row = names[-1] if names else None
         results = {}
         ev_totals = {}
         bel_maxes = {}
@@ -360,7 +610,8 @@ class RelationSQL(AgentJsonSQL):
             names_sq.c.is_active,
             func.array_agg(names_sq.c.src_json).label('src_jsons'),
             (func.array_agg(names_sq.c.mk_hash) if with_hashes
-             else null()).label('hashes')
+             else null()).label('hashes'),
+            *_get_relation_keys(names_sq.c.activity, names_sq.c.is_active)
         ).group_by(
             names_sq.c.agent_json,
             names_sq.c.type_num,
@@ -374,19 +625,19 @@ class RelationSQL(AgentJsonSQL):
                                       sq.c.agent_count, sq.c.ev_count,
                                       sq.c.belief, sq.c.activity,
                                       sq.c.is_active, sq.c.src_jsons,
-                                      sq.c.hashes)
-        if sort_by == 'ev_count':
-            return [desc(sq.c.ev_count), sq.c.type_num]
-        else:
-            return [desc(sq.c.belief), sq.c.type_num]
+                                      sq.c.hashes, sq.c.activity_key,
+                                      sq.c.is_active_key)
+        return _get_relation_order(sq.c, sort_by)
 
     def run(self):
         logger.debug(f"Executing query (get_relations):\n{self.q}")
         names = self.agg_q.all()
+        self._last_row = names[-1] if names else None
         results = {}
         ev_totals = {}
         bel_maxes = {}
-        for ag_json, type_num, n_ag, n_ev, bel, act, is_act, srcs, hashes in names:
+        for ag_json, type_num, n_ag, n_ev, bel, act, is_act, srcs, hashes, \
+                *_ in names:
             # Build the unique key for this relation.
             ordered_agents = [ag_json.get(str(n))
                               for n in range(max(n_ag, int(max(ag_json))+1))]
@@ -417,6 +668,36 @@ class RelationSQL(AgentJsonSQL):
         return results, ev_totals, bel_maxes, len(names)
 
 
+class RelationAggSQL(RelationSQL):
+    """Get relations from the pre-aggregated relation_aggregates table.
+
+    This may only be used with filters that select whole relations (see
+    `Query._get_aggregate_clause`), so that the totals over all the statements
+    of a relation are the totals over those that match the query.
+    """
+
+    def __init__(self, ro):
+        super(RelationAggSQL, self).__init__(ro)
+        self.q = ro.session.query(ro.RelationAggregates)
+
+    def agg(self, ro, with_hashes=True, sort_by='ev_count'):
+        meta = ro.RelationAggregates
+        sq = self.q.with_entities(
+            meta.agent_json, meta.type_num, meta.agent_count, meta.ev_count,
+            meta.belief, meta.activity, meta.is_active,
+            array([meta.src_json]).label('src_jsons'),
+            (meta.mk_hashes if with_hashes else null()).label('hashes'),
+            *_get_relation_keys(meta.activity, meta.is_active)
+        ).subquery('relations')
+        self.agg_q = ro.session.query(sq.c.agent_json, sq.c.type_num,
+                                      sq.c.agent_count, sq.c.ev_count,
+                                      sq.c.belief, sq.c.activity,
+                                      sq.c.is_active, sq.c.src_jsons,
+                                      sq.c.hashes, sq.c.activity_key,
+                                      sq.c.is_active_key)
+        return _get_relation_order(sq.c, sort_by)
+
+
 class _AgentHashes:
     def __init__(self, hashes):
         complex_num = str(ro_type_map.get_int("Complex"))
@@ -622,6 +903,15 @@ class Query(object):
         """
         return self.__invert__()
 
+    def normalized(self):
+        """Get the canonical form of this query.
+
+        Logically equal queries, however they were written, have the same
+        canonical form: nested merges are flattened, children are sorted and
+        de-duplicated, and constants (full, empty, and EmptyQuery) are folded.
+        """
+        return self.copy()
+
     def set_print_only(self, print_only):
         """Choose to only print the SQL and not execute it.
 
@@ -632,21 +922,89 @@ class Query(object):
     def _rest_get(self, result_type, limit=None, offset=None,
                   sort_by='ev_count', **other_params):
         """Retrieve results from the remote API."""
+        res_json = self._rest_get_json(result_type, limit=limit,
+                                       offset=offset, sort_by=sort_by,
+                                       **other_params)
+        return QueryResult.from_json(res_json)
+
+    def _rest_get_json(self, result_type, **params):
+        """Retrieve the raw JSON response from the remote API."""
         logger.info("Using remote API to resolve query.")
         url = get_config('INDRA_DB_REST_URL', failure_ok=False)
-        params = {'json': json.dumps(self.to_json()), 'limit': limit,
-                  'offset': offset, 'sort_by': sort_by}
-        params.update(other_params)
+        params['json'] = json.dumps(self.to_json())
         resp = requests.get(f'{url}/query/{result_type}',
                             params=params)
         if resp.status_code != 200:
             raise ApiError(f"REST API failed with ({resp.status_code}): "
                            f"{resp.json()}")
+        return resp.json()
+
+    @routed
+    @cached_result
+    @with_query_limits
+    def count(self, ro=None, exact=True, timeout=None,
+              cancel_handle=None) -> int:
+        """Count the statements that satisfy this query.
+
+        Parameters
+        ----------
+        ro : DatabaseManager
+            A database manager handle that has valid Readonly tables built.
+        exact : bool
+            If True (default), count the distinct hashes in the database. If
+            False, return the number of rows the PostgreSQL planner estimates
+            the hash query will produce, which is fast but may be far off.
+        timeout : Optional[float]
+            The maximum time, in seconds, the database may spend on the query.
+            If exceeded, a QueryTimeoutError is raised.
+        cancel_handle : Optional[QueryCancelHandle]
+            A handle with which the query may be cancelled from another thread,
+            in which case a QueryCancelledError is raised.
+
+        Returns
+        -------
+        count : int
+            The number of statements, exact or estimated.
+        """
+        if ro is None:
+            ro = get_ro('primary')
+
+        if self.empty:
+            return 0
+
+        if ro is None:
+            return self._rest_get_json('count', exact=exact)['count']
+
+        # If a bitmap index can resolve the query, the count is its size.
+        bitmap_index = get_bitmap_index(ro)
+        if bitmap_index is not None and not self._print_only:
+            bitmap = self.normalized()._get_bitmap(bitmap_index)
+            if bitmap is not None:
+                return len(bitmap)
+
+        mk_hashes_q = self.normalized().build_hash_query(ro)
+        if not exact:
+            return int(_explain(ro, mk_hashes_q.distinct())['rows'])
+
+        mk_hashes_sq = mk_hashes_q.subquery('mk_hashes')
+        count_q = ro.session.query(
+            func.count(mk_hashes_sq.c.mk_hash.distinct())
+        )
+        if self._print_only:
+            print(count_q)
+            return
 
-        return QueryResult.from_json(resp.json())
+        logger.debug(f"Executing query (count):\n{count_q}")
+        return self._fetch_all(ro, count_q)[0][0]
 
+    @routed
+    @cached_result
+    @with_query_limits
     def get_statements(self, ro=None, limit=None, offset=None,
-                       sort_by='ev_count', ev_limit=None, evidence_filter=None) \
+                       sort_by='ev_count', ev_limit=None, evidence_filter=None,
+                       cursor=None, strategy='joined',
+                       evidence_filter_mode='post', timeout=None,
+                       cancel_handle=None) \
             -> Optional[StatementQueryResult]:
         """Get the statements that satisfy this query.
 
@@ -669,6 +1027,27 @@ class Query(object):
         evidence_filter : None or EvidenceFilter
             If None, no filtering will be applied. Otherwise, an EvidenceFilter
             class must be provided.
+        cursor : Optional[str]
+            The `next_cursor` of a previous result with the same query and
+            sort_by. Results will start immediately after the last result of
+            that page, which is much faster than a large offset for deep pages.
+        strategy : str
+            How the statements are retrieved. With 'joined' (the default), the
+            ranked hashes are joined with the evidence in a single query. With
+            'two_phase', the ranked hashes are retrieved first, and then their
+            evidence is retrieved in batches, in parallel.
+        evidence_filter_mode : str
+            How the evidence_filter is applied. With 'post' (the default), the
+            filter is applied to the evidence of the ranked statements, and any
+            statement left without evidence is dropped, so pages may come back
+            short. With 'pushdown', statements without any evidence passing the
+            filter are excluded before ranking, so pages are full.
+        timeout : Optional[float]
+            The maximum time, in seconds, the database may spend on the query.
+            If exceeded, a QueryTimeoutError is raised.
+        cancel_handle : Optional[QueryCancelHandle]
+            A handle with which the query may be cancelled from another thread,
+            in which case a QueryCancelledError is raised.
 
         Returns
         -------
@@ -676,6 +1055,10 @@ class Query(object):
             An object holding the JSON result from the database, as well as the
             metadata for the query.
         """
+        if strategy not in {'joined', 'two_phase'}:
+            raise ValueError(f"Invalid strategy: {strategy}.")
+        pushdown = _check_ev_filter_mode(evidence_filter_mode)
+
         if ro is None:
             ro = get_ro('primary')
 
@@ -690,162 +1073,253 @@ class Query(object):
                                "of evidence filter through API not yet "
                                "implemented.")
             return self._rest_get('statements', limit, offset, sort_by,
-                                  ev_limit=ev_limit)
+                                  ev_limit=ev_limit, cursor=cursor)
+
+        if strategy == 'two_phase':
+            return self._get_statements_two_phase(ro, limit, offset, sort_by,
+                                                  ev_limit, evidence_filter,
+                                                  cursor, pushdown, timeout,
+                                                  cancel_handle)
+
+        selection, sort_term, ref_link_keys = \
+            self._get_statement_selection(ro, sort_by, limit, offset, cursor,
+                                          ev_limit, evidence_filter,
+                                          ev_filter_pushdown=pushdown)
+        if self._print_only:
+            print(selection)
+            return
 
-        # Get the query for mk_hashes and ev_counts, and apply the generic
-        # limits to it.
-        mk_hashes_q = self.build_hash_query(ro)
-        mk_hashes_q = mk_hashes_q.distinct()
-        mk_hash_obj, ev_count_obj, belief_obj = self._get_core_cols(ro)
-        if sort_by == 'ev_count':
-            sort_term = [desc(ev_count_obj)]
-        elif sort_by == 'belief':
-            sort_term = [desc(belief_obj)]
+        logger.debug(f"Executing query (get_statements):\n{selection}")
+
+        # Execute the query.
+        res = self._fetch_all(ro, selection)
+        if res:
+            logger.debug("res is %d row by %d cols." % (len(res), len(res[0])))
         else:
-            raise ValueError(f"Invalid sort option: {sort_by}.")
-        mk_hashes_q = self._apply_limits(mk_hashes_q, sort_term, limit, offset)
+            logger.debug("res is empty.")
 
-        # Do the difficult work of turning a query for hashes and ev_counts
-        # into a query for statement JSONs. Return the results.
-        mk_hashes_al = mk_hashes_q.subquery('mk_hashes')
-        cont_q = self._get_content_query(ro, mk_hashes_al, ev_limit)
-        if evidence_filter is not None:
-            cont_q = evidence_filter.join_table(ro, cont_q,
-                                                {'fast_raw_pa_link'})
-            cont_q = evidence_filter.apply_filter(ro, cont_q)
+        return self._make_statement_result(ro, res, limit, offset, sort_by,
+                                           sort_term, ev_limit, ref_link_keys)
 
-        # If there is no evidence, whittle down the results so we only get one
-        # pa_json for each hash.
-        if ev_limit == 0:
-            cont_q = cont_q.distinct()
+    @routed
+    def iter_statements(self, ro=None, batch_size=1000, limit=None,
+                        offset=None, sort_by='ev_count', ev_limit=None,
+                        evidence_filter=None, cursor=None,
+                        evidence_filter_mode='post'):
+        """Iterate over the JSONs of the statements that satisfy this query.
 
-        # If we have a limit on the evidence, we need to do a lateral join.
-        # If we are just getting all the evidence, or none of it, just put an
-        # alias on the subquery.
-        if ev_limit is not None and ev_limit != 0:
-            cont_q = cont_q.limit(ev_limit)
-            json_content_al = cont_q.subquery().lateral('json_content')
-            stmts_q = (mk_hashes_al
-                       .outerjoin(json_content_al, true())
-                       .outerjoin(ro.SourceMeta,
-                               ro.SourceMeta.mk_hash == mk_hashes_al.c.mk_hash))
-            cols = [mk_hashes_al.c.mk_hash, ro.SourceMeta.src_json,
-                    mk_hashes_al.c.ev_count, mk_hashes_al.c.belief,
-                    json_content_al.c.raw_json, json_content_al.c.pa_json]
-        else:
-            json_content_al = cont_q.subquery().alias('json_content')
-            stmts_q = (json_content_al
-                       .outerjoin(ro.SourceMeta,
-                            ro.SourceMeta.mk_hash == json_content_al.c.mk_hash))
-            cols = [json_content_al.c.mk_hash, ro.SourceMeta.src_json,
-                    json_content_al.c.ev_count, json_content_al.c.belief,
-                    json_content_al.c.raw_json, json_content_al.c.pa_json]
+        Unlike `get_statements`, the results are streamed from the database
+        using a server-side cursor, and each statement is yielded as soon as
+        all its evidence has been read, so memory use is bounded by the
+        batch size rather than the size of the result.
 
-        # Join up with other tables to pull metadata.
-        stmts_q = (stmts_q
-                   .outerjoin(ro.ReadingRefLink,
-                              ro.ReadingRefLink.rid == json_content_al.c.rid))
+        Parameters
+        ----------
+        ro : DatabaseManager
+            A database manager handle that has valid Readonly tables built.
+        batch_size : int
+            The number of rows (roughly, evidence) fetched from the database at
+            a time. Default is 1000.
+        limit : int
+            Control the maximum number of statements returned.
+        offset : int
+            Get results starting from the value of offset.
+        sort_by : str
+            Options are currently 'ev_count' or 'belief'. Results will be
+            yielded in order of the given parameter.
+        ev_limit : int
+            Limit the number of evidence returned for each statement.
+        evidence_filter : None or EvidenceFilter
+            If None, no filtering will be applied. Otherwise, an EvidenceFilter
+            class must be provided.
+        cursor : Optional[str]
+            The `next_cursor` of a previous result with the same query and
+            sort_by, from which to continue.
+        evidence_filter_mode : str
+            'post' (default) or 'pushdown', as for `get_statements`.
+
+        Yields
+        ------
+        stmt_json : dict
+            The JSON of a statement, including its evidence.
+        """
+        pushdown = _check_ev_filter_mode(evidence_filter_mode)
+        if ro is None:
+            ro = get_ro('primary')
 
-        ref_link_keys = [k for k in ro.ReadingRefLink.__dict__.keys()
-                         if not k.startswith('_')]
+        if self.empty:
+            return
 
-        cols += [getattr(ro.ReadingRefLink, k) for k in ref_link_keys]
+        # Without direct access to the database, page through the web service.
+        if ro is None:
+            if offset:
+                raise ValueError("Offset is not supported when iterating "
+                                 "through the web service; use a cursor.")
+            while limit is None or limit > 0:
+                page_size = batch_size if limit is None \
+                    else min(batch_size, limit)
+                res = self.get_statements(
+                    ro, page_size, None, sort_by, ev_limit, evidence_filter,
+                    cursor, evidence_filter_mode=evidence_filter_mode
+                )
+                yield from res.results.values()
+                if res.next_cursor is None or len(res.results) < page_size:
+                    return
+                cursor = res.next_cursor
+                if limit is not None:
+                    limit -= len(res.results)
+            return
 
-        # Put it all together.
-        selection = select(cols).select_from(stmts_q)
+        selection, _, ref_link_keys = \
+            self._get_statement_selection(ro, sort_by, limit, offset, cursor,
+                                          ev_limit, evidence_filter,
+                                          ordered=True,
+                                          ev_filter_pushdown=pushdown)
         if self._print_only:
             print(selection)
             return
 
-        logger.debug(f"Executing query (get_statements):\n{selection}")
+        logger.debug(f"Executing query (iter_statements):\n{selection}")
 
-        # Execute the query.
-        proxy = ro.session.connection().execute(selection)
-        res = proxy.fetchall()
-        if res:
-            logger.debug("res is %d row by %d cols." % (len(res), len(res[0])))
-        else:
-            logger.debug("res is empty.")
+        # Using stream_results makes psycopg2 use a named (server-side) cursor,
+        # so rows are only transferred as they are fetched.
+        conn = ro.session.connection().execution_options(stream_results=True)
+        proxy = conn.execute(selection)
+        stmt_json = None
+        try:
+            while True:
+                rows = proxy.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    mk_hash, _, _, _, raw_json_bts, pa_json_bts = row[:6]
+                    ref_dict = dict(zip(ref_link_keys, row[6:]))
+                    if pa_json_bts is None:
+                        logger.warning(f"Row for {mk_hash} returned without "
+                                       f"pa_json, likely due to an evidence "
+                                       f"filter. Dropping the statement.")
+                        continue
 
-        # Unpack the statements.
-        stmts_dict = OrderedDict()
-        ev_counts = OrderedDict()
-        beliefs = OrderedDict()
-        source_counts = OrderedDict()
-        returned_evidence = 0
-        src_set = ro.get_source_names()
-        for row in res:
-            # Unpack the row
-            row_gen = iter(row)
+                    # Rows are grouped by hash, so a new hash means that the
+                    # previous statement is complete.
+                    if stmt_json is None or mk_hash != stmt_hash:
+                        if stmt_json is not None:
+                            yield stmt_json
+                        stmt_hash = mk_hash
+                        stmt_json = loads_json(pa_json_bts)
+                        stmt_json['evidence'] = []
+
+                    if ev_limit != 0:
+                        stmt_json['evidence'].append(
+                            _get_evidence_json(raw_json_bts, ref_dict)
+                        )
+            if stmt_json is not None:
+                yield stmt_json
+        finally:
+            proxy.close()
 
-            mk_hash = next(row_gen)
-            src_dict = dict.fromkeys(src_set, 0)
-            src_dict.update(next(row_gen))
-            ev_count = next(row_gen)
-            belief = next(row_gen)
-            raw_json_bts = next(row_gen)
-            pa_json_bts = next(row_gen)
-            ref_dict = dict(zip(ref_link_keys, row_gen))
+    async def aget_statements(self, ro_async, limit=None, offset=None,
+                              sort_by='ev_count', ev_limit=None,
+                              evidence_filter=None, cursor=None,
+                              evidence_filter_mode='post') \
+            -> StatementQueryResult:
+        """Get the statements that satisfy this query, asynchronously.
 
-            if pa_json_bts is None:
-                logger.warning("Row returned without pa_json. This likely "
-                               "indicates that an over-zealous evidence filter "
-                               "was used, which filtered out all evidence. "
-                               "This case is not currently handled, and the "
-                               "statement will have to be dropped.")
-                continue
+        The SQL is the same as that used by `get_statements`, but it is run on
+        an asynchronous connection pool, so many queries may be awaited
+        concurrently, e.g. using `asyncio.gather`.
 
-            if raw_json_bts is not None:
-                returned_evidence += 1
+        Parameters
+        ----------
+        ro_async : AsyncReadonlyDatabase
+            A handle on the asynchronous connection pool to the readonly
+            database.
+        limit : int
+            Control the maximum number of results returned.
+        offset : int
+            Get results starting from the value of offset.
+        sort_by : str
+            Options are currently 'ev_count' or 'belief'.
+        ev_limit : int
+            Limit the number of evidence returned for each statement.
+        evidence_filter : None or EvidenceFilter
+            If None, no filtering will be applied. Otherwise, an EvidenceFilter
+            class must be provided.
+        cursor : Optional[str]
+            The `next_cursor` of a previous result with the same query and
+            sort_by, from which to continue paging.
+        evidence_filter_mode : str
+            'post' (default) or 'pushdown', as for `get_statements`.
 
-            # Add a new statement if the hash is new.
-            if mk_hash not in stmts_dict.keys():
-                source_counts[mk_hash] = src_dict
-                ev_counts[mk_hash] = ev_count
-                beliefs[mk_hash] = belief
-                stmts_dict[mk_hash] = json.loads(pa_json_bts.decode('utf-8'))
-                stmts_dict[mk_hash]['evidence'] = []
+        Returns
+        -------
+        result : StatementQueryResult
+            An object holding the JSON result from the database, as well as the
+            metadata for the query.
+        """
+        pushdown = _check_ev_filter_mode(evidence_filter_mode)
+        if self.empty:
+            return StatementQueryResult.empty(limit, offset, self.to_json())
 
-            # Add annotations if not present.
-            if ev_limit != 0:
-                raw_json = json.loads(raw_json_bts.decode('utf-8'))
-                ev_json = raw_json['evidence'][0]
-                if 'annotations' not in ev_json.keys():
-                    ev_json['annotations'] = {}
-
-                # Add agents' raw text to annotations.
-                ev_json['annotations']['agents'] = \
-                    {'raw_text': _get_raw_texts(raw_json)}
-
-                # Add prior UUIDs to the annotations
-                if 'prior_uuids' not in ev_json['annotations'].keys():
-                    ev_json['annotations']['prior_uuids'] = []
-                ev_json['annotations']['prior_uuids'].append(raw_json['id'])
-
-                # Add and/or update text refs.
-                if 'text_refs' not in ev_json.keys():
-                    ev_json['text_refs'] = {}
-                if ref_dict['pmid']:
-                    ev_json['pmid'] = ref_dict['pmid']
-                elif 'PMID' in ev_json['text_refs']:
-                    del ev_json['text_refs']['PMID']
-                ev_json['text_refs'].update({k.upper(): v
-                                             for k, v in ref_dict.items()
-                                             if v is not None})
-
-                # Add the source dictionary.
-                if ref_dict['source']:
-                    ev_json['annotations']['content_source'] = ref_dict['source']
-
-                # Add the evidence JSON to the list.
-                stmts_dict[mk_hash]['evidence'].append(ev_json)
+        # Opening the pool loads the source names, so that getting them does
+        # not block the event loop.
+        await ro_async.open()
+        ro = ro_async.ro
+        selection, sort_term, ref_link_keys = \
+            self._get_statement_selection(ro, sort_by, limit, offset, cursor,
+                                          ev_limit, evidence_filter,
+                                          ev_filter_pushdown=pushdown)
+        logger.debug(f"Executing query (aget_statements):\n{selection}")
+        rows = await ro_async.fetch(selection)
+        return self._make_statement_result(ro, rows, limit, offset, sort_by,
+                                           sort_term, ev_limit, ref_link_keys,
+                                           ro_async.source_names)
+
+    async def aget_hashes(self, ro_async, limit=None, offset=None,
+                          sort_by='ev_count', cursor=None) -> QueryResult:
+        """Get the hashes of statements that satisfy this query, asynchronously.
 
-        return StatementQueryResult(stmts_dict, limit, offset, ev_counts,
-                                    beliefs, returned_evidence, source_counts,
-                                    self.to_json())
+        Parameters
+        ----------
+        ro_async : AsyncReadonlyDatabase
+            A handle on the asynchronous connection pool to the readonly
+            database.
+        limit : int
+            Control the maximum number of results returned.
+        offset : int
+            Get results starting from the value of offset.
+        sort_by : str
+            'ev_count' or 'belief': select the parameter by which results are
+            sorted.
+        cursor : Optional[str]
+            The `next_cursor` of a previous result with the same query and
+            sort_by, from which to continue paging.
 
-    def get_hashes(self, ro=None, limit=None, offset=None, sort_by='ev_count') \
-            -> Optional[QueryResult]:
+        Returns
+        -------
+        result : QueryResult
+            An object holding the results of the query, as well as the metadata
+            for the query definition.
+        """
+        if self.empty:
+            return QueryResult.empty(set(), limit, offset, self.to_json(),
+                                     'hashes')
+
+        if sort_by != 'ev_count':
+            sort_by = 'belief'
+        mk_hashes_q, sort_list = \
+            self._get_ranked_hash_query(ro_async.ro, sort_by, limit, offset,
+                                        cursor)
+        logger.debug(f"Executing query (aget_hashes):\n{mk_hashes_q}")
+        rows = await ro_async.fetch(mk_hashes_q)
+        return self._make_hash_result(rows, limit, offset, sort_list)
+
+    @routed
+    @cached_result
+    @with_query_limits
+    def get_hashes(self, ro=None, limit=None, offset=None, sort_by='ev_count',
+                   cursor=None, strategy='single', timeout=None,
+                   cancel_handle=None) -> Optional[QueryResult]:
         """Get the hashes of statements that satisfy this query.
 
         Parameters
@@ -862,6 +1336,29 @@ class Query(object):
         sort_by : str
             'ev_count' or 'belief': select the parameter by which results are
             sorted.
+        cursor : Optional[str]
+            The `next_cursor` of a previous result with the same query and
+            sort_by, from which to continue paging.
+        strategy : str
+            How merged queries (Intersections and Unions) are run. With
+            'single' (the default), the whole query is run as one SQL
+            statement. With
+            'fan_out', the hashes of each component are retrieved in
+            parallel, on separate connections, and combined and ranked here.
+            With 'top_k' (Intersections with a limit only), the hashes of the
+            most selective component are walked in sorted order, checking the
+            other components for each, until `limit` matches are found. With
+            'auto', the strategy is chosen from PostgreSQL's cost estimates,
+            which are only made if some part of the query can be found from an
+            index, at the cost of a round trip for each estimate; a bitmap
+            index is also used to walk the statements, if it applies. Where a
+            strategy does not apply to the query, 'single' is used.
+        timeout : Optional[float]
+            The maximum time, in seconds, the database may spend on the query.
+            If exceeded, a QueryTimeoutError is raised.
+        cancel_handle : Optional[QueryCancelHandle]
+            A handle with which the query may be cancelled from another thread,
+            in which case a QueryCancelledError is raised.
 
         Returns
         -------
@@ -869,6 +1366,9 @@ class Query(object):
             An object holding the results of the query, as well as the metadata
             for the query definition.
         """
+        if strategy not in {'auto', 'single', 'fan_out', 'top_k'}:
+            raise ValueError(f"Invalid strategy: {strategy}.")
+
         if ro is None:
             ro = get_ro('primary')
 
@@ -877,20 +1377,61 @@ class Query(object):
             return QueryResult.empty(set(), limit, offset, self.to_json(),
                                      'hashes')
 
+        if sort_by != 'ev_count':
+            sort_by = 'belief'
+
         # If the database isn't directly available, route through the web API.
         if ro is None:
-            return self._rest_get('hashes', limit, offset, sort_by)
+            return self._rest_get('hashes', limit, offset, sort_by,
+                                  cursor=cursor)
+
+        # If an agent index of the installed dump is loaded, and can answer
+        # the query, skip the database entirely.
+        agent_index = get_agent_index(ro)
+        if agent_index is not None and not self._print_only:
+            result = self._get_indexed_hash_result(agent_index, limit, offset,
+                                                   sort_by, cursor)
+            if result is not None:
+                return result
+
+        # If a bitmap index can resolve the query, only the statements it
+        # leaves are ranked, if they are few. Otherwise they are found by
+        # walking all the statements in order.
+        bitmap_index = get_bitmap_index(ro)
+        if strategy == 'auto' and bitmap_index is not None \
+                and not self._print_only:
+            bitmap = self.normalized()._get_bitmap(bitmap_index)
+            if bitmap is not None:
+                if len(bitmap) <= BITMAP_MAX_HASHES:
+                    strategy = 'single'
+                elif limit is not None:
+                    return self._get_bitmap_walk_result(ro, bitmap_index,
+                                                        bitmap, limit, offset,
+                                                        sort_by, cursor)
+
+        # Merged queries may be run in parts, if so chosen.
+        if self._print_only:
+            strategy = 'single'
+        elif strategy == 'auto':
+            strategy = self._choose_hash_strategy(ro, limit, offset, sort_by,
+                                                  cursor)
+        if strategy == 'fan_out':
+            fan_out_queries = self.normalized()._get_fan_out_queries()
+            if fan_out_queries is not None:
+                return self._get_fan_out_hash_result(ro, fan_out_queries,
+                                                     limit, offset, sort_by,
+                                                     cursor, timeout,
+                                                     cancel_handle)
+        elif strategy == 'top_k' and limit is not None:
+            drivers = self.normalized()._get_top_k_drivers()
+            if drivers:
+                return self._get_top_k_hash_result(ro, drivers, limit, offset,
+                                                   sort_by, cursor)
 
         # Get the query for mk_hashes and ev_counts, and apply the generic
         # limits to it.
-        mk_hashes_q = self.build_hash_query(ro)
-        mk_hashes_q = mk_hashes_q.distinct()
-        _, n_ev_obj, belief_obj = self._get_core_cols(ro)
-        if sort_by == 'ev_count':
-            sort_list = [desc(n_ev_obj)]
-        else:
-            sort_list = [desc(belief_obj)]
-        mk_hashes_q = self._apply_limits(mk_hashes_q, sort_list, limit, offset)
+        mk_hashes_q, sort_list = \
+            self._get_ranked_hash_query(ro, sort_by, limit, offset, cursor)
 
         if self._print_only:
             print(mk_hashes_q)
@@ -898,20 +1439,16 @@ class Query(object):
 
         # Make the query, and package the results.
         logger.debug(f"Executing query (get_hashes):\n{mk_hashes_q}")
-        result = mk_hashes_q.all()
-        evidence_counts = {}
-        belief_scores = {}
-        hashes = set()
-        for h, n_ev, belief in result:
-            hashes.add(h)
-            evidence_counts[h] = n_ev
-            belief_scores[h] = belief
-
-        return QueryResult(hashes, limit, offset, len(result), evidence_counts,
-                           belief_scores, self.to_json(), 'hashes')
+        result = self._fetch_all(ro, mk_hashes_q)
+        return self._make_hash_result(result, limit, offset, sort_list)
 
+    @routed
+    @cached_result
+    @with_query_limits
     def get_interactions(self, ro=None, limit=None, offset=None,
-                         sort_by='ev_count') -> Optional[QueryResult]:
+                         sort_by='ev_count', cursor=None, timeout=None,
+                         cancel_handle=None) \
+            -> Optional[QueryResult]:
         """Get the simple interaction information from the Statements metadata.
 
        Each entry in the result corresponds to a single preassembled Statement,
@@ -931,6 +1468,15 @@ class Query(object):
         sort_by : str
             Options are currently 'ev_count' or 'belief'. Results will return in
             order of the given parameter.
+        cursor : Optional[str]
+            The `next_cursor` of a previous result with the same query and
+            sort_by, from which to continue paging.
+        timeout : Optional[float]
+            The maximum time, in seconds, the database may spend on the query.
+            If exceeded, a QueryTimeoutError is raised.
+        cancel_handle : Optional[QueryCancelHandle]
+            A handle with which the query may be cancelled from another thread,
+            in which case a QueryCancelledError is raised.
         """
         if ro is None:
             ro = get_ro('primary')
@@ -942,128 +1488,902 @@ class Query(object):
             return QueryResult.empty({}, limit, offset, self.to_json(),
                                      'interactions')
 
-        if ro is None:
-            return self._rest_get('interactions', limit, offset, sort_by)
+        if ro is None:
+            return self._rest_get('interactions', limit, offset, sort_by,
+                                  cursor=cursor)
+
+        il = InteractionSQL(ro)
+        result_tuple = self._run_meta_sql(il, ro, limit, offset, sort_by,
+                                          cursor=cursor)
+        if result_tuple is None:
+            return
+        results, ev_counts, belief_scores, off_comp, next_cursor = result_tuple
+        return QueryResult(results, limit, offset, off_comp, ev_counts,
+                           belief_scores, self.to_json(), il.meta_type,
+                           next_cursor)
+
+    @routed
+    @cached_result
+    @with_query_limits
+    def get_relations(self, ro=None, limit=None, offset=None,
+                      sort_by='ev_count', with_hashes=False, cursor=None,
+                      timeout=None, cancel_handle=None) \
+            -> Optional[QueryResult]:
+        """Get the agent and type information from the Statements metadata.
+
+         Each entry in the result corresponds to a relation, meaning an
+         interaction type, and the names of the agents involved.
+
+        Parameters
+        ----------
+        ro : DatabaseManager
+            A database manager handle that has valid Readonly tables built.
+        limit : int
+            Control the maximum number of results returned. As a rule, unless
+            you are quite sure the query will result in a small number of
+            matches, you should limit the query.
+        offset : int
+            Get results starting from the value of offset. This along with limit
+            allows you to page through results.
+        sort_by : str
+            Options are currently 'ev_count' or 'belief'. Results will return in
+            order of the given parameter.
+        with_hashes : bool
+            Default is False. If True, retrieve all the hashes that fit within
+            each relational grouping.
+        cursor : Optional[str]
+            The `next_cursor` of a previous result with the same query and
+            sort_by, from which to continue paging.
+        timeout : Optional[float]
+            The maximum time, in seconds, the database may spend on the query.
+            If exceeded, a QueryTimeoutError is raised.
+        cancel_handle : Optional[QueryCancelHandle]
+            A handle with which the query may be cancelled from another thread,
+            in which case a QueryCancelledError is raised.
+        """
+        if ro is None:
+            ro = get_ro('primary')
+
+        if self.empty:
+            return QueryResult.empty({}, limit, offset, self.to_json(),
+                                     'relations')
+
+        if ro is None:
+            return self._rest_get('relations', limit, offset, sort_by,
+                                  with_hashes=with_hashes, cursor=cursor)
+
+        # If the query selects whole relations, use the pre-computed
+        # aggregates, rather than grouping the matching statements. Older
+        # dumps do not have the aggregates.
+        agg_clause = None
+        if ro.has_table(ro.RelationAggregates.__tablename__):
+            agg_clause = self._get_aggregate_filter(ro.RelationAggregates)
+        if agg_clause is not None:
+            r_sql = RelationAggSQL(ro)
+        else:
+            r_sql = RelationSQL(ro)
+        result_tuple = self._run_meta_sql(r_sql, ro, limit, offset, sort_by,
+                                          with_hashes, cursor, agg_clause)
+        if result_tuple is None:
+            return None
+
+        results, ev_counts, belief_scores, off_comp, next_cursor = result_tuple
+        return QueryResult(results, limit, offset, off_comp, ev_counts,
+                           belief_scores, self.to_json(), r_sql.meta_type,
+                           next_cursor)
+
+    @routed
+    @cached_result
+    @with_query_limits
+    def get_agents(self, ro=None, limit=None, offset=None, sort_by='ev_count',
+                   with_hashes=False, complexes_covered=None, timeout=None,
+                   cancel_handle=None) \
+            -> Optional[QueryResult]:
+        """Get the agent pairs from the Statements metadata.
+
+         Each entry is simply a pair (or more) of Agents involved in an
+         interaction.
+
+        Parameters
+        ----------
+        ro : Optional[DatabaseManager]
+            A database manager handle that has valid Readonly tables built.
+        limit : Optional[int]
+            Control the maximum number of results returned. As a rule, unless
+            you are quite sure the query will result in a small number of
+            matches, you should limit the query.
+        offset : Optional[int]
+            Get results starting from the value of offset. This along with limit
+            allows you to page through results.
+        sort_by : str
+            Options are currently 'ev_count' or 'belief'. Results will return in
+            order of the given parameter.
+        with_hashes : bool
+            Default is False. If True, retrieve all the hashes that fit within
+            each agent pair grouping.
+        complexes_covered : Optional[set]
+            The set of hashes for complexes that you have already seen and would
+            like skipped.
+        timeout : Optional[float]
+            The maximum time, in seconds, the database may spend on the query.
+            If exceeded, a QueryTimeoutError is raised.
+        cancel_handle : Optional[QueryCancelHandle]
+            A handle with which the query may be cancelled from another thread,
+            in which case a QueryCancelledError is raised.
+        """
+        if ro is None:
+            ro = get_ro('primary')
+
+        if self.empty:
+            return AgentQueryResult.empty(limit, offset, self.to_json())
+
+        if ro is None:
+            return self._rest_get('agents', limit, offset, sort_by,
+                                  with_hashes=with_hashes,
+                                  complexes_covered=complexes_covered)
+
+        ag_sql = AgentSQL(ro, with_complex_dups=True,
+                          complexes_covered=complexes_covered)
+        result_tuple = self._run_meta_sql(ag_sql, ro, limit, offset, sort_by,
+                                          with_hashes)
+        if result_tuple is None:
+            return
+
+        results, ev_counts, belief_scores, off_comp, _ = result_tuple
+        return AgentQueryResult(results, limit, offset, off_comp,
+                                ag_sql.complexes_covered, ev_counts,
+                                belief_scores, self.to_json())
+
+    def _run_meta_sql(self, ms, ro, limit, offset, sort_by, with_hashes=None,
+                      cursor=None, agg_clause=None):
+        if agg_clause is None:
+            mk_hashes_sq = self.normalized().build_hash_query(ro)\
+                .subquery('mk_hashes')
+            ms.filter(_get_stmt_key(ro, ro.AgentInteractions)
+                      == mk_hashes_sq.c.stmt_id)
+        else:
+            ms.filter(agg_clause)
+        kwargs = {'sort_by': sort_by}
+        if with_hashes is not None:
+            kwargs['with_hashes'] = with_hashes
+        order_params = ms.agg(ro, **kwargs)
+        ms = _seek_past_cursor(ms, order_params, cursor)
+        ms = self._apply_limits(ms, order_params, limit, offset)
+        if self._print_only:
+            ms.print()
+            return
+        return ms.run() + (ms.get_cursor(order_params),)
+
+    @routed
+    def explain(self, ro=None, analyze=False, sort_by='ev_count',
+                limit=None, ev_limit=None) -> dict:
+        """Get the plan PostgreSQL would use for this query, with its cost.
+
+        Parameters
+        ----------
+        ro : DatabaseManager
+            A database manager handle that has valid Readonly tables built.
+        analyze : bool
+            If True, the queries are actually run, and the actual rows and time
+            (in ms) are included as well as the estimates. Default is False.
+        sort_by : str
+            'ev_count' or 'belief', as would be passed to `get_statements`.
+        limit : int
+            The limit that would be passed to `get_statements`.
+        ev_limit : int
+            The ev_limit that would be passed to `get_statements`.
+
+        Returns
+        -------
+        plan_info : dict
+            The estimated rows and cost, and the full plan, of the 'hash_query'
+            (as used by `get_hashes`) and of the 'content_query' (as used by
+            `get_statements`). For merged queries, the hash queries of each of
+            the component queries are listed under 'components'.
+        """
+        if ro is None:
+            ro = get_ro('primary')
+        if ro is None:
+            raise ValueError("Cannot explain a query without direct access "
+                             "to the database.")
+
+        mk_hashes_q, _ = self._get_ranked_hash_query(ro, sort_by, limit)
+        selection, _, _ = self._get_statement_selection(ro, sort_by, limit,
+                                                        ev_limit=ev_limit)
+        plan_info = {'hash_query': _explain(ro, mk_hashes_q, analyze),
+                     'content_query': _explain(ro, selection, analyze),
+                     'components': []}
+        query = self.normalized()
+        for sub_query in getattr(query, 'queries', []):
+            sub_info = _explain(ro, sub_query.build_hash_query(ro), analyze)
+            sub_info['query'] = str(sub_query)
+            plan_info['components'].append(sub_info)
+        return plan_info
+
+    @routed
+    def estimate_cost(self, ro=None, result_type='statements',
+                      sort_by='ev_count', limit=None, ev_limit=None) -> float:
+        """Get PostgreSQL's estimate of the cost of getting the results.
+
+        The cost is in PostgreSQL's arbitrary units, so it is meant to be
+        compared with a budget chosen from experience, or with the costs of
+        other queries.
+
+        Parameters
+        ----------
+        ro : DatabaseManager
+            A database manager handle that has valid Readonly tables built.
+        result_type : str
+            Either 'statements' or 'hashes': the kind of result whose cost
+            will be estimated.
+        sort_by : str
+            'ev_count' or 'belief'.
+        limit : int
+            The maximum number of results that would be returned.
+        ev_limit : int
+            The limit on evidence per statement, if getting statements.
+
+        Returns
+        -------
+        cost : float
+            The estimated total cost of the query.
+        """
+        if ro is None:
+            ro = get_ro('primary')
+        if ro is None:
+            raise ValueError("Cannot estimate the cost of a query without "
+                             "direct access to the database.")
+        if self.empty:
+            return 0.
+
+        if result_type == 'statements':
+            selection, _, _ = \
+                self._get_statement_selection(ro, sort_by, limit,
+                                              ev_limit=ev_limit)
+        elif result_type == 'hashes':
+            if sort_by != 'ev_count':
+                sort_by = 'belief'
+            selection, _ = self._get_ranked_hash_query(ro, sort_by, limit)
+        else:
+            raise ValueError(f"Invalid result type: {result_type}")
+        return _explain(ro, selection)['cost']
+
+    def _make_statement_result(self, ro, rows, limit, offset, sort_by,
+                               sort_term, ev_limit, ref_link_keys,
+                               source_names=None):
+        """Unpack the rows of a statement selection into a result.
+
+        The source names are got from ro, unless they are given.
+        """
+        # Unpack the statements.
+        stmts_dict = OrderedDict()
+        ev_counts = OrderedDict()
+        beliefs = OrderedDict()
+        source_counts = OrderedDict()
+        returned_evidence = 0
+        last_key = None
+        ranked_hashes = set()
+        if source_names is not None:
+            src_set = source_names
+        else:
+            src_set = ro.get_source_names()
+        for row in rows:
+            # Unpack the row
+            row_gen = iter(row)
+
+            mk_hash = next(row_gen)
+            src_dict = dict.fromkeys(src_set, 0)
+            src_dict.update(next(row_gen))
+            ev_count = next(row_gen)
+            belief = next(row_gen)
+            raw_json_bts = next(row_gen)
+            pa_json_bts = next(row_gen)
+            ref_dict = dict(zip(ref_link_keys, row_gen))
+
+            # Keep track of the last hash in the sort order, for the cursor, and
+            # of all the hashes ranked, even those dropped below.
+            ranked_hashes.add(mk_hash)
+            row_key = {'mk_hash': mk_hash, 'ev_count': ev_count,
+                       'belief': belief}
+            if last_key is None \
+                    or (row_key[sort_by], mk_hash) \
+                    < (last_key[sort_by], last_key['mk_hash']):
+                last_key = row_key
+
+            if pa_json_bts is None:
+                logger.warning("Row returned without pa_json. This likely "
+                               "indicates that an over-zealous evidence filter "
+                               "was used, which filtered out all evidence. "
+                               "This case is not currently handled, and the "
+                               "statement will have to be dropped.")
+                continue
+
+            if raw_json_bts is not None:
+                returned_evidence += 1
+
+            # Add a new statement if the hash is new.
+            if mk_hash not in stmts_dict.keys():
+                source_counts[mk_hash] = src_dict
+                ev_counts[mk_hash] = ev_count
+                beliefs[mk_hash] = belief
+                stmts_dict[mk_hash] = loads_json(pa_json_bts)
+                stmts_dict[mk_hash]['evidence'] = []
+
+            # Add the evidence, if any was requested.
+            if ev_limit != 0:
+                ev_json = _get_evidence_json(raw_json_bts, ref_dict)
+                stmts_dict[mk_hash]['evidence'].append(ev_json)
+
+        next_cursor = None
+        if last_key is not None:
+            next_cursor = _make_cursor(sort_term, last_key)
+        return StatementQueryResult(stmts_dict, limit, offset, ev_counts,
+                                    beliefs, returned_evidence, source_counts,
+                                    self.to_json(), next_cursor,
+                                    len(ranked_hashes))
+
+    def _make_hash_result(self, rows, limit, offset, sort_list):
+        """Package the rows of a ranked hash query into a result.
+
+        Any columns in the rows after the mk_hash, ev_count and belief are
+        ignored.
+        """
+        evidence_counts = {}
+        belief_scores = {}
+        hashes = set()
+        for h, n_ev, belief, *_ in rows:
+            hashes.add(h)
+            evidence_counts[h] = n_ev
+            belief_scores[h] = belief
+
+        next_cursor = None
+        if rows:
+            last_row = rows[-1]
+            next_cursor = _make_cursor(sort_list,
+                                       dict(zip(last_row.keys(), last_row)))
+        return QueryResult(hashes, limit, offset, len(rows), evidence_counts,
+                           belief_scores, self.to_json(), 'hashes', next_cursor)
+
+    def _get_indexed_hash_result(self, agent_index, limit, offset, sort_by,
+                                 cursor):
+        """Get the result of get_hashes from an agent index, if possible."""
+        hashes = self.normalized()._get_index_hashes(agent_index)
+        if hashes is None:
+            return None
+        logger.debug(f"Resolving query with the agent index: {self}")
+        after = None
+        if cursor is not None:
+            after = _decode_cursor(cursor, 2)
+        hashes, ev_counts, beliefs = \
+            agent_index.rank(hashes, sort_by, limit, offset, after)
+        return self._make_array_hash_result(hashes, ev_counts, beliefs, limit,
+                                            offset, sort_by)
+
+    def _make_array_hash_result(self, hashes, ev_counts, beliefs, limit,
+                                offset, sort_by):
+        """Package ranked arrays of hashes, ev_counts and beliefs."""
+        # Convert to python types. Beliefs may be stored as 32-bit floats, so
+        # the shortest string is used to match the values given by the
+        # database (unlike repr, str gives just the number in numpy >= 2).
+        hashes = hashes.tolist()
+        ev_counts = ev_counts.tolist()
+        beliefs = [float(str(b)) for b in beliefs]
+        next_cursor = None
+        if hashes:
+            sort_vals = ev_counts if sort_by == 'ev_count' else beliefs
+            next_cursor = _encode_cursor([sort_vals[-1], hashes[-1]])
+        return QueryResult(set(hashes), limit, offset, len(hashes),
+                           dict(zip(hashes, ev_counts)),
+                           dict(zip(hashes, beliefs)), self.to_json(),
+                           'hashes', next_cursor)
+
+    def _get_fan_out_queries(self):
+        """Get the queries whose hashes are combined to get this query's.
+
+        Returns None if the query cannot be run as separate queries.
+        """
+        return None
+
+    def _get_top_k_drivers(self):
+        """Get the queries whose sorted hashes may be walked for this query.
+
+        The other constraints of the query must be checkable for each hash.
+        """
+        return []
+
+    def _get_indexed_queries(self):
+        """Get the parts of the query whose hashes are found from an index."""
+        return []
+
+    def _choose_hash_strategy(self, ro, limit, offset, sort_by, cursor):
+        """Choose the strategy of get_hashes from cost estimates."""
+        query = self.normalized()
+        fan_out_queries = None
+        # Running the parts separately only pays if several of them can each
+        # be found quickly from an index, so only then are they estimated.
+        if len(query._get_indexed_queries()) > 1:
+            fan_out_queries = query._get_fan_out_queries()
+        use_top_k = limit is not None and limit <= TOP_K_MAX_LIMIT \
+            and offset is None and bool(query._get_top_k_drivers())
+        if fan_out_queries is None and not use_top_k:
+            return 'single'
+
+        mk_hashes_q, _ = \
+            self._get_ranked_hash_query(ro, sort_by, limit, offset, cursor)
+        single_cost = _explain(ro, mk_hashes_q)['cost']
+        if single_cost < HASH_STRATEGY_MIN_COST:
+            return 'single'
+        if use_top_k:
+            return 'top_k'
+
+        costs = [_explain(ro, q.build_hash_query(ro).distinct())['cost']
+                 for q in fan_out_queries]
+        fan_out_cost = max(max(costs), sum(costs) / FAN_OUT_MAX_WORKERS)
+        logger.debug(f"Estimated cost of {self} is {single_cost} as a single "
+                     f"query, and {fan_out_cost} fanned out.")
+        if fan_out_cost < FAN_OUT_COST_RATIO * single_cost:
+            return 'fan_out'
+        return 'single'
+
+    def _get_top_k_hash_result(self, ro, drivers, limit, offset, sort_by,
+                               cursor):
+        """Get the result of get_hashes by walking one query's sorted hashes.
+
+        The hashes of the most selective of the drivers are scanned in sorted
+        order, and each is checked against the other queries with EXISTS, in
+        batches, stopping as soon as enough matches are found.
+        """
+        query = self.normalized()
+        driver = drivers[0]
+        if len(drivers) > 1:
+            driver = min(drivers, key=lambda q:
+                         _explain(ro, q.build_hash_query(ro))['rows'])
+        logger.debug(f"Walking the hashes of {driver} for the top {limit} "
+                     f"of {self}.")
+
+        mk_hash_obj, ev_count_obj, belief_obj = driver._get_core_cols(ro)
+        stmt_id_obj = driver._get_stmt_id_col(ro)
+        walk_q = driver.build_hash_query(ro)
+        for q in query.queries:
+            if q is driver:
+                continue
+            if q._inverted:
+                walk_q = walk_q.filter(~_get_hash_exists(ro, ~q, stmt_id_obj))
+            else:
+                walk_q = walk_q.filter(_get_hash_exists(ro, q, stmt_id_obj))
+        if sort_by == 'ev_count':
+            order_params = [desc(ev_count_obj), desc(mk_hash_obj)]
+        else:
+            order_params = [desc(belief_obj), desc(mk_hash_obj)]
+        walk_q = walk_q.order_by(*order_params)
+
+        # Fetch batches until enough distinct hashes are found. A hash may
+        # appear in several rows (e.g. for several agents), but those rows
+        # are adjacent, and the seek past the last row skips any that remain.
+        num_wanted = limit + (offset or 0)
+        batch_size = max(num_wanted, TOP_K_MIN_BATCH)
+        rows = []
+        seen = set()
+        while len(rows) < num_wanted:
+            batch = _seek_past_cursor(walk_q, order_params, cursor)\
+                .limit(batch_size).all()
+            for row in batch:
+                if row.mk_hash not in seen:
+                    seen.add(row.mk_hash)
+                    rows.append(row)
+            if len(batch) < batch_size:
+                break
+            cursor = _make_cursor(order_params,
+                                  dict(zip(batch[-1].keys(), batch[-1])))
+        rows = rows[offset or 0:num_wanted]
+        return self._make_hash_result(rows, limit, offset, order_params)
+
+    def _get_bitmap_walk_result(self, ro, bitmap_index, bitmap, limit, offset,
+                                sort_by, cursor):
+        """Get the result of get_hashes by walking all statements in order.
+
+        The statements of source_meta are scanned in sorted order, in batches,
+        and those in the bitmap are kept, stopping as soon as enough are
+        found. This suits bitmaps of many statements, as of inverted queries.
+        """
+        logger.debug(f"Walking all statements for the top {limit} of {self}, "
+                     f"{len(bitmap)} in the bitmap index.")
+        sm = ro.SourceMeta
+        if sort_by == 'ev_count':
+            order_params = [desc(sm.ev_count), desc(sm.mk_hash)]
+        else:
+            order_params = [desc(sm.belief), desc(sm.mk_hash)]
+        walk_q = (ro.session.query(sm.mk_hash, sm.ev_count, sm.belief)
+                  .order_by(*order_params))
+
+        # Size the batches by the fraction of the statements in the bitmap.
+        num_wanted = limit + (offset or 0)
+        batch_size = max(int(1.2 * num_wanted * len(bitmap_index)
+                             / len(bitmap)), TOP_K_MIN_BATCH)
+        rows = []
+        while len(rows) < num_wanted:
+            batch = _seek_past_cursor(walk_q, order_params, cursor)\
+                .limit(batch_size).all()
+            in_bitmap = bitmap_index.contains(bitmap,
+                                              [row.mk_hash for row in batch])
+            rows.extend(row for row, keep in zip(batch, in_bitmap) if keep)
+            if len(batch) < batch_size:
+                break
+            cursor = _make_cursor(order_params,
+                                  dict(zip(batch[-1].keys(), batch[-1])))
+        rows = rows[offset or 0:num_wanted]
+        return self._make_hash_result(rows, limit, offset, order_params)
+
+    def _get_fan_out_hash_result(self, ro, fan_out_queries, limit, offset,
+                                 sort_by, cursor, timeout=None,
+                                 cancel_handle=None):
+        """Get the result of get_hashes by running the components in parallel.
+
+        The hashes of each query are retrieved on their own pooled connection,
+        then the hash sets are combined with numpy and ranked.
+        """
+        logger.debug(f"Fanning out {len(fan_out_queries)} queries for {self}.")
+        selections = [q.build_hash_query(ro).distinct().statement
+                      for q in fan_out_queries]
+        num_workers = min(FAN_OUT_MAX_WORKERS, len(selections))
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            all_rows = list(executor.map(_execute_in_new_session,
+                                         [ro] * len(selections), selections,
+                                         [timeout] * len(selections),
+                                         [cancel_handle] * len(selections)))
+
+        # Combine the sorted hash sets of the queries.
+        hash_arrays = {q: np.unique(np.array([row[0] for row in rows],
+                                             dtype=np.int64))
+                       for q, rows in zip(fan_out_queries, all_rows)}
+        hashes = self.normalized()._combine_hash_arrays(hash_arrays.get)
+
+        # Look up the ev_counts and beliefs of the hashes, and rank them.
+        rows = [row for rows in all_rows for row in rows]
+        row_hashes, idx = np.unique(np.array([row[0] for row in rows],
+                                             dtype=np.int64),
+                                    return_index=True)
+        pos = np.searchsorted(row_hashes, hashes)
+        ev_counts = np.array([row[1] for row in rows], dtype=np.int64)[idx]
+        beliefs = np.array([row[2] for row in rows], dtype=np.float64)[idx]
+        after = None
+        if cursor is not None:
+            after = _decode_cursor(cursor, 2)
+        hashes, ev_counts, beliefs = \
+            rank_hashes(hashes, ev_counts[pos], beliefs[pos], sort_by, limit,
+                        offset, after)
+        return self._make_array_hash_result(hashes, ev_counts, beliefs, limit,
+                                            offset, sort_by)
+
+    def _get_shape(self):
+        """Get a hashable description of the structure of this query.
+
+        Queries of the same shape differ only in their values, such as agent
+        IDs or hashes, and so generally differ in their SQL only by the values
+        of bound parameters.
+        """
+        return self.__class__.__name__, self._inverted
+
+    def _fetch_all(self, ro, selection):
+        """Get all the rows of a selection built from this query.
+
+        If a cache of prepared statements has been set (see
+        `set_prepared_cache`), the selection is run as a prepared statement.
+        """
+        prepared_cache = get_prepared_cache()
+        if prepared_cache is not None:
+            return prepared_cache.execute(ro, self._get_shape(),
+                                          selection).fetchall()
+        if isinstance(selection, OrmQuery):
+            return selection.all()
+        return ro.session.connection().execute(selection).fetchall()
+
+    def _get_index_hashes(self, agent_index):
+        """Get the sorted array of hashes matching this query from an index.
+
+        Returns None if the query cannot be answered by the index alone.
+        """
+        return None
+
+    def _get_mask(self, snapshot):
+        """Get a boolean mask of the rows of a SourceMetaSnapshot.
+
+        Returns None if the query cannot be evaluated on the snapshot.
+        """
+        return None
+
+    def _get_bitmap(self, bitmap_index):
+        """Get the bitmap of the statements matching this query from an index.
+
+        Returns None if the query cannot be resolved by the index alone.
+        """
+        return None
+
+    def _get_bitmap_hashes(self, ro):
+        """Get the hashes matching this query from the bitmap index, if few.
+
+        Returns None if no bitmap index of the dump in ro is set, if it cannot
+        resolve the query, or if more than BITMAP_MAX_HASHES statements match.
+        """
+        bitmap_index = get_bitmap_index(ro)
+        if bitmap_index is None:
+            return None
+        bitmap = self.normalized()._get_bitmap(bitmap_index)
+        if bitmap is None or len(bitmap) > BITMAP_MAX_HASHES:
+            return None
+        return bitmap_index.get_hashes(bitmap)
+
+    def _get_aggregate_filter(self, meta):
+        """Get the filter on an aggregate table equivalent to this query."""
+        query = self.normalized()
+        if query.full:
+            return true()
+        return query._get_aggregate_clause(meta)
+
+    def _get_aggregate_clause(self, meta):
+        """Get a clause selecting the rows of an aggregate table.
+
+        The aggregate table (RelationAggregates) holds totals over groups of
+        statements. A clause can only be given if the query matches either
+        all or none of the statements in each group.
+
+        Parameters
+        ----------
+        meta : type
+            The aggregate table.
+
+        Returns
+        -------
+        clause : Optional[ClauseElement]
+            The clause, or None if the aggregates must be computed from the
+            hashes matching the query.
+        """
+        return None
+
+    def _get_statements_two_phase(self, ro, limit, offset, sort_by,
+                                  ev_limit, evidence_filter, cursor,
+                                  ev_filter_pushdown=False, timeout=None,
+                                  cancel_handle=None):
+        """Get statements by first ranking the hashes, then getting evidence.
+
+        The evidence for the ranked hashes is looked up in batches, each batch
+        running on its own pooled connection in a small thread pool, within
+        the same timeout and cancel handle as the rest of the query.
+        """
+        # Phase one: get the ranked hashes, with their metadata.
+        mk_hashes_q, sort_term = self._get_ranked_hash_query(
+            ro, sort_by, limit, offset, cursor,
+            evidence_filter if ev_filter_pushdown else None
+        )
+        mk_hashes_al = mk_hashes_q.subquery('mk_hashes')
+        rank_q = (ro.session.query(mk_hashes_al.c.mk_hash,
+                                   mk_hashes_al.c.ev_count,
+                                   mk_hashes_al.c.belief,
+                                   ro.SourceMeta.src_json)
+                  .outerjoin(ro.SourceMeta,
+                             _get_stmt_key(ro, ro.SourceMeta)
+                             == mk_hashes_al.c.stmt_id)
+                  .order_by(desc(mk_hashes_al.c[sort_by]),
+                            desc(mk_hashes_al.c.mk_hash)))
+        if self._print_only:
+            print(rank_q)
+            return
+
+        logger.debug(f"Executing query (get_statements, phase 1):\n{rank_q}")
+        ranked = rank_q.all()
+        if not ranked:
+            return StatementQueryResult.empty(limit, offset, self.to_json())
+
+        # Phase two: get the evidence for the ranked hashes.
+        ref_link_keys = [k for k in ro.ReadingRefLink.__dict__.keys()
+                         if not k.startswith('_')]
+        hashes = [row.mk_hash for row in ranked]
+        selections = [
+            self._get_evidence_selection(ro, hashes[i:i+TWO_PHASE_BATCH_SIZE],
+                                         ev_limit, evidence_filter,
+                                         ref_link_keys)
+            for i in range(0, len(hashes), TWO_PHASE_BATCH_SIZE)
+        ]
+        logger.debug(f"Retrieving evidence for {len(hashes)} hashes in "
+                     f"{len(selections)} batches.")
+        ev_rows = defaultdict(list)
+        num_workers = min(TWO_PHASE_MAX_WORKERS, len(selections))
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            batch_rows = executor.map(_execute_in_new_session,
+                                      [ro] * len(selections), selections,
+                                      [timeout] * len(selections),
+                                      [cancel_handle] * len(selections))
+            for rows in batch_rows:
+                for row in rows:
+                    ev_rows[row[0]].append(row)
+
+        # Assemble the statements, in order.
+        stmts_dict = OrderedDict()
+        ev_counts = OrderedDict()
+        beliefs = OrderedDict()
+        source_counts = OrderedDict()
+        returned_evidence = 0
+        src_set = ro.get_source_names()
+        for mk_hash, ev_count, belief, src_json in ranked:
+            if not ev_rows[mk_hash]:
+                logger.warning(f"No evidence returned for {mk_hash}. This "
+                               f"likely indicates that an over-zealous "
+                               f"evidence filter was used. The statement will "
+                               f"be dropped.")
+                continue
+
+            source_counts[mk_hash] = dict.fromkeys(src_set, 0)
+            source_counts[mk_hash].update(src_json)
+            ev_counts[mk_hash] = ev_count
+            beliefs[mk_hash] = belief
+            pa_json_bts = ev_rows[mk_hash][0][2]
+            stmts_dict[mk_hash] = loads_json(pa_json_bts)
+            stmts_dict[mk_hash]['evidence'] = []
+            if ev_limit == 0:
+                continue
+
+            for row in ev_rows[mk_hash]:
+                ref_dict = dict(zip(ref_link_keys, row[3:]))
+                ev_json = _get_evidence_json(row[1], ref_dict)
+                stmts_dict[mk_hash]['evidence'].append(ev_json)
+                returned_evidence += 1
 
-        il = InteractionSQL(ro)
-        result_tuple = self._run_meta_sql(il, ro, limit, offset, sort_by)
-        if result_tuple is None:
-            return
-        results, ev_counts, belief_scores, off_comp = result_tuple
-        return QueryResult(results, limit, offset, off_comp, ev_counts,
-                           belief_scores, self.to_json(), il.meta_type)
+        next_cursor = _make_cursor(sort_term, ranked[-1]._asdict())
+        return StatementQueryResult(stmts_dict, limit, offset, ev_counts,
+                                    beliefs, returned_evidence, source_counts,
+                                    self.to_json(), next_cursor, len(ranked))
 
-    def get_relations(self, ro=None, limit=None, offset=None,
-                      sort_by='ev_count', with_hashes=False) \
-            -> Optional[QueryResult]:
-        """Get the agent and type information from the Statements metadata.
+    @staticmethod
+    def _get_evidence_selection(ro, mk_hashes, ev_limit, evidence_filter,
+                                ref_link_keys):
+        """Get the selection of evidence rows for the given hashes.
 
-         Each entry in the result corresponds to a relation, meaning an
-         interaction type, and the names of the agents involved.
+        The columns selected are the mk_hash, raw JSON, and pre-assembled JSON,
+        followed by the given columns of the reading ref link.
+        """
+        frp = ro.FastRawPaLink
+        if ev_limit == 0:
+            raw_json_c = null().label('raw_json')
+        else:
+            raw_json_c = frp.raw_json.label('raw_json')
+        hashes_param = bindparam('mk_hashes', mk_hashes,
+                                 type_=ARRAY(BigInteger))
+        ev_q = ro.session.query(frp.mk_hash.label('mk_hash'), raw_json_c,
+                                frp.pa_json.label('pa_json'),
+                                frp.reading_id.label('rid'))
+        if ev_limit is not None:
+            # Number the evidence for each hash, so it can be limited. When
+            # no evidence is requested, a single row is still needed for the
+            # pa_json.
+            row_num_c = (func.row_number()
+                         .over(partition_by=frp.mk_hash, order_by=frp.id)
+                         .label('row_num'))
+            ev_q = ev_q.add_columns(row_num_c)
+        ev_q = ev_q.filter(frp.mk_hash == any_(hashes_param))
+        if evidence_filter is not None:
+            ev_q = evidence_filter.join_table(ro, ev_q, {'fast_raw_pa_link'})
+            ev_q = evidence_filter.apply_filter(ro, ev_q)
+        ev_al = ev_q.subquery('evidence')
 
-        Parameters
-        ----------
-        ro : DatabaseManager
-            A database manager handle that has valid Readonly tables built.
-        limit : int
-            Control the maximum number of results returned. As a rule, unless
-            you are quite sure the query will result in a small number of
-            matches, you should limit the query.
-        offset : int
-            Get results starting from the value of offset. This along with limit
-            allows you to page through results.
-        sort_by : str
-            Options are currently 'ev_count' or 'belief'. Results will return in
-            order of the given parameter.
-        with_hashes : bool
-            Default is False. If True, retrieve all the hashes that fit within
-            each relational grouping.
+        cols = [ev_al.c.mk_hash, ev_al.c.raw_json, ev_al.c.pa_json]
+        cols += [getattr(ro.ReadingRefLink, k) for k in ref_link_keys]
+        selection = (select(cols)
+                     .select_from(ev_al.outerjoin(
+                         ro.ReadingRefLink,
+                         ro.ReadingRefLink.rid == ev_al.c.rid)))
+        if ev_limit is not None:
+            selection = selection.where(ev_al.c.row_num <= max(ev_limit, 1))
+        return selection
+
+    def _get_statement_selection(self, ro, sort_by, limit=None, offset=None,
+                                 cursor=None, ev_limit=None,
+                                 evidence_filter=None, ordered=False,
+                                 ev_filter_pushdown=False):
+        """Get the selection of statement and evidence JSON rows.
+
+        The columns selected are the mk_hash, source counts, ev_count, belief,
+        raw JSON, and pre-assembled JSON, followed by the columns of the
+        reading ref link, whose names are also returned. If `ordered` is True,
+        the rows are sorted by sort_by and then mk_hash, so that all the rows
+        for a given statement are contiguous. If `ev_filter_pushdown` is True,
+        the evidence filter is also applied to the hashes before ranking.
         """
-        if ro is None:
-            ro = get_ro('primary')
+        # Get the query for mk_hashes and ev_counts, and apply the generic
+        # limits to it.
+        mk_hashes_q, sort_term = self._get_ranked_hash_query(
+            ro, sort_by, limit, offset, cursor,
+            evidence_filter if ev_filter_pushdown else None
+        )
 
-        if self.empty:
-            return QueryResult.empty({}, limit, offset, self.to_json(),
-                                     'relations')
+        # Do the difficult work of turning a query for hashes and ev_counts
+        # into a query for statement JSONs. Return the results.
+        mk_hashes_al = mk_hashes_q.subquery('mk_hashes')
+        cont_q = self._get_content_query(ro, mk_hashes_al, ev_limit)
+        if evidence_filter is not None:
+            cont_q = evidence_filter.join_table(ro, cont_q,
+                                                {'fast_raw_pa_link'})
+            cont_q = evidence_filter.apply_filter(ro, cont_q)
 
-        if ro is None:
-            return self._rest_get('relations', limit, offset, sort_by,
-                                  with_hashes=with_hashes)
+        # If there is no evidence, whittle down the results so we only get one
+        # pa_json for each hash.
+        if ev_limit == 0:
+            cont_q = cont_q.distinct()
 
-        r_sql = RelationSQL(ro)
-        result_tuple = self._run_meta_sql(r_sql, ro, limit, offset, sort_by,
-                                          with_hashes)
-        if result_tuple is None:
-            return None
+        # If we have a limit on the evidence, we need to do a lateral join.
+        # If we are just getting all the evidence, or none of it, just put an
+        # alias on the subquery.
+        if ev_limit is not None and ev_limit != 0:
+            cont_q = cont_q.limit(ev_limit)
+            json_content_al = cont_q.subquery().lateral('json_content')
+            stmts_q = (mk_hashes_al
+                       .outerjoin(json_content_al, true())
+                       .outerjoin(ro.SourceMeta,
+                                  _get_stmt_key(ro, ro.SourceMeta)
+                                  == mk_hashes_al.c.stmt_id))
+            cols = [mk_hashes_al.c.mk_hash, ro.SourceMeta.src_json,
+                    mk_hashes_al.c.ev_count, mk_hashes_al.c.belief,
+                    json_content_al.c.raw_json, json_content_al.c.pa_json]
+        else:
+            json_content_al = cont_q.subquery().alias('json_content')
+            stmts_q = (json_content_al
+                       .outerjoin(ro.SourceMeta,
+                                  _get_stmt_key(ro, ro.SourceMeta)
+                                  == json_content_al.c.stmt_id))
+            cols = [json_content_al.c.mk_hash, ro.SourceMeta.src_json,
+                    json_content_al.c.ev_count, json_content_al.c.belief,
+                    json_content_al.c.raw_json, json_content_al.c.pa_json]
 
-        results, ev_counts, belief_scores, off_comp = result_tuple
-        return QueryResult(results, limit, offset, off_comp, ev_counts,
-                           belief_scores, self.to_json(), r_sql.meta_type)
+        # Join up with other tables to pull metadata.
+        stmts_q = (stmts_q
+                   .outerjoin(ro.ReadingRefLink,
+                              ro.ReadingRefLink.rid == json_content_al.c.rid))
 
-    def get_agents(self, ro=None, limit=None, offset=None, sort_by='ev_count',
-                   with_hashes=False, complexes_covered=None) \
-            -> Optional[QueryResult]:
-        """Get the agent pairs from the Statements metadata.
+        ref_link_keys = [k for k in ro.ReadingRefLink.__dict__.keys()
+                         if not k.startswith('_')]
 
-         Each entry is simply a pair (or more) of Agents involved in an
-         interaction.
+        cols += [getattr(ro.ReadingRefLink, k) for k in ref_link_keys]
 
-        Parameters
-        ----------
-        ro : Optional[DatabaseManager]
-            A database manager handle that has valid Readonly tables built.
-        limit : Optional[int]
-            Control the maximum number of results returned. As a rule, unless
-            you are quite sure the query will result in a small number of
-            matches, you should limit the query.
-        offset : Optional[int]
-            Get results starting from the value of offset. This along with limit
-            allows you to page through results.
-        sort_by : str
-            Options are currently 'ev_count' or 'belief'. Results will return in
-            order of the given parameter.
-        with_hashes : bool
-            Default is False. If True, retrieve all the hashes that fit within
-            each agent pair grouping.
-        complexes_covered : Optional[set]
-            The set of hashes for complexes that you have already seen and would
-            like skipped.
+        # Put it all together.
+        selection = select(cols).select_from(stmts_q)
+        if ordered:
+            rank_col = cols[2] if sort_by == 'ev_count' else cols[3]
+            selection = selection.order_by(desc(rank_col), desc(cols[0]))
+        return selection, sort_term, ref_link_keys
+
+    def _get_ranked_hash_query(self, ro, sort_by, limit=None, offset=None,
+                               cursor=None, evidence_filter=None):
+        """Get the hash query sorted (totally) by sort_by, with limits applied.
+
+        Ties in the sort parameter are broken by mk_hash so that cursors may be
+        used to page through the results. If an evidence_filter is given, only
+        hashes with evidence that passes the filter are selected.
         """
-        if ro is None:
-            ro = get_ro('primary')
-
-        if self.empty:
-            return AgentQueryResult.empty(limit, offset, self.to_json())
-
-        if ro is None:
-            return self._rest_get('agents', limit, offset, sort_by,
-                                  with_hashes=with_hashes,
-                                  complexes_covered=complexes_covered)
-
-        ag_sql = AgentSQL(ro, with_complex_dups=True,
-                          complexes_covered=complexes_covered)
-        result_tuple = self._run_meta_sql(ag_sql, ro, limit, offset, sort_by,
-                                          with_hashes)
-        if result_tuple is None:
-            return
+        query = self.normalized()
 
-        results, ev_counts, belief_scores, off_comp = result_tuple
-        return AgentQueryResult(results, limit, offset, off_comp,
-                                ag_sql.complexes_covered, ev_counts,
-                                belief_scores, self.to_json())
+        # If a bitmap index narrows the query down to a few statements, only
+        # their hashes are sent to the database.
+        bitmap_hashes = query._get_bitmap_hashes(ro)
+        if bitmap_hashes is not None:
+            query = HasHash(bitmap_hashes.tolist())
 
-    def _run_meta_sql(self, ms, ro, limit, offset, sort_by, with_hashes=None):
-        mk_hashes_sq = self.build_hash_query(ro).subquery('mk_hashes')
-        ms.filter(ro.AgentInteractions.mk_hash == mk_hashes_sq.c.mk_hash)
-        kwargs = {'sort_by': sort_by}
-        if with_hashes is not None:
-            kwargs['with_hashes'] = with_hashes
-        order_params = ms.agg(ro, **kwargs)
-        ms = self._apply_limits(ms, order_params, limit, offset)
-        if self._print_only:
-            ms.print()
-            return
-        return ms.run()
+        mk_hashes_q = query.build_hash_query(ro)
+        mk_hashes_q = mk_hashes_q.distinct()
+        mk_hash_obj, ev_count_obj, belief_obj = query._get_core_cols(ro)
+        if evidence_filter is not None:
+            mk_hashes_q = mk_hashes_q.filter(
+                evidence_filter.get_exists_clause(ro,
+                                                  query._get_stmt_id_col(ro))
+            )
+        if sort_by == 'ev_count':
+            order_params = [desc(ev_count_obj), desc(mk_hash_obj)]
+        elif sort_by == 'belief':
+            order_params = [desc(belief_obj), desc(mk_hash_obj)]
+        else:
+            raise ValueError(f"Invalid sort option: {sort_by}.")
+        mk_hashes_q = _seek_past_cursor(mk_hashes_q, order_params, cursor)
+        mk_hashes_q = self._apply_limits(mk_hashes_q, order_params, limit,
+                                         offset)
+        return mk_hashes_q, order_params
 
     @staticmethod
     def _apply_limits(mk_hashes_q, order_params, limit=None, offset=None):
@@ -1116,19 +2436,30 @@ class Query(object):
         mk_hash, ev_count, belief = self._get_core_cols(ro)
         return ro.session.query(mk_hash.label('mk_hash'),
                                 ev_count.label('ev_count'),
-                                belief.label('belief'))
+                                belief.label('belief'),
+                                self._get_stmt_id_col(ro).label('stmt_id'))
 
     def _get_core_cols(self, ro) -> tuple:
         meta = self._get_table(ro)
         return meta.mk_hash, meta.ev_count, meta.belief
 
+    def _get_stmt_id_col(self, ro):
+        """Get the column of the dense statement IDs, used in internal joins.
+
+        The stmt_id is a 4-byte stand-in for the mk_hash, numbered in order of
+        evidence count when the readonly database is built.
+        """
+        return _get_stmt_key(ro, self._get_table(ro))
+
     def build_hash_query(self, ro, type_queries=None):
         """[Internal] Build the query for hashes."""
         # If the query is by definition everything, save much time and effort.
         if self.full:
             return ro.session.query(ro.SourceMeta.mk_hash.label('mk_hash'),
                                     ro.SourceMeta.ev_count.label('ev_count'),
-                                    ro.SourceMeta.belief.label('belief'))
+                                    ro.SourceMeta.belief.label('belief'),
+                                    _get_stmt_key(ro, ro.SourceMeta)
+                                    .label('stmt_id'))
 
         # Otherwise proceed with the usual query.
         return self._get_hash_query(ro, type_queries)
@@ -1141,7 +2472,8 @@ class Query(object):
         # Incorporate a link to the JSONs in the table.
         pa_json_c = ro.FastRawPaLink.pa_json.label('pa_json')
         reading_id_c = ro.FastRawPaLink.reading_id.label('rid')
-        frp_link = ro.FastRawPaLink.mk_hash == mk_hashes_al.c.mk_hash
+        frp_link = _get_stmt_key(ro, ro.FastRawPaLink) \
+            == mk_hashes_al.c.stmt_id
 
         # If there is no evidence, don't get raw JSON, otherwise we need a col
         # for the raw JSON.
@@ -1155,8 +2487,10 @@ class Query(object):
             mk_hash_c = ro.FastRawPaLink.mk_hash.label('mk_hash')
             ev_count_c = mk_hashes_al.c.ev_count.label('ev_count')
             belief_c = mk_hashes_al.c.belief.label('belief')
+            stmt_id_c = _get_stmt_key(ro, ro.FastRawPaLink).label('stmt_id')
             cont_q = ro.session.query(mk_hash_c, ev_count_c, belief_c,
-                                      raw_json_c, pa_json_c, reading_id_c)
+                                      raw_json_c, pa_json_c, reading_id_c,
+                                      stmt_id_c)
         else:
             cont_q = ro.session.query(raw_json_c, pa_json_c, reading_id_c)
         cont_q = cont_q.filter(frp_link)
@@ -1311,6 +2645,7 @@ class AgentInteractionMeta:
 
 
 class AgentJsonExpander(AgentInteractionMeta):
+    @routed
     def expand(self, ro=None, sort_by='ev_count'):
         if ro is None:
             ro = get_ro('primary')
@@ -1409,6 +2744,9 @@ class SourceQuery(Query):
     def _apply_filter(self, ro, query, invert=False):
         raise NotImplementedError()
 
+    def _get_bitmap(self, bitmap_index, invert=False):
+        return None
+
     def _get_hash_query(self, ro, inject_queries=None):
         q = self._base_query(ro)
         q = self._apply_filter(ro, q)
@@ -1434,7 +2772,7 @@ class SourceIntersection(Query):
         # Look through all the queries, picking out special cases and grouping
         # the rest by class.
         class_groups = defaultdict(list)
-        for sq in source_queries:
+        for sq in _flatten_queries(source_queries, SourceIntersection):
             # We will need to check other class groups for inversion, so
             # group them now for efficiency.
             class_groups[sq.__class__].append(sq)
@@ -1459,7 +2797,8 @@ class SourceIntersection(Query):
                             break
 
         # Make the source queries a tuple, thus immutable.
-        self.source_queries = tuple(filtered_queries)
+        self.source_queries = tuple(sorted(filtered_queries,
+                                           key=_canonical_key))
 
         # I am empty if any of my queries is empty, or if I have no queries.
         empty |= any(q.empty for q in self.source_queries)
@@ -1469,6 +2808,11 @@ class SourceIntersection(Query):
     def _copy(self):
         return self.__class__(self.source_queries)
 
+    def normalized(self):
+        if len(self.source_queries) == 1:
+            return self.source_queries[0].normalized()
+        return self.__class__([q.normalized() for q in self.source_queries])
+
     def __invert__(self):
         return Union([~q for q in self.source_queries])
 
@@ -1506,6 +2850,10 @@ class SourceIntersection(Query):
         query_list = [q.to_json() for q in self.source_queries]
         return {'source_queries': query_list}
 
+    def _get_shape(self):
+        return super(SourceIntersection, self)._get_shape() \
+            + tuple(q._get_shape() for q in self.source_queries)
+
     @classmethod
     def _from_constraint_json(cls, constraint_json):
         query_list = [Query.from_json(qj)
@@ -1532,6 +2880,47 @@ class SourceIntersection(Query):
                 query = tq._apply_filter(self._get_table(ro), query)
         return query
 
+    def _get_mask(self, snapshot):
+        mask = np.ones(len(snapshot), dtype=bool)
+        for sq in self.source_queries:
+            sub_mask = sq._get_mask(snapshot, self._inverted)
+            if sub_mask is None:
+                return None
+            mask &= sub_mask
+        return mask
+
+    def _get_bitmap(self, bitmap_index):
+        bitmaps = []
+        for sq in self.source_queries:
+            bitmap = sq._get_bitmap(bitmap_index, self._inverted)
+            if bitmap is None:
+                return None
+            bitmaps.append(bitmap)
+        return reduce(lambda a, b: a & b, sorted(bitmaps, key=len))
+
+
+def _canonical_key(query):
+    """Get a key that is the same for equal queries, to sort queries by."""
+    return json.dumps(query.to_json(), sort_keys=True)
+
+
+def _flatten_queries(query_list, MergeClass):
+    """Expand any (nested) members of MergeClass and drop any EmptyQuery."""
+    flat_list = []
+    for query in query_list:
+        if isinstance(query, EmptyQuery):
+            # EmptyQuery is the identity of both `&` and `|`.
+            continue
+        if isinstance(query, MergeClass) and not query._inverted:
+            if isinstance(query, SourceIntersection):
+                sub_queries = query.source_queries
+            else:
+                sub_queries = query.queries
+            flat_list.extend(_flatten_queries(sub_queries, MergeClass))
+        else:
+            flat_list.append(query)
+    return flat_list
+
 
 def _join_list(str_list, joiner='or'):
     str_list = sorted([str(e) for e in str_list])
@@ -1583,6 +2972,20 @@ class HasOnlySource(SourceQuery):
             clause = meta.only_src.is_distinct_from(self.only_source)
         return query.filter(clause)
 
+    def _get_mask(self, snapshot, invert=False):
+        if '%' in self.only_source:
+            # Sources are matched with LIKE, so patterns need the database.
+            return None
+        src_code = snapshot.get_source_code(self.only_source)
+        if src_code == -1:
+            # The code of an unknown source is also that of a NULL only_src.
+            mask = np.zeros(len(snapshot), dtype=bool)
+        else:
+            mask = snapshot.get_column('only_src') == src_code
+        if self._inverted ^ invert:
+            mask = ~mask
+        return mask
+
 
 class HasSources(SourceQuery):
     """Find Statements that include a set of sources.
@@ -1600,7 +3003,7 @@ class HasSources(SourceQuery):
         empty = False
         if len(sources) == 0:
             empty = True
-        self.sources = tuple(set(sources))
+        self.sources = tuple(sorted(set(sources)))
         super(HasSources, self).__init__(empty)
 
     def _copy(self):
@@ -1615,6 +3018,10 @@ class HasSources(SourceQuery):
     def _get_constraint_json(self) -> dict:
         return {'sources': self.sources}
 
+    def _get_shape(self):
+        # The sources are columns, so they are part of the structure.
+        return super(HasSources, self)._get_shape() + self.sources
+
     def ev_filter(self):
         if not self._inverted:
             def get_clause(ro):
@@ -1641,6 +3048,25 @@ class HasSources(SourceQuery):
             query = query.filter(or_(*clauses))
         return query
 
+    def _get_mask(self, snapshot, invert=False):
+        inverted = self._inverted ^ invert
+        mask = np.ones(len(snapshot), dtype=bool)
+        for src in self.sources:
+            mask &= snapshot.get_source_counts(src) > 0
+        if inverted:
+            # Recall De Morgan's Law.
+            mask = ~mask
+        return mask
+
+    def _get_bitmap(self, bitmap_index, invert=False):
+        bitmaps = [bitmap_index.get_source_bitmap(src) for src in self.sources]
+        if any(bitmap is None for bitmap in bitmaps):
+            return None
+        bitmap = reduce(lambda a, b: a & b, sorted(bitmaps, key=len))
+        if self._inverted ^ invert:
+            bitmap = bitmap_index.complement(bitmap)
+        return bitmap
+
 
 class SourceTypeCore(SourceQuery):
     """The base class for HasReadings and HasDatabases."""
@@ -1692,6 +3118,12 @@ class SourceTypeCore(SourceQuery):
             clause = getattr(meta, self.col) == False
         return query.filter(clause)
 
+    def _get_mask(self, snapshot, invert=False):
+        mask = np.array(snapshot.get_column(self.col), dtype=bool)
+        if self._inverted ^ invert:
+            mask = ~mask
+        return mask
+
 
 class HasReadings(SourceTypeCore):
     """Find Statements that have readings."""
@@ -1718,7 +3150,7 @@ class HasHash(SourceQuery):
 
     def __init__(self, stmt_hashes):
         empty = len(stmt_hashes) == 0
-        self.stmt_hashes = tuple(stmt_hashes)
+        self.stmt_hashes = tuple(sorted(set(stmt_hashes)))
         super(HasHash, self).__init__(empty)
 
     def _copy(self):
@@ -1737,6 +3169,9 @@ class HasHash(SourceQuery):
     def _get_constraint_json(self) -> dict:
         return {'stmt_hashes': sorted(list(self.stmt_hashes))}
 
+    def _get_shape(self):
+        return super(HasHash, self)._get_shape() + (len(self.stmt_hashes),)
+
     def _get_empty(self):
         return self.__class__([])
 
@@ -1766,6 +3201,16 @@ class HasHash(SourceQuery):
                 clause = mk_hash.notin_(self.stmt_hashes)
         return query.filter(clause)
 
+    def _get_mask(self, snapshot, invert=False):
+        return np.isin(snapshot.get_column('mk_hash'), self.stmt_hashes,
+                       invert=self._inverted ^ invert)
+
+    def _get_bitmap(self, bitmap_index, invert=False):
+        bitmap = bitmap_index.get_hash_bitmap(self.stmt_hashes)
+        if self._inverted ^ invert:
+            bitmap = bitmap_index.complement(bitmap)
+        return bitmap
+
 
 class NoGroundingFound(Exception):
     pass
@@ -1802,8 +3247,17 @@ class HasAgent(Query):
     agent_num : int or None
         (optional) None by default. The regularized position of the agent in the
         Statement's list of agents.
+    match : str
+        (optional) How the agent ID is matched: 'exact' (default), in which
+        case SQL LIKE wildcards in the ID are still honored, 'prefix', to find
+        agents whose ID starts with the given ID, or 'substring', to find
+        agents whose ID contains the given ID. The latter two are supported by
+        indices for the TEXT and other (not NAME) namespaces.
     """
-    def __init__(self, agent_id, namespace='NAME', role=None, agent_num=None):
+    match_options = ('exact', 'prefix', 'substring')
+
+    def __init__(self, agent_id, namespace='NAME', role=None, agent_num=None,
+                 match='exact'):
         # If the user sends the namespace "auto", use gilda to guess the
         # true ID and namespace.
         if namespace == 'AUTO':
@@ -1826,17 +3280,29 @@ class HasAgent(Query):
         self.role = role.upper() if isinstance(role, str) else role
         self.agent_num = agent_num
 
+        if match not in self.match_options:
+            raise ValueError(f"Invalid match option: {match}. Options are "
+                             f"{self.match_options}.")
+        self.match = match
+
         # Regularize ID based on Database optimization (e.g. striping prefixes)
         self.regularized_id = regularize_agent_id(agent_id, namespace)
         super(HasAgent, self).__init__()
 
     def _copy(self):
         return self.__class__(self.agent_id, self.namespace, self.role,
-                              self.agent_num)
+                              self.agent_num, self.match)
 
     def __str__(self):
         s = 'do not ' if self._inverted else ''
-        s += f"have an agent where {self.namespace}={self.agent_id}"
+        if self.match == 'prefix':
+            s += (f"have an agent where {self.namespace} starts with "
+                  f"{self.agent_id}")
+        elif self.match == 'substring':
+            s += (f"have an agent where {self.namespace} contains "
+                  f"{self.agent_id}")
+        else:
+            s += f"have an agent where {self.namespace}={self.agent_id}"
         if self.role is not None:
             s += f" with role={self.role}"
         elif self.agent_num is not None:
@@ -1846,7 +3312,15 @@ class HasAgent(Query):
     def _get_constraint_json(self) -> dict:
         return {'agent_id': self.agent_id, 'namespace': self.namespace,
                 '_regularized_id': self.regularized_id, 'role': self.role,
-                'agent_num': self.agent_num}
+                'agent_num': self.agent_num, 'match': self.match}
+
+    def _get_shape(self):
+        # Namespaces other than NAME and TEXT share a table.
+        ns = self.namespace if self.namespace in {'NAME', 'TEXT', None} \
+            else 'other'
+        return super(HasAgent, self)._get_shape() \
+            + (ns, self.role is not None, self.agent_num is not None,
+               self.match)
 
     def _get_table(self, ro):
         # The table used depends on the namespace.
@@ -1858,10 +3332,18 @@ class HasAgent(Query):
             meta = ro.OtherMeta
         return meta
 
+    def _get_id_clause(self, meta):
+        # Any wildcards in a prefix or substring are taken literally.
+        if self.match == 'prefix':
+            return meta.db_id.startswith(self.regularized_id, autoescape=True)
+        elif self.match == 'substring':
+            return meta.db_id.contains(self.regularized_id, autoescape=True)
+        return meta.db_id.like(self.regularized_id)
+
     def _get_hash_query(self, ro, inject_queries=None):
         # Get the base query and filter by regularized ID.
         meta = self._get_table(ro)
-        qry = self._base_query(ro).filter(meta.db_id.like(self.regularized_id))
+        qry = self._base_query(ro).filter(self._get_id_clause(meta))
 
         # If we aren't going to one of the special tables for NAME or TEXT, we
         # need to filter by namespace.
@@ -1894,10 +3376,50 @@ class HasAgent(Query):
             al = except_(self._base_query(ro), qry).alias('agent_exclude')
             qry = ro.session.query(al.c.mk_hash.label('mk_hash'),
                                    al.c.ev_count.label('ev_count'),
-                                   al.c.belief.label('belief'))
+                                   al.c.belief.label('belief'),
+                                   al.c.stmt_id.label('stmt_id'))
 
         return qry
 
+    def _get_index_hashes(self, agent_index):
+        # Patterns and namespace-free searches require the database.
+        if self._inverted or self.namespace is None \
+                or self.match != 'exact' or '%' in self.regularized_id:
+            return None
+        return agent_index.get_hashes(self.namespace, self.regularized_id,
+                                      self.role, self.agent_num)
+
+    def _get_bitmap(self, bitmap_index):
+        # Bitmaps are kept for agents regardless of role. Only name_meta has
+        # every statement, so only names are inverted against the whole set.
+        if self.namespace is None or self.match != 'exact' \
+                or '%' in self.regularized_id or self.role is not None \
+                or self.agent_num is not None \
+                or (self._inverted and self.namespace != 'NAME'):
+            return None
+        bitmap = bitmap_index.get_agent_bitmap(self.namespace,
+                                               self.regularized_id)
+        if bitmap is not None and self._inverted:
+            bitmap = bitmap_index.complement(bitmap)
+        return bitmap
+
+    def _get_aggregate_clause(self, meta):
+        # The agents of the aggregates are given by their names, and roles
+        # vary with statement type, so are not known for an agent group.
+        if self.namespace != 'NAME' or self.match != 'exact' \
+                or '%' in self.regularized_id or self.role is not None:
+            return None
+
+        if self.agent_num is not None:
+            clause = meta.agent_json.contains(
+                {str(self.agent_num): self.regularized_id}
+            )
+        else:
+            clause = meta.agent_names.contains([self.regularized_id])
+        if self._inverted:
+            clause = not_(clause)
+        return clause
+
 
 class _TextRefCore(Query):
     list_name = NotImplemented
@@ -1952,7 +3474,8 @@ class FromPapers(_TextRefCore):
     list_name = 'paper_list'
 
     def __init__(self, paper_list):
-        self.paper_list = tuple({tuple(pair) for pair in paper_list})
+        self.paper_list = tuple(sorted({tuple(pair) for pair in paper_list},
+                                       key=lambda pair: tuple(map(str, pair))))
         super(FromPapers, self).__init__(len(self.paper_list) == 0)
 
     def __str__(self) -> str:
@@ -1967,6 +3490,10 @@ class FromPapers(_TextRefCore):
     def _get_constraint_json(self) -> dict:
         return {'paper_list': self.paper_list}
 
+    def _get_shape(self):
+        return super(FromPapers, self)._get_shape() \
+            + tuple(id_type for id_type, _ in self.paper_list)
+
     def _get_table(self, ro):
         return ro.SourceMeta
 
@@ -2006,7 +3533,8 @@ class FromPapers(_TextRefCore):
 
         # Map the reading metadata query to mk_hashes with statement counts.
         qry = (self._base_query(ro)
-               .filter(ro.SourceMeta.mk_hash == ro.FastRawPaLink.mk_hash,
+               .filter(_get_stmt_key(ro, ro.SourceMeta)
+                       == _get_stmt_key(ro, ro.FastRawPaLink),
                        ro.FastRawPaLink.reading_id == sub_al.c.rid))
 
         if inject_queries is not None:
@@ -2067,7 +3595,7 @@ class FromMeshIds(_TextRefCore):
             return Union([c_obj, d_obj])
 
     def __init__(self, mesh_ids):
-        self.mesh_ids = tuple(set(mesh_ids))
+        self.mesh_ids = tuple(sorted(set(mesh_ids)))
         self._mesh_nums = []
         self._mesh_concept_nums = []
         self._mesh_type = None
@@ -2095,12 +3623,26 @@ class FromMeshIds(_TextRefCore):
                 '_mesh_nums': list(self._mesh_nums),
                 '_mesh_type': self._mesh_type}
 
+    def _get_shape(self):
+        return super(FromMeshIds, self)._get_shape() \
+            + (self._mesh_type, len(self.mesh_ids))
+
     def _get_table(self, ro):
         if self._mesh_type == "D":
             return ro.MeshTermMeta
         else:
             return ro.MeshConceptMeta
 
+    def _get_bitmap(self, bitmap_index):
+        bitmaps = [bitmap_index.get_mesh_bitmap(self._mesh_type, mesh_num)
+                   for mesh_num in self._mesh_nums]
+        if not bitmaps or any(bitmap is None for bitmap in bitmaps):
+            return None
+        bitmap = reduce(lambda a, b: a | b, bitmaps)
+        if self._inverted:
+            bitmap = bitmap_index.complement(bitmap)
+        return bitmap
+
     def _get_hash_query(self, ro, inject_queries=None):
         meta = self._get_table(ro)
         qry = self._base_query(ro)
@@ -2120,7 +3662,8 @@ class FromMeshIds(_TextRefCore):
             new_base = ro.session.query(
                 ro.SourceMeta.mk_hash.label('mk_hash'),
                 ro.SourceMeta.ev_count.label('ev_count'),
-                ro.SourceMeta.belief.label('belief')
+                ro.SourceMeta.belief.label('belief'),
+                _get_stmt_key(ro, ro.SourceMeta).label('stmt_id')
             )
             if inject_queries:
                 for tq in inject_queries:
@@ -2130,7 +3673,8 @@ class FromMeshIds(_TextRefCore):
             al = except_(new_base, qry).alias('mesh_exclude')
             qry = ro.session.query(al.c.mk_hash.label('mk_hash'),
                                    al.c.ev_count.label('ev_count'),
-                                   al.c.belief.label('belief'))
+                                   al.c.belief.label('belief'),
+                                   al.c.stmt_id.label('stmt_id'))
         return qry
 
     def ev_filter(self):
@@ -2179,7 +3723,7 @@ class IntrusiveQuery(Query):
     col_name = NotImplemented
 
     def __init__(self, value_list):
-        value_tuple = tuple([self.item_type(n) for n in value_list])
+        value_tuple = tuple(sorted({self.item_type(n) for n in value_list}))
         setattr(self, self.list_name, value_tuple)
         super(IntrusiveQuery, self).__init__(len(value_tuple) == 0)
 
@@ -2203,6 +3747,10 @@ class IntrusiveQuery(Query):
     def _get_constraint_json(self) -> dict:
         return {self.list_name: sorted(list(self._get_list()))}
 
+    def _get_shape(self):
+        return super(IntrusiveQuery, self)._get_shape() \
+            + (len(self._get_list()),)
+
     @classmethod
     def _from_constraint_json(cls, constraint_json):
         return cls(constraint_json[cls.list_name])
@@ -2238,6 +3786,10 @@ class IntrusiveQuery(Query):
         """
         return query.filter(self._get_clause(meta))
 
+    def _get_mask(self, snapshot):
+        return np.isin(snapshot.get_column(self.col_name),
+                       self._get_query_values(), invert=self._inverted)
+
     def _get_hash_query(self, ro, inject_queries=None):
         if inject_queries is not None \
                 and any(q.name == self.name for q in inject_queries):
@@ -2371,8 +3923,9 @@ class MergeQuery(Query):
     name = NotImplemented
 
     def __init__(self, query_list, *args, **kwargs):
-        # Make the collection of queries immutable.
-        self.queries = tuple(query_list)
+        # Make the collection of queries immutable, and put it in a canonical
+        # order, so equivalent queries produce the same JSON and SQL.
+        self.queries = tuple(sorted(query_list, key=_canonical_key))
 
         # This variable is used internally during the construction of the
         # joint query.
@@ -2389,6 +3942,15 @@ class MergeQuery(Query):
     def _copy(self):
         return self.__class__(self.queries)
 
+    def normalized(self):
+        # Once the children are normalized, building a new merge re-applies
+        # all the merging and folding logic of the constructor.
+        if self.full or self.empty:
+            return self.copy()
+        if len(self.queries) == 1:
+            return self.queries[0].normalized()
+        return self.__class__([q.normalized() for q in self.queries])
+
     def _get_table(self, ro):
         raise NotImplementedError()
 
@@ -2421,6 +3983,10 @@ class MergeQuery(Query):
     def _get_constraint_json(self) -> dict:
         return {'query_list': [q.to_json() for q in self.queries]}
 
+    def _get_shape(self):
+        return super(MergeQuery, self)._get_shape() \
+            + tuple(q._get_shape() for q in self.queries)
+
     @classmethod
     def _from_constraint_json(cls, constraint_json):
         query_list = [Query.from_json(qj)
@@ -2438,6 +4004,9 @@ class MergeQuery(Query):
         return mk_hashes_al.c.mk_hash,  mk_hashes_al.c.ev_count,\
                mk_hashes_al.c.belief
 
+    def _get_stmt_id_col(self, ro):
+        return self._get_table(ro).c.stmt_id
+
     def _get_hash_query(self, ro, inject_queries=None):
         self._injected_queries = inject_queries
         self._mk_hashes_al = None  # recalculate the join
@@ -2447,6 +4016,13 @@ class MergeQuery(Query):
             self._injected_queries = None
         return qry
 
+    def _get_indexed_queries(self):
+        # The hash queries of these are simple filters on a table, so they can
+        # be found, and scanned in order, with an index.
+        return [q for q in self.queries if not q._inverted
+                and isinstance(q, (HasAgent, SourceQuery, SourceIntersection,
+                                   IntrusiveQuery))]
+
     def _iter_ev_filters(self):
         """Iter over the evidence filters of sub-queries, skipping Nones."""
         for q in self.queries:
@@ -2529,12 +4105,14 @@ class Intersection(MergeQuery):
         filtered_queries = set()
         self._my_intrusive_queries = _QueryCollector()
         empty = False
-        all_full = True
+        query_list = _flatten_queries(query_list, Intersection)
+        all_full = all(query.full for query in query_list)
+        if not all_full:
+            # Full queries have no effect on an intersection.
+            query_list = [query for query in query_list if not query.full]
         for query in query_list:
             if query.empty:
                 empty = True
-            if not query.full:
-                all_full = False
             for C in mergeable_query_types:
                 # If this is any kind of source query, add it to a list to be
                 # merged with its own kind.
@@ -2621,6 +4199,76 @@ class Intersection(MergeQuery):
     def _merge(*queries):
         return intersect(*queries)
 
+    def _get_index_hashes(self, agent_index):
+        return self._combine_hash_arrays(
+            lambda q: q._get_index_hashes(agent_index)
+        )
+
+    def _get_fan_out_queries(self):
+        # Inverted queries are run un-inverted, and their hashes removed.
+        if all(q._inverted for q in self.queries):
+            return None
+        return [~q if q._inverted else q for q in self.queries]
+
+    def _get_top_k_drivers(self):
+        return self._get_indexed_queries()
+
+    def _combine_hash_arrays(self, get_hashes):
+        """Combine the hash arrays of the queries, from get_hashes(query)."""
+        # Intersect the positive queries, then remove the negative ones, as
+        # long as there is at least one positive query to start from.
+        pos_arrays = []
+        neg_arrays = []
+        for q in self.queries:
+            if q._inverted:
+                arr = get_hashes(~q)
+                neg_arrays.append(arr)
+            else:
+                arr = get_hashes(q)
+                pos_arrays.append(arr)
+            if arr is None:
+                return None
+        if not pos_arrays:
+            return None
+
+        # Start from the smallest array, to keep the intermediates small.
+        pos_arrays.sort(key=len)
+        hashes = pos_arrays[0]
+        for arr in pos_arrays[1:]:
+            hashes = np.intersect1d(hashes, arr, assume_unique=True)
+        for arr in neg_arrays:
+            hashes = np.setdiff1d(hashes, arr, assume_unique=True)
+        return hashes
+
+    def _get_mask(self, snapshot):
+        mask = np.ones(len(snapshot), dtype=bool)
+        for q in self.queries:
+            sub_mask = q._get_mask(snapshot)
+            if sub_mask is None:
+                return None
+            mask &= sub_mask
+        return mask
+
+    def _get_bitmap(self, bitmap_index):
+        bitmaps = []
+        for q in self.queries:
+            bitmap = q._get_bitmap(bitmap_index)
+            if bitmap is None:
+                return None
+            bitmaps.append(bitmap)
+
+        # Start from the smallest bitmap, to keep the intermediates small.
+        return reduce(lambda a, b: a & b, sorted(bitmaps, key=len))
+
+    def _get_aggregate_clause(self, meta):
+        clauses = []
+        for q in self.queries:
+            clause = q._get_aggregate_clause(meta)
+            if clause is None:
+                return None
+            clauses.append(clause)
+        return and_(*clauses)
+
     def _get_table(self, ro):
         # If we already did the work, just return the result.
         if self._mk_hashes_al is not None:
@@ -2677,7 +4325,8 @@ class Intersection(MergeQuery):
                     pos_sql = ro.session.query(
                         pos_tbl.c.mk_hash.label('mk_hash'),
                         pos_tbl.c.ev_count.label('ev_count'),
-                        pos_tbl.c.belief.label('belief')
+                        pos_tbl.c.belief.label('belief'),
+                        pos_tbl.c.stmt_id.label('stmt_id')
                     )
 
                 # Build a subquery out of the negative query or queries,
@@ -2694,7 +4343,8 @@ class Intersection(MergeQuery):
                     neg_sql = ro.session.query(
                         neg_tbl.c.mk_hash.label('mk_hash'),
                         neg_tbl.c.ev_count.label('ev_count'),
-                        neg_tbl.c.belief.label('belief')
+                        neg_tbl.c.belief.label('belief'),
+                        neg_tbl.c.stmt_id.label('stmt_id')
                     )
 
                 # Take the positive except the negative as our "table".
@@ -2804,11 +4454,12 @@ class Union(MergeQuery):
         merge_grps = defaultdict(list)
         intrusive_queries = []
         full = False
-        all_empty = True
+        query_list = _flatten_queries(query_list, Union)
+        all_empty = all(query.empty for query in query_list)
+        if not all_empty:
+            # Empty queries have no effect on a union.
+            query_list = [query for query in query_list if not query.empty]
         for query in query_list:
-            if not query.empty:
-                all_empty = False
-
             if any(isinstance(query, t) for t in mergeable_types):
                 merge_grps[query.__class__].append(query)
             else:
@@ -2885,6 +4536,51 @@ class Union(MergeQuery):
     def _merge(*queries):
         return union(*queries)
 
+    def _get_index_hashes(self, agent_index):
+        return self._combine_hash_arrays(
+            lambda q: q._get_index_hashes(agent_index)
+        )
+
+    def _get_fan_out_queries(self):
+        # The complement of a query cannot be found from its hashes.
+        if any(q._inverted for q in self.queries):
+            return None
+        return list(self.queries)
+
+    def _combine_hash_arrays(self, get_hashes):
+        """Combine the hash arrays of the queries, from get_hashes(query)."""
+        arrays = [get_hashes(q) for q in self.queries]
+        if any(arr is None for arr in arrays):
+            return None
+        return reduce(np.union1d, arrays)
+
+    def _get_mask(self, snapshot):
+        mask = np.zeros(len(snapshot), dtype=bool)
+        for q in self.queries:
+            sub_mask = q._get_mask(snapshot)
+            if sub_mask is None:
+                return None
+            mask |= sub_mask
+        return mask
+
+    def _get_bitmap(self, bitmap_index):
+        bitmaps = []
+        for q in self.queries:
+            bitmap = q._get_bitmap(bitmap_index)
+            if bitmap is None:
+                return None
+            bitmaps.append(bitmap)
+        return reduce(lambda a, b: a | b, bitmaps)
+
+    def _get_aggregate_clause(self, meta):
+        clauses = []
+        for q in self.queries:
+            clause = q._get_aggregate_clause(meta)
+            if clause is None:
+                return None
+            clauses.append(clause)
+        return or_(*clauses)
+
     def _get_table(self, ro):
         if self._mk_hashes_al is None:
             mk_hashes_q_list = []
@@ -3099,6 +4795,215 @@ class EvidenceFilter:
 
         return query
 
+    def get_exists_clause(self, ro, stmt_id_col):
+        """Get a clause true for hashes with evidence that passes the filter.
+
+        Applied to a query for hashes, this drops the hashes which would have
+        no evidence left after filtering, before they are ranked and limited.
+        The evidence is correlated with the query by the stmt_id_col.
+        """
+        ev_q = self.join_table(ro, ro.session.query(ro.FastRawPaLink.id),
+                               {'fast_raw_pa_link'})
+        ev_q = self.apply_filter(ro, ev_q)
+
+        # Only the statement is correlated with the outer query, even if the
+        # outer query uses some of the same tables (e.g. FromPapers).
+        inner_froms = ev_q.statement.froms
+        ev_sel = (ev_q.filter(_get_stmt_key(ro, ro.FastRawPaLink)
+                              == stmt_id_col)
+                  .statement
+                  .with_only_columns([literal_column('1')])
+                  .correlate_except(*inner_froms))
+        return exists(ev_sel)
+
+
+def _check_ev_filter_mode(evidence_filter_mode):
+    """Check the evidence filter mode, returning True if it is 'pushdown'."""
+    if evidence_filter_mode not in {'post', 'pushdown'}:
+        raise ValueError(f"Invalid evidence filter mode: "
+                         f"{evidence_filter_mode}.")
+    return evidence_filter_mode == 'pushdown'
+
+
+def _get_stmt_key(ro, table):
+    """Get the column by which the statements of a readonly table are joined.
+
+    This is the stmt_id, or the mk_hash in dumps built before the stmt_id was
+    added. Hash queries label either one `stmt_id`.
+    """
+    if ro.has_stmt_ids():
+        return table.stmt_id
+    return table.mk_hash
+
+
+def _get_hash_exists(ro, query, stmt_id_col):
+    """Get a clause that is true where a query has the stmt in stmt_id_col."""
+    hashes_sq = query.build_hash_query(ro).subquery()
+    return exists(select([literal_column('1')])
+                  .where(hashes_sq.c.stmt_id == stmt_id_col)
+                  .correlate_except(hashes_sq))
+
+
+def _execute_in_new_session(ro, selection, timeout=None, cancel_handle=None):
+    """Execute a selection on a new session, returning all the rows."""
+    session = ro.new_session()
+    if session is None:
+        raise IndraDbException("Could not open a new session: the readonly "
+                               "database is not available.")
+    try:
+        with query_limits(ro, timeout, cancel_handle, session=session):
+            return session.execute(selection).fetchall()
+    finally:
+        session.close()
+
+
+@routed
+def get_evidence(mk_hash, ro=None, limit=None, cursor=None,
+                 evidence_filter=None, timeout=None, cancel_handle=None):
+    """Get a page of the evidence of a statement.
+
+    The evidence is sorted by the ID of its raw statement, and each page seeks
+    directly past the last evidence of the one before, so the evidence of a
+    statement with tens of thousands of evidence may be read incrementally, at
+    a steady cost per page.
+
+    Parameters
+    ----------
+    mk_hash : int
+        The hash of the statement.
+    ro : Optional[DatabaseManager]
+        A database manager handle. The default is the primary readonly, as
+        indicated by environment variables or the config file.
+    limit : Optional[int]
+        The maximum number of evidence to return. By default, all the
+        (remaining) evidence is returned.
+    cursor : Optional[str]
+        The `next_cursor` of a previous result, to get the evidence after it.
+    evidence_filter : Optional[EvidenceFilter]
+        If given, only the evidence that passes the filter is returned.
+    timeout : Optional[float]
+        The maximum time, in seconds, each database statement may take.
+    cancel_handle : Optional[QueryCancelHandle]
+        A handle with which the query may be cancelled.
+
+    Returns
+    -------
+    result : EvidenceQueryResult
+        The evidence JSONs, keyed by the IDs of their raw statements, with
+        the total evidence count and belief of the statement.
+    """
+    if ro is None:
+        ro = get_ro('primary')
+    mk_hash = int(mk_hash)
+    query_json = HasHash([mk_hash]).to_json()
+
+    # If the database isn't available, route through the web service.
+    if ro is None:
+        if evidence_filter:
+            logger.warning("No direct R.O. access available, but passing "
+                           "of evidence filter through API not yet "
+                           "implemented.")
+        return _rest_get_evidence(mk_hash, limit, cursor)
+
+    with query_limits(ro, timeout, cancel_handle):
+        sm = ro.SourceMeta
+        stmt = (ro.session.query(_get_stmt_key(ro, sm).label('stmt_id'),
+                                 sm.ev_count, sm.belief)
+                .filter(sm.mk_hash == mk_hash)
+                .first())
+        if stmt is None:
+            return EvidenceQueryResult.empty(mk_hash, limit, query_json)
+
+        # Seek past the cursor in order of raw statement ID, which the
+        # (stmt_id, id) index of fast_raw_pa_link serves directly.
+        frp = ro.FastRawPaLink
+        ev_q = (ro.session.query(frp.id.label('raw_id'),
+                                 frp.raw_json.label('raw_json'),
+                                 frp.reading_id.label('rid'))
+                .filter(_get_stmt_key(ro, frp) == stmt.stmt_id))
+        if evidence_filter is not None:
+            ev_q = evidence_filter.join_table(ro, ev_q, {'fast_raw_pa_link'})
+            ev_q = evidence_filter.apply_filter(ro, ev_q)
+        ev_q = _seek_past_cursor(ev_q, [frp.id], cursor).order_by(frp.id)
+        if limit is not None:
+            ev_q = ev_q.limit(limit)
+        ev_al = ev_q.subquery('evidence')
+
+        ref_link_keys = [k for k in ro.ReadingRefLink.__dict__.keys()
+                         if not k.startswith('_')]
+        cols = [ev_al.c.raw_id, ev_al.c.raw_json]
+        cols += [getattr(ro.ReadingRefLink, k) for k in ref_link_keys]
+        selection = (select(cols)
+                     .select_from(ev_al.outerjoin(
+                         ro.ReadingRefLink,
+                         ro.ReadingRefLink.rid == ev_al.c.rid))
+                     .order_by(ev_al.c.raw_id))
+        logger.debug(f"Executing query (get_evidence):\n{selection}")
+        rows = ro.session.execute(selection).fetchall()
+
+    results = OrderedDict()
+    for row in rows:
+        ref_dict = dict(zip(ref_link_keys, row[2:]))
+        results[row[0]] = _get_evidence_json(row[1], ref_dict)
+
+    next_cursor = None
+    if rows:
+        next_cursor = _encode_cursor([rows[-1][0]])
+    return EvidenceQueryResult(results, limit, mk_hash,
+                               {mk_hash: stmt.ev_count},
+                               {mk_hash: stmt.belief}, query_json,
+                               next_cursor)
+
+
+def _rest_get_evidence(mk_hash, limit=None, cursor=None):
+    """Retrieve a page of the evidence of a statement from the remote API."""
+    logger.info("Using remote API to get evidence.")
+    url = get_config('INDRA_DB_REST_URL', failure_ok=False)
+    params = {}
+    if limit is not None:
+        params['limit'] = limit
+    if cursor is not None:
+        params['cursor'] = cursor
+    resp = requests.get(f'{url}/evidence/from_hash/{mk_hash}', params=params)
+    if resp.status_code != 200:
+        raise ApiError(f"REST API failed with ({resp.status_code}): "
+                       f"{resp.json()}")
+    return EvidenceQueryResult.from_json(resp.json())
+
+
+def _get_evidence_json(raw_json_bts, ref_dict):
+    """Get the evidence JSON from a raw statement JSON and its text refs."""
+    raw_json = loads_json(raw_json_bts)
+    ev_json = raw_json['evidence'][0]
+    if 'annotations' not in ev_json.keys():
+        ev_json['annotations'] = {}
+
+    # Add agents' raw text to annotations.
+    ev_json['annotations']['agents'] = \
+        {'raw_text': _get_raw_texts(raw_json)}
+
+    # Add prior UUIDs to the annotations
+    if 'prior_uuids' not in ev_json['annotations'].keys():
+        ev_json['annotations']['prior_uuids'] = []
+    ev_json['annotations']['prior_uuids'].append(raw_json['id'])
+
+    # Add and/or update text refs.
+    if 'text_refs' not in ev_json.keys():
+        ev_json['text_refs'] = {}
+    if ref_dict['pmid']:
+        ev_json['pmid'] = ref_dict['pmid']
+    elif 'PMID' in ev_json['text_refs']:
+        del ev_json['text_refs']['PMID']
+    ev_json['text_refs'].update({k.upper(): v
+                                 for k, v in ref_dict.items()
+                                 if v is not None})
+
+    # Add the source dictionary.
+    if ref_dict['source']:
+        ev_json['annotations']['content_source'] = ref_dict['source']
+
+    return ev_json
+
 
 def _get_raw_texts(stmt_json):
     raw_text = []
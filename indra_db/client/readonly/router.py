@@ -0,0 +1,274 @@
+__all__ = ['ReadonlyRouter', 'set_ro_router', 'get_ro_router', 'routed']
+
+import logging
+from time import time
+from functools import wraps
+from threading import Lock, Thread
+from contextlib import contextmanager
+from inspect import signature, isgeneratorfunction
+
+from sqlalchemy import create_engine
+from sqlalchemy.pool import NullPool
+from sqlalchemy.exc import OperationalError
+
+from indra_db.util import get_ro
+from indra_db.config import get_readonly_databases
+from indra_db.exceptions import IndraDbException
+
+logger = logging.getLogger(__name__)
+
+
+class ReadonlyRouter(object):
+    """Spread queries across several replicas of the readonly database.
+
+    Each query is sent to the healthy replica with the fewest queries
+    outstanding from this process. The replicas are pinged every
+    `health_interval` seconds, in a background thread so that no query waits
+    on a replica that is down, and a replica whose connection fails is taken
+    out of rotation until it answers a ping again.
+
+    Analytic queries, which stream or return all of their results (i.e.
+    `iter_statements`, or any call without a limit), may be pinned to a
+    replica of their own, so they do not hold up interactive queries. That
+    replica is then used by other queries only if no other is healthy.
+
+    Set the router with `set_ro_router`, and Query methods called without an
+    `ro` are routed.
+
+    Parameters
+    ----------
+    labels : list[str]
+        The labels of the readonly databases to route to, as in the config
+        file or INDRARO environment variables. They must all hold the same
+        dump.
+    analytic_label : Optional[str]
+        The label of the readonly database to which analytic queries are
+        pinned. By default, analytic queries are routed like any other.
+    health_interval : float
+        The number of seconds between health checks. Default is 30.
+    connect_timeout : int
+        The number of seconds a health check waits for a connection. Default
+        is 2.
+    """
+    def __init__(self, labels, analytic_label=None, health_interval=30,
+                 connect_timeout=2):
+        ro_urls = get_readonly_databases()
+        self.labels = []
+        for label in labels:
+            if label == 'primary' and 'override' in ro_urls:
+                label = 'override'
+            if label not in ro_urls:
+                raise ValueError(f"No such readonly database available: "
+                                 f"{label}. Check config file or environment "
+                                 f"variables.")
+            if label not in self.labels:
+                self.labels.append(label)
+        if analytic_label is not None:
+            if analytic_label == 'primary' and 'override' in ro_urls:
+                analytic_label = 'override'
+            if analytic_label not in ro_urls:
+                raise ValueError(f"No such readonly database available: "
+                                 f"{analytic_label}.")
+            if analytic_label in self.labels:
+                self.labels.remove(analytic_label)
+        self.analytic_label = analytic_label
+        self.health_interval = health_interval
+
+        all_labels = self.labels + ([analytic_label] if analytic_label else [])
+        if not all_labels:
+            raise ValueError("At least one readonly database is required.")
+        self._urls = {label: ro_urls[label] for label in all_labels}
+        self._ping_engines = {
+            label: create_engine(url, poolclass=NullPool,
+                                 connect_args={'connect_timeout':
+                                               connect_timeout})
+            for label, url in self._urls.items()
+        }
+        self._outstanding = dict.fromkeys(all_labels, 0)
+        self._healthy = dict.fromkeys(all_labels, True)
+        self._next = 0
+        self._last_check = 0
+        self._lock = Lock()
+        self._check_lock = Lock()
+
+    def check_health(self) -> dict:
+        """Ping each replica, and take those that fail out of rotation.
+
+        Returns
+        -------
+        healthy : dict
+            Whether each replica is healthy, by label.
+        """
+        healthy = {}
+        for label, engine in self._ping_engines.items():
+            try:
+                engine.execute('SELECT 1 AS ping;')
+                healthy[label] = True
+            except Exception as err:
+                logger.warning(f"Readonly replica {label} failed a health "
+                               f"check: {err}")
+                healthy[label] = False
+
+        with self._lock:
+            for label, is_healthy in healthy.items():
+                if is_healthy and not self._healthy[label]:
+                    logger.info(f"Readonly replica {label} is back in "
+                                f"rotation.")
+                self._healthy[label] = is_healthy
+            self._last_check = time()
+        return healthy
+
+    def _check_health_if_due(self):
+        if time() - self._last_check < self.health_interval:
+            return
+        # Only one check runs at a time, in the background; queries go on
+        # with the current state.
+        if not self._check_lock.acquire(blocking=False):
+            return
+        if time() - self._last_check < self.health_interval:
+            self._check_lock.release()
+            return
+        Thread(target=self._run_health_check, daemon=True).start()
+
+    def _run_health_check(self):
+        try:
+            self.check_health()
+        except Exception as err:
+            logger.exception(err)
+        finally:
+            self._check_lock.release()
+
+    def _mark_unhealthy(self, label):
+        with self._lock:
+            if self._healthy[label]:
+                logger.warning(f"Taking readonly replica {label} out of "
+                               f"rotation.")
+            self._healthy[label] = False
+
+    def _choose(self, analytic):
+        """Choose a replica, and count a query outstanding on it."""
+        with self._lock:
+            healthy = [label for label in self.labels if self._healthy[label]]
+            analytic_ok = self.analytic_label is not None \
+                and self._healthy[self.analytic_label]
+            if analytic and analytic_ok:
+                candidates = [self.analytic_label]
+            elif healthy:
+                candidates = healthy
+            elif analytic_ok:
+                candidates = [self.analytic_label]
+            else:
+                raise IndraDbException("No readonly replica is available.")
+
+            # Break ties in turn, so an idle router spreads its queries.
+            self._next += 1
+            start = self._next % len(candidates)
+            candidates = candidates[start:] + candidates[:start]
+            label = min(candidates, key=lambda lbl: self._outstanding[lbl])
+            self._outstanding[label] += 1
+        return label
+
+    def _release(self, label):
+        with self._lock:
+            self._outstanding[label] -= 1
+
+    @contextmanager
+    def acquire(self, analytic=False):
+        """Get a database manager for the replica chosen for a query.
+
+        Parameters
+        ----------
+        analytic : bool
+            If True, the query is analytic, and goes to the analytic replica
+            if there is one. Default is False.
+        """
+        self._check_health_if_due()
+        label = self._choose(analytic)
+        try:
+            ro = get_ro(label)
+            if ro is None:
+                self._mark_unhealthy(label)
+                raise IndraDbException(f"Readonly replica {label} is not "
+                                       f"available.")
+            logger.debug(f"Routing {'analytic ' if analytic else ''}query to "
+                         f"readonly replica {label}.")
+            yield ro
+        except OperationalError as err:
+            if err.connection_invalidated:
+                self._mark_unhealthy(label)
+            raise
+        finally:
+            self._release(label)
+
+    def get_status(self) -> dict:
+        """Get the health and number of outstanding queries of each replica."""
+        with self._lock:
+            return {label: {'healthy': self._healthy[label],
+                            'outstanding': self._outstanding[label],
+                            'analytic': label == self.analytic_label}
+                    for label in self._urls.keys()}
+
+
+_ro_router = None
+
+
+def set_ro_router(router):
+    """Set the router used to choose a readonly database for each query.
+
+    Parameters
+    ----------
+    router : Optional[ReadonlyRouter]
+        The router to use. If None, queries without an `ro` go to the primary
+        readonly database (the default).
+    """
+    global _ro_router
+    _ro_router = router
+
+
+def get_ro_router():
+    """Get the readonly router currently in use, if any."""
+    return _ro_router
+
+
+def routed(get_method):
+    """Decorate a function of `ro` to run it on a replica chosen by a router.
+
+    Calls are only routed if a router has been set with `set_ro_router`, and
+    no `ro` is given. Generators, and calls without a `limit`, are analytic.
+    """
+    method_sig = signature(get_method)
+    has_limit = 'limit' in method_sig.parameters
+
+    def bind(args, kwargs):
+        router = get_ro_router()
+        if router is None:
+            return None, None, False
+        bound = method_sig.bind(*args, **kwargs)
+        if bound.arguments.get('ro') is not None:
+            return None, None, False
+        analytic = isgeneratorfunction(get_method) \
+            or (has_limit and bound.arguments.get('limit') is None)
+        return router, bound, analytic
+
+    if isgeneratorfunction(get_method):
+        @wraps(get_method)
+        def iter_routed(*args, **kwargs):
+            router, bound, analytic = bind(args, kwargs)
+            if router is None:
+                yield from get_method(*args, **kwargs)
+                return
+            with router.acquire(analytic) as ro:
+                bound.arguments['ro'] = ro
+                yield from get_method(*bound.args, **bound.kwargs)
+        return iter_routed
+
+    @wraps(get_method)
+    def get_routed(*args, **kwargs):
+        router, bound, analytic = bind(args, kwargs)
+        if router is None:
+            return get_method(*args, **kwargs)
+        with router.acquire(analytic) as ro:
+            bound.arguments['ro'] = ro
+            return get_method(*bound.args, **bound.kwargs)
+
+    return get_routed
@@ -0,0 +1,223 @@
+__all__ = ['SourceMetaSnapshot']
+
+import os
+import json
+import logging
+from argparse import ArgumentParser
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from indra.util import batch_iter
+
+from indra_db.util import get_ro
+
+logger = logging.getLogger(__name__)
+
+
+class SourceMetaSnapshot(object):
+    """A columnar, memory-mapped copy of the readonly source_meta table.
+
+    Each column of source_meta is saved as a numpy array in a directory, with
+    the rows sorted by mk_hash. The per-source evidence counts are saved as
+    one array per source, with 0 where the source is absent (NULL in the
+    database). The only_src column is saved as the index of the source in the
+    snapshot's list of sources, or -1.
+
+    Queries made only of source and intrusive constraints (HasSources,
+    HasOnlySource, HasReadings, HasDatabases, HasHash, HasType, HasNumAgents,
+    HasNumEvidence, and their intersections and unions) can then be evaluated
+    as vectorized masks over the arrays, without a database connection.
+
+    Parameters
+    ----------
+    directory : str
+        The directory the snapshot was loaded from.
+    sources : list[str]
+        The names of the sources with count columns in the snapshot.
+    arrays : dict
+        The numpy arrays of the snapshot, by name.
+    dump_id : Optional[str]
+        The id of the readonly dump the snapshot was made from.
+    """
+    version = 1
+    column_dtypes = {'mk_hash': np.int64, 'ev_count': np.int32,
+                     'belief': np.float32, 'type_num': np.int16,
+                     'agent_count': np.int16, 'num_srcs': np.int16,
+                     'has_rd': np.bool_, 'has_db': np.bool_,
+                     'only_src': np.int16}
+    source_dtype = np.int32
+
+    def __init__(self, directory, sources, arrays, dump_id=None):
+        self.directory = directory
+        self.sources = sources
+        self.dump_id = dump_id
+        self._arrays = arrays
+
+    def __len__(self):
+        return len(self._arrays['mk_hash'])
+
+    @staticmethod
+    def _source_array_name(source):
+        return 'src_' + source
+
+    @classmethod
+    def load(cls, directory):
+        """Load (memory-map) a snapshot previously built in directory."""
+        with open(os.path.join(directory, 'snapshot.json'), 'r') as f:
+            snapshot_json = json.load(f)
+        if snapshot_json['version'] != cls.version:
+            raise ValueError(f"Snapshot in {directory} has version "
+                             f"{snapshot_json['version']}, but version "
+                             f"{cls.version} is required. Rebuild the "
+                             f"snapshot.")
+        sources = snapshot_json['sources']
+        names = list(cls.column_dtypes.keys()) \
+            + [cls._source_array_name(src) for src in sources]
+        arrays = {name: np.load(os.path.join(directory, name + '.npy'),
+                                mmap_mode='r')
+                  for name in names}
+        logger.info(f"Loaded source_meta snapshot from {directory} with "
+                    f"{len(arrays['mk_hash'])} statements.")
+        return cls(directory, sources, arrays, snapshot_json.get('dump_id'))
+
+    @classmethod
+    def build(cls, directory, ro=None, batch_size=100000):
+        """Copy source_meta from a readonly database into directory.
+
+        Parameters
+        ----------
+        directory : str
+            The directory in which the snapshot files are written. It is
+            created if it does not exist.
+        ro : Optional[DatabaseManager]
+            A database manager handle that has valid Readonly tables built. By
+            default, the primary readonly database is used.
+        batch_size : int
+            The number of rows streamed from the database at a time.
+        """
+        if ro is None:
+            ro = get_ro('primary')
+        os.makedirs(directory, exist_ok=True)
+        sources = sorted(ro.get_source_names())
+        source_codes = {src: i for i, src in enumerate(sources)}
+
+        sm = ro.SourceMeta
+        columns = list(cls.column_dtypes.keys())
+        sm_q = (ro.session.query(*[getattr(sm, col) for col in columns],
+                                 *[getattr(sm, src) for src in sources])
+                .order_by(sm.mk_hash))
+        num_rows = sm_q.count()
+        logger.info(f"Copying {num_rows} rows of source_meta with "
+                    f"{len(sources)} sources.")
+
+        arrays = []
+        for name in columns:
+            arrays.append(open_memmap(os.path.join(directory, name + '.npy'),
+                                      mode='w+', shape=(num_rows,),
+                                      dtype=cls.column_dtypes[name]))
+        for src in sources:
+            path = os.path.join(directory,
+                                cls._source_array_name(src) + '.npy')
+            arrays.append(open_memmap(path, mode='w+', shape=(num_rows,),
+                                      dtype=cls.source_dtype))
+
+        only_src_idx = columns.index('only_src')
+        pos = 0
+        for rows in batch_iter(sm_q.yield_per(batch_size), batch_size, list):
+            for i, (arr, values) in enumerate(zip(arrays, zip(*rows))):
+                if i == only_src_idx:
+                    values = [source_codes.get(v, -1) for v in values]
+                else:
+                    # Missing values (e.g. absent sources) are zero/False.
+                    values = [0 if v is None else v for v in values]
+                arr[pos:pos + len(rows)] = values
+            pos += len(rows)
+
+        for arr in arrays:
+            arr.flush()
+        with open(os.path.join(directory, 'snapshot.json'), 'w') as f:
+            json.dump({'version': cls.version, 'dump_id': ro.get_dump_id(),
+                       'sources': sources}, f)
+        logger.info(f"Snapshot of source_meta written to {directory}.")
+        return cls.load(directory)
+
+    def get_column(self, name) -> np.ndarray:
+        """Get the array of a column of source_meta, by its name."""
+        return self._arrays[name]
+
+    def get_source_counts(self, source) -> np.ndarray:
+        """Get the array of evidence counts from a source (0 if absent)."""
+        name = self._source_array_name(source)
+        if name not in self._arrays:
+            return np.zeros(len(self), dtype=self.source_dtype)
+        return self._arrays[name]
+
+    def get_source_code(self, source) -> int:
+        """Get the code of a source as used in the only_src array, or -1."""
+        try:
+            return self.sources.index(source)
+        except ValueError:
+            return -1
+
+    def get_mask(self, query) -> np.ndarray:
+        """Get a boolean array marking the rows that satisfy the query.
+
+        Raises a ValueError if the query includes constraints that cannot be
+        evaluated on the snapshot, such as agents or papers.
+        """
+        if query.empty:
+            return np.zeros(len(self), dtype=bool)
+        if query.full:
+            return np.ones(len(self), dtype=bool)
+        mask = query.normalized()._get_mask(self)
+        if mask is None:
+            raise ValueError(f"Query cannot be evaluated on a source_meta "
+                             f"snapshot: {query}")
+        return mask
+
+    def get_hashes(self, query, sort_by=None, limit=None) -> np.ndarray:
+        """Get the hashes of the statements that satisfy the query.
+
+        Parameters
+        ----------
+        query : Query
+            A query of only source and intrusive constraints.
+        sort_by : Optional[str]
+            If 'ev_count' or 'belief', sort the hashes (descending) by that
+            column and then by hash, as in `Query.get_hashes`. By default the
+            hashes are in ascending order.
+        limit : Optional[int]
+            The maximum number of hashes to return.
+        """
+        idx = np.flatnonzero(self.get_mask(query))
+        if sort_by is not None:
+            if sort_by not in {'ev_count', 'belief'}:
+                raise ValueError(f"Invalid sort option: {sort_by}.")
+            sort_vals = self._arrays[sort_by][idx]
+            hashes = self._arrays['mk_hash'][idx]
+            idx = idx[np.lexsort((hashes, sort_vals))[::-1]]
+        if limit is not None:
+            idx = idx[:limit]
+        return self._arrays['mk_hash'][idx]
+
+    def count(self, query) -> int:
+        """Get the number of statements that satisfy the query."""
+        return int(np.count_nonzero(self.get_mask(query)))
+
+
+def main():
+    parser = ArgumentParser(
+        description="Copy the source_meta table of the readonly database into "
+                    "a columnar snapshot of numpy arrays."
+    )
+    parser.add_argument('directory',
+                        help="The directory in which to save the snapshot.")
+    parser.add_argument('--readonly', default='primary',
+                        help="The label of the readonly database to copy.")
+    args = parser.parse_args()
+    SourceMetaSnapshot.build(args.directory, get_ro(args.readonly))
+
+
+if __name__ == '__main__':
+    main()
@@ -22,6 +22,20 @@ READONLY_ENV_PREFIX = 'INDRARO'
 S3_DUMP_ENV_VAR = 'INDRA_DB_S3_PREFIX'
 LAMBDA_NAME_ENV_VAR = 'DB_SERVICE_LAMBDA_NAME'
 TESTING_ENV_VAR = 'INDRA_DB_TESTING'
+POOL_ENV_PREFIX = 'INDRA_DB_POOL_'
+
+
+def _parse_bool(value):
+    return value.lower() == 'true'
+
+
+# The settings of the connection pools of the database managers, with the
+# types of their values. The timeouts and recycle time are in seconds, except
+# the statement_timeout, which is in milliseconds, and only applies to the
+# protected readonly managers.
+POOL_SETTINGS = {'size': int, 'max_overflow': int, 'timeout': float,
+                 'recycle': int, 'pre_ping': _parse_bool,
+                 'statement_timeout': int}
 
 
 logger = logging.getLogger('db_config')
@@ -78,6 +92,22 @@ def _get_urls_from_env(prefix):
             if k.startswith(prefix)}
 
 
+def _parse_pool_config(raw_config, source):
+    pool_config = {}
+    for key, value in raw_config.items():
+        if key not in POOL_SETTINGS:
+            logger.warning(f"Unknown pool setting in {source}: {key}")
+            continue
+        if not value:
+            continue
+        try:
+            pool_config[key] = POOL_SETTINGS[key](value)
+        except ValueError:
+            logger.warning(f"Invalid value of pool setting {key} in "
+                           f"{source}: {value}")
+    return pool_config
+
+
 def _load_config():
     global CONFIG
     assert isinstance(CONFIG, dict)
@@ -96,6 +126,12 @@ def _load_config():
             CONFIG.update(def_dict)
             continue
 
+        # Handle the connection pool settings.
+        if section == 'pool':
+            CONFIG['pool'].update(_parse_pool_config(def_dict,
+                                                     DB_CONFIG_PATH))
+            continue
+
         # Handle the case for the s3 bucket spec.
         if section.startswith('aws-'):
             CONFIG[section[4:]] = def_dict
@@ -118,6 +154,9 @@ def _load_env_config():
 
     CONFIG['databases'].update(_get_urls_from_env(PRINCIPAL_ENV_PREFIX))
     CONFIG['readonly'].update(_get_urls_from_env(READONLY_ENV_PREFIX))
+    CONFIG['pool'].update(_parse_pool_config(
+        _get_urls_from_env(POOL_ENV_PREFIX), 'environment'
+    ))
 
     if S3_DUMP_ENV_VAR in environ:
         bucket, prefix = environ[S3_DUMP_ENV_VAR].split(':')
@@ -140,7 +179,7 @@ def _load_env_config():
 def _load(include_config=True):
     global CONFIG
     CONFIG = {'databases': {}, 'readonly': {}, 's3_dump': {}, 'lambda': {},
-              'testing': False}
+              'pool': {}, 'testing': False}
     if CONFIG_EXISTS and include_config:
         _load_config()
     _load_env_config()
@@ -161,6 +200,14 @@ def get_readonly_databases(force_update=False, include_config=True):
     return CONFIG['readonly']
 
 
+def get_pool_config(force_update=False, include_config=True):
+    """Get the settings of the connection pools of the database managers."""
+    if not CONFIG or force_update:
+        _load(include_config)
+
+    return CONFIG['pool']
+
+
 def get_s3_dump(force_update=False, include_config=True):
     if not CONFIG or force_update:
         _load(include_config)
@@ -11,7 +11,7 @@ from io import BytesIO
 from numbers import Number
 from functools import wraps
 from datetime import datetime
-from time import sleep
+from time import sleep, time
 
 from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
 
@@ -21,12 +21,15 @@ from sqlalchemy.sql.expression import Delete, Update
 from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.ext.declarative import declarative_base, DeclarativeMeta
 from sqlalchemy import create_engine, inspect, UniqueConstraint, func
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, scoped_session, Session
+from sqlalchemy.pool import NullPool
 from sqlalchemy.orm.attributes import InstrumentedAttribute
 from sqlalchemy.engine.url import make_url
 
 from indra.util import batch_iter
-from indra_db.config import CONFIG, build_db_url, is_db_testing
+from indra_db.config import CONFIG, build_db_url, is_db_testing, \
+    get_pool_config
+from indra_db.pool import MeteredQueuePool, PoolMetrics
 from indra_db.schemas.mixins import IndraDBTableMetaClass
 from indra_db.util import S3Path
 from indra_db.exceptions import IndraDbException
@@ -198,6 +201,35 @@ def get_instance_attribute(attribute, instance_identifier):
     raise RdsInstanceNotFoundError(instance_identifier)
 
 
+def _get_engine_kwargs(url, with_statement_timeout=False):
+    """Get the arguments of create_engine for the configured pool.
+
+    The configured statement_timeout is only applied if
+    `with_statement_timeout` is True.
+    """
+    if url.get_backend_name() != 'postgresql':
+        return {}
+    pool_config = get_pool_config()
+    kwargs = {'poolclass': MeteredQueuePool}
+    for key, arg in [('size', 'pool_size'), ('max_overflow', 'max_overflow'),
+                     ('timeout', 'pool_timeout'), ('recycle', 'pool_recycle'),
+                     ('pre_ping', 'pool_pre_ping')]:
+        if key in pool_config:
+            kwargs[arg] = pool_config[key]
+    if with_statement_timeout and 'statement_timeout' in pool_config:
+        kwargs['connect_args'] = {
+            'options': f"-c statement_timeout="
+                       f"{pool_config['statement_timeout']}"
+        }
+    return kwargs
+
+
+class _ProtectedSession(Session):
+    """A session that will not write to the database."""
+    def flush(self, *args, **kwargs):
+        logger.error("Write not allowed!")
+
+
 class DatabaseManager(object):
     """An object used to access INDRA's database.
 
@@ -242,10 +274,10 @@ class DatabaseManager(object):
 
     def __init__(self, url, label=None, protected=False):
         self.url = make_url(url)
-        self.session = None
         self.label = label
         self.__protected = protected
         self._conn = None
+        self.__sessions = None
 
         # To stringify table classes, we must merge the two meta classes.
         class BaseMeta(DeclarativeMeta, IndraDBTableMetaClass):
@@ -257,6 +289,7 @@ class DatabaseManager(object):
         try:
             create_engine(
                 self.url,
+                poolclass=NullPool,
                 connect_args={'connect_timeout': 1}
             ).execute('SELECT 1 AS ping;')
         except Exception as err:
@@ -264,10 +297,44 @@ class DatabaseManager(object):
             self.available = False
             return
 
-        # Create the engine (connection manager).
-        self.__engine = create_engine(self.url)
+        # Create the engine (connection manager), with the pool configured in
+        # the config file or environment.
+        self.__engine = create_engine(
+            self.url,
+            **_get_engine_kwargs(self.url, self._limits_statements())
+        )
+        if isinstance(self.__engine.pool, MeteredQueuePool):
+            self.__engine.pool.metrics = \
+                PoolMetrics(label or self.url.database)
+
+        # Sessions are scoped to threads (see `session`).
+        if not self.__protected:
+            self.__session_factory = sessionmaker(bind=self.__engine)
+        else:
+            self.__session_factory = sessionmaker(bind=self.__engine,
+                                                  class_=_ProtectedSession,
+                                                  autoflush=False,
+                                                  autocommit=False)
+        self.__sessions = scoped_session(self.__session_factory)
         return
 
+    def _limits_statements(self):
+        """Check whether the configured statement_timeout applies here."""
+        return False
+
+    @property
+    def session(self):
+        """The session of the current thread.
+
+        Each thread has its own session, so a manager may be shared between
+        threads, e.g. those of a web service. A thread should call
+        `remove_session` when it is done with the database (e.g. at the end
+        of a request), to return its connection to the pool.
+        """
+        if self.__sessions is None:
+            return None
+        return self.__sessions()
+
     def _init_foreign_key_map(self, foreign_key_map):
         # There are some useful shortcuts that can be used if
         # networkx is available, specifically the DatabaseManager.link
@@ -384,21 +451,47 @@ class DatabaseManager(object):
         """Get an active session with the database."""
         if not self.available:
             return
-        if self.session is None or not self.session.is_active:
-            logger.debug('Attempting to get session...')
-            if not self.__protected:
-                DBSession = sessionmaker(bind=self.__engine)
-            else:
-                DBSession = sessionmaker(bind=self.__engine, autoflush=False,
-                                         autocommit=False)
-            logger.debug('Got session.')
-            self.session = DBSession()
-            if self.session is None:
-                raise IndraDbException("Failed to grab session.")
-            if self.__protected:
-                def no_flush(*a, **k):
-                    logger.error("Write not allowed!")
-                self.session.flush = no_flush
+        if not self.session.is_active:
+            logger.debug('Replacing inactive session...')
+            self.__sessions.remove()
+
+    def remove_session(self):
+        """Close the session of the current thread, releasing its connection.
+
+        The next use of `session` in the thread starts a new session.
+        """
+        if self.__sessions is not None:
+            self.__sessions.remove()
+
+    def new_session(self):
+        """Get a new session, separate from `self.session`.
+
+        Sessions draw their connections from the engine's pool, so this may be
+        used to run queries concurrently, e.g. from several threads. It is up
+        to the caller to close the session when done.
+        """
+        if not self.available:
+            return
+        return self.__session_factory()
+
+    def get_pool_status(self):
+        """Get the state and statistics of the connection pool.
+
+        Returns
+        -------
+        status : Optional[dict]
+            The size of the pool, the numbers of connections checked out,
+            checked in, and in overflow, and the counts of checkouts, overflow
+            events, and timeouts, with the total and maximum time spent
+            waiting for a connection. None if the pool is not metered (e.g.
+            for a database other than PostgreSQL).
+        """
+        if not self.available:
+            return None
+        pool = self.__engine.pool
+        if getattr(pool, 'metrics', None) is None:
+            return None
+        return pool.metrics.get_status(pool)
 
     def get_tables(self):
         """Get a list of available tables."""
@@ -455,6 +548,15 @@ class DatabaseManager(object):
             con.execute('CREATE SCHEMA IF NOT EXISTS %s;' % schema_name)
         return
 
+    def create_extension(self, extension_name):
+        """Install a postgres extension (e.g. pg_trgm), if not installed."""
+        if self.__protected:
+            logger.error("Running in protected mode, writes not allowed!")
+            return
+        with self.__engine.connect() as con:
+            con.execute('CREATE EXTENSION IF NOT EXISTS %s;' % extension_name)
+        return
+
     def drop_schema(self, schema_name, cascade=True):
         """Drop a schema (rather forcefully by default)"""
         if self.__protected:
@@ -1362,6 +1464,7 @@ class PrincipalDatabaseManager(DatabaseManager):
 
 class ReadonlyDatabaseManager(DatabaseManager):
     """This class represents the readonly database."""
+    dump_id_ttl = 60
     _instance_type = 'db.m5.xlarge'
     _instance_name_fmt = 'indradb-readonly-{name}'
     _db_name = 'indradb_readonly'
@@ -1382,6 +1485,15 @@ class ReadonlyDatabaseManager(DatabaseManager):
             else:
                 setattr(self, tbl.__name__, tbl)
         self.__non_source_cols = None
+        self.__active_tables = None
+        self.__has_stmt_ids = None
+        self.__dump_id = None
+        self.__dump_id_time = 0
+
+    def _limits_statements(self):
+        # Only the protected managers serve queries. The others build and
+        # load dumps, whose statements may rightly run for hours.
+        return self._DatabaseManager__protected
 
     def get_config_string(self):
         res = super(ReadonlyDatabaseManager, self).get_config_string()
@@ -1416,6 +1528,67 @@ class ReadonlyDatabaseManager(DatabaseManager):
         """
         return super(ReadonlyDatabaseManager, self).get_active_tables(schema)
 
+    def has_table(self, tbl_name):
+        """Check whether a readonly table exists in the installed dump.
+
+        Tables added to the schema since a dump was made are missing from it.
+        The active tables are looked up once, and again after a dump is
+        loaded.
+        """
+        if self.__active_tables is None:
+            self.__active_tables = set(self.get_active_tables())
+        return tbl_name in self.__active_tables
+
+    def has_stmt_ids(self):
+        """Check whether the installed dump numbers statements by stmt_id.
+
+        Dumps built before the stmt_id was added to the readonly schema lack
+        the column, and their statements are joined by mk_hash instead. This
+        is looked up once for each dump.
+        """
+        self.get_dump_id()
+        if self.__has_stmt_ids is None:
+            cols = inspect(self.__engine).get_columns('source_meta',
+                                                      schema='readonly')
+            self.__has_stmt_ids = any(col['name'] == 'stmt_id'
+                                      for col in cols)
+            if not self.__has_stmt_ids:
+                logger.warning("The installed readonly dump has no stmt_id "
+                               "column, so statements are joined by mk_hash. "
+                               "Rebuild the readonly schema to use it.")
+        return self.__has_stmt_ids
+
+    def get_dump_id(self, refresh=False):
+        """Get a string identifying the readonly dump that is installed.
+
+        The OID of the source_meta table changes whenever the readonly schema
+        is rebuilt or restored from a dump, distinguishing one from another.
+        The id is looked up at most every `dump_id_ttl` seconds, unless
+        `refresh` is True, and again after a dump is loaded. If it has
+        changed, what was known of the old dump (e.g. its source columns) is
+        forgotten.
+        """
+        if self.__dump_id is None or refresh \
+                or time() - self.__dump_id_time > self.dump_id_ttl:
+            oid = self.session.execute(
+                "SELECT 'readonly.source_meta'::regclass::oid"
+            ).scalar()
+            dump_id = \
+                f'{self.url.host}:{self.url.port}/{self.url.database}#{oid}'
+            if self.__dump_id is not None and dump_id != self.__dump_id:
+                logger.info(f"The installed dump has changed to {dump_id}.")
+                self._forget_dump()
+            self.__dump_id = dump_id
+            self.__dump_id_time = time()
+        return self.__dump_id
+
+    def _forget_dump(self):
+        """Forget what is known of the installed dump, once it changes."""
+        self.__active_tables = None
+        self.__has_stmt_ids = None
+        self.__SourceMeta.loaded = False
+        self.__PaStmtSrc.loaded = False
+
     def load_dump(self, dump_file, force_clear=True):
         """Load from a dump of the readonly schema on s3."""
         if self.__protected:
@@ -1431,6 +1604,14 @@ class ReadonlyDatabaseManager(DatabaseManager):
                 raise IndraDbException("Tables already exist and force_clear "
                                        "is False.")
 
+        # Extensions are not part of a schema dump, so make sure those used by
+        # the indices are installed.
+        extensions = {index.extension for tbl in self.tables.values()
+                      for index in tbl._indices
+                      if index.extension is not None}
+        for extension in extensions:
+            self.create_extension(extension)
+
         # Do the restore
         self.pg_restore(dump_file)
 
@@ -1438,5 +1619,14 @@ class ReadonlyDatabaseManager(DatabaseManager):
         logger.info("Running vacuuming.")
         self.vacuum()
 
+        # Any cached query results, and any index, are now out of date.
+        self.__dump_id = None
+        self._forget_dump()
+        from indra_db.client.readonly.cache import clear_result_cache
+        from indra_db.client.readonly.agent_index import set_agent_index
+        from indra_db.client.readonly.bitmap_index import set_bitmap_index
+        clear_result_cache()
+        set_agent_index(None)
+        set_bitmap_index(None)
         return
 
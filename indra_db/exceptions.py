@@ -14,3 +14,15 @@ class BadHashError(IndraDbException):
         self.bad_hash = mk_hash
         msg = 'The matches-key hash %s is not valid.' % mk_hash
         super(BadHashError, self).__init__(msg)
+
+
+class QueryTimeoutError(IndraDbException):
+    def __init__(self, timeout):
+        self.timeout = timeout
+        msg = 'The query did not complete within %s seconds.' % timeout
+        super(QueryTimeoutError, self).__init__(msg)
+
+
+class QueryCancelledError(IndraDbException):
+    def __init__(self):
+        super(QueryCancelledError, self).__init__('The query was cancelled.')
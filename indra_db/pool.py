@@ -0,0 +1,126 @@
+__all__ = ['MeteredQueuePool', 'PoolMetrics', 'set_pool_metrics_hook',
+           'get_pool_metrics_hook']
+
+import logging
+from time import time
+from threading import Lock
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+logger = logging.getLogger(__name__)
+
+
+class PoolMetrics(object):
+    """Statistics of the checkouts from a connection pool.
+
+    Each event is also passed to the metrics hook, if one has been set with
+    `set_pool_metrics_hook`, as `hook(label, event, value)`. The events are:
+
+    - 'wait': a connection was checked out, after waiting `value` seconds.
+    - 'overflow': a connection was opened beyond the size of the pool, so
+      that `value` connections are now in overflow.
+    - 'timeout': no connection was available after waiting `value` seconds.
+    - 'checkin': a connection was returned, leaving `value` checked out.
+
+    Parameters
+    ----------
+    label : str
+        The label of the database of the pool, passed to the hook.
+    """
+    def __init__(self, label):
+        self.label = label
+        self.checkouts = 0
+        self.overflows = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._lock = Lock()
+
+    def record(self, event, value):
+        """Record an event, and pass it to the metrics hook."""
+        with self._lock:
+            if event == 'wait':
+                self.checkouts += 1
+                self.total_wait += value
+                self.max_wait = max(self.max_wait, value)
+            elif event == 'overflow':
+                self.overflows += 1
+            elif event == 'timeout':
+                self.timeouts += 1
+                self.total_wait += value
+                self.max_wait = max(self.max_wait, value)
+
+        hook = get_pool_metrics_hook()
+        if hook is not None:
+            try:
+                hook(self.label, event, value)
+            except Exception as err:
+                logger.warning(f"Pool metrics hook failed on {event}: {err}")
+
+    def get_status(self, pool) -> dict:
+        """Get the current state of a pool, with the statistics so far."""
+        with self._lock:
+            return {'label': self.label, 'size': pool.size(),
+                    'checked_out': pool.checkedout(),
+                    'checked_in': pool.checkedin(),
+                    'overflow': max(pool.overflow(), 0),
+                    'checkouts': self.checkouts, 'overflows': self.overflows,
+                    'timeouts': self.timeouts, 'total_wait': self.total_wait,
+                    'max_wait': self.max_wait}
+
+
+class MeteredQueuePool(QueuePool):
+    """A QueuePool that records its checkouts in a PoolMetrics, if it has one.
+    """
+    metrics = None
+
+    def _do_get(self):
+        metrics = self.metrics
+        if metrics is None:
+            return super(MeteredQueuePool, self)._do_get()
+
+        overflow = max(self.overflow(), 0)
+        start = time()
+        try:
+            conn = super(MeteredQueuePool, self)._do_get()
+        except PoolTimeoutError:
+            metrics.record('timeout', time() - start)
+            raise
+        metrics.record('wait', time() - start)
+        if self.overflow() > overflow:
+            metrics.record('overflow', self.overflow())
+        return conn
+
+    def _do_return_conn(self, conn):
+        super(MeteredQueuePool, self)._do_return_conn(conn)
+        if self.metrics is not None:
+            self.metrics.record('checkin', self.checkedout())
+
+    def recreate(self):
+        pool = super(MeteredQueuePool, self).recreate()
+        pool.metrics = self.metrics
+        return pool
+
+
+_pool_metrics_hook = None
+
+
+def set_pool_metrics_hook(hook):
+    """Set a function to be called with each event of the connection pools.
+
+    Parameters
+    ----------
+    hook : Optional[callable]
+        A function taking the label of the database, the name of the event,
+        and its value (see `PoolMetrics`), e.g. to send them to a monitoring
+        service. It is called on the thread of the event, so it should be
+        quick. If None, no function is called (the default).
+    """
+    global _pool_metrics_hook
+    _pool_metrics_hook = hook
+
+
+def get_pool_metrics_hook():
+    """Get the pool metrics hook currently in use, if any."""
+    return _pool_metrics_hook
@@ -1,7 +1,11 @@
-__all__ = ['BtreeIndex', 'StringIndex']
+__all__ = ['BtreeIndex', 'StringIndex', 'GinIndex', 'TextPatternIndex',
+           'TrigramIndex']
 
 
 class BtreeIndex(object):
+    # The name of a postgres extension the index requires, if any.
+    extension = None
+
     def __init__(self, name, colname, opts=None, cluster=False):
         self.name = name
         self.colname = colname
@@ -17,3 +21,22 @@ class StringIndex(BtreeIndex):
         opts = 'COLLATE pg_catalog."en_US.utf8" varchar_ops ASC NULLS LAST'
         super().__init__(name, colname, opts)
 
+
+class GinIndex(BtreeIndex):
+    def __init__(self, name, colname, opts=None):
+        super().__init__(name, colname, opts)
+        self.definition = self.definition.replace('btree', 'gin', 1)
+
+
+class TextPatternIndex(BtreeIndex):
+    """An index for prefix (LIKE 'abc%') matching of a text column."""
+    def __init__(self, name, colname):
+        super().__init__(name, colname, 'text_pattern_ops')
+
+
+class TrigramIndex(GinIndex):
+    """An index for substring (LIKE '%abc%') matching of a text column."""
+    extension = 'pg_trgm'
+
+    def __init__(self, name, colname):
+        super().__init__(name, colname, 'gin_trgm_ops')
@@ -47,6 +47,8 @@ class IndraDBTable(metaclass=IndraDBTableMetaClass):
         full_name = cls.full_name(force_schema=True)
         sql = (f"CREATE INDEX {index.name} ON {full_name} "
                f"USING {index.definition} TABLESPACE pg_default;")
+        if index.extension is not None:
+            sql = f"CREATE EXTENSION IF NOT EXISTS {index.extension}; " + sql
         if commit:
             try:
                 cls.execute(db, sql)
@@ -219,8 +221,8 @@ class NamespaceLookup(ReadonlyTable):
     @classmethod
     def get_definition(cls):
         return ("SELECT db_id, ag_id, role_num, ag_num, type_num,\n"
-                "       mk_hash, ev_count, belief, activity, is_active,\n"
-                "       agent_count, is_complex_dup\n"
+                "       mk_hash, stmt_id, ev_count, belief, activity,\n"
+                "       is_active, agent_count, is_complex_dup\n"
                 "FROM readonly.pa_meta\n"
                 "WHERE db_name = '%s'" % cls.__dbname__)
 
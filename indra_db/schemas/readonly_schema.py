@@ -4,7 +4,7 @@ import logging
 
 from sqlalchemy import Column, Integer, String, BigInteger, Boolean,\
     SmallInteger
-from sqlalchemy.dialects.postgresql import BYTEA, JSON, JSONB, REAL
+from sqlalchemy.dialects.postgresql import BYTEA, JSON, JSONB, REAL, ARRAY
 
 from indra.statements import get_all_descendants, Statement
 
@@ -17,6 +17,7 @@ logger = logging.getLogger(__name__)
 
 CREATE_ORDER = [
     'raw_stmt_src',
+    'stmt_ids',
     'fast_raw_pa_link',
     'pa_agent_counts',
     'pa_stmt_src',
@@ -37,7 +38,9 @@ CREATE_ORDER = [
     'source_meta',
     'mesh_term_meta',
     'mesh_concept_meta',
-    'agent_interactions'
+    'agent_interactions',
+    'relation_aggregates',
+    'agent_stats'
 ]
 
 
@@ -107,27 +110,30 @@ def get_schema(Base):
 
     The following views must be built in this specific order (_temp_):
       1. raw_stmt_src
-      2. fast_raw_pa_link
-      3. pa_agent_counts
-      4. _pa_stmt_src_
-      5. evidence_counts
-      6. reading_ref_link
-      7. _pa_ref_link_
-      8. _mesh_terms_
-      9. _mesh_concepts_
-      10. _hash_pmid_counts_
-      11. mesh_term_ref_counts
-      12. mesh_concept_ref_counts
-      13. raw_stmt_mesh_terms
-      14. raw_stmt_mesh_concepts
-      15. _pa_meta_
-      16. source_meta
-      17. text_meta
-      18. name_meta
-      19. other_meta
-      20. mesh_term_meta
-      21. mesh_concept_meta
-      22. agent_interactions
+      2. stmt_ids
+      3. fast_raw_pa_link
+      4. pa_agent_counts
+      5. _pa_stmt_src_
+      6. evidence_counts
+      7. reading_ref_link
+      8. _pa_ref_link_
+      9. _mesh_terms_
+      10. _mesh_concepts_
+      11. _hash_pmid_counts_
+      12. mesh_term_ref_counts
+      13. mesh_concept_ref_counts
+      14. raw_stmt_mesh_terms
+      15. raw_stmt_mesh_concepts
+      16. _pa_meta_
+      17. source_meta
+      18. text_meta
+      19. name_meta
+      20. other_meta
+      21. mesh_term_meta
+      22. mesh_concept_meta
+      23. agent_interactions
+      24. relation_aggregates
+      25. agent_stats
     Note that the order of views below is determined not by the above
     order but by constraints imposed by use-case.
 
@@ -206,6 +212,7 @@ def get_schema(Base):
                           '       raw.reading_id\n,'
                           '       raw.db_info_id,\n'
                           '       pa.mk_hash,\n'
+                          '       ids.stmt_id,\n'
                           '       pa.json AS pa_json,\n'
                           '       type_num,\n'
                           '       raw_src.src\n'
@@ -213,13 +220,16 @@ def get_schema(Base):
                           '     pa_statements AS pa,\n'
                           '     raw_unique_links AS link,\n'
                           '     readonly.raw_stmt_src as raw_src,\n'
+                          '     readonly.stmt_ids as ids,\n'
                           '     type_map\n'
                           'WHERE link.raw_stmt_id = raw.id\n'
                           '  AND link.pa_stmt_mk_hash = pa.mk_hash\n'
+                          '  AND ids.mk_hash = pa.mk_hash\n'
                           '  AND raw_src.sid = raw.id\n'
                           '  AND pa.type = type_map.type')
         _skip_disp = ['raw_json', 'pa_json']
         _indices = [BtreeIndex('hash_index', 'mk_hash'),
+                    BtreeIndex('frp_stmt_id_idx', 'stmt_id, id'),
                     BtreeIndex('frp_reading_id_idx', 'reading_id'),
                     BtreeIndex('frp_db_info_id_idx', 'db_info_id'),
                     StringIndex('frp_src_idx', 'src')]
@@ -233,6 +243,7 @@ def get_schema(Base):
         reading_id = Column(BigInteger)
         db_info_id = Column(Integer)
         mk_hash = Column(BigInteger)
+        stmt_id = Column(Integer)
         pa_json = Column(BYTEA)
         type_num = Column(SmallInteger)
     ro_tables[FastRawPaLink.__tablename__] = FastRawPaLink
@@ -266,6 +277,22 @@ def get_schema(Base):
         src = Column(String)
     ro_tables[RawStmtSrc.__tablename__] = RawStmtSrc
 
+    class StmtIds(Base, ReadonlyTable):
+        __tablename__ = 'stmt_ids'
+        __table_args__ = {'schema': 'readonly'}
+        __definition__ = ('SELECT pa_stmt_mk_hash AS mk_hash,\n'
+                          '       CAST(row_number() OVER (\n'
+                          '         ORDER BY count(raw_stmt_id) DESC,\n'
+                          '                  pa_stmt_mk_hash DESC\n'
+                          '       ) AS INTEGER) AS stmt_id\n'
+                          'FROM raw_unique_links\n'
+                          'GROUP BY pa_stmt_mk_hash')
+        _indices = [BtreeIndex('stmt_ids_mk_hash_idx', 'mk_hash'),
+                    BtreeIndex('stmt_ids_stmt_id_idx', 'stmt_id')]
+        mk_hash = Column(BigInteger, primary_key=True)
+        stmt_id = Column(Integer)
+    ro_tables[StmtIds.__tablename__] = StmtIds
+
     class _PaStmtSrc(Base, SpecialColumnTable):
         __tablename__ = 'pa_stmt_src'
         __table_args__ = {'schema': 'readonly'}
@@ -468,15 +495,18 @@ def get_schema(Base):
             'SELECT pa_agents.db_name, pa_agents.db_id,\n'
             '       pa_agents.id AS ag_id, role_num, pa_agents.ag_num,\n'
             '       type_num, pa_statements.mk_hash,\n'
+            '       readonly.stmt_ids.stmt_id,\n'
             '       readonly.evidence_counts.ev_count, readonly.belief.belief,\n'
             '       activity, is_active, agent_count, false AS is_complex_dup\n'
             'FROM pa_agents, pa_statements, readonly.pa_agent_counts, type_map,'
-            '  role_map, readonly.belief, readonly.evidence_counts'
+            '  role_map, readonly.stmt_ids, readonly.belief,'
+            '  readonly.evidence_counts'
             '  LEFT JOIN pa_activity'
             '  ON readonly.evidence_counts.mk_hash = pa_activity.stmt_mk_hash\n'
             'WHERE pa_agents.stmt_mk_hash = pa_statements.mk_hash\n'
             '  AND pa_statements.mk_hash = readonly.evidence_counts.mk_hash\n'
             '  AND pa_statements.mk_hash = readonly.belief.mk_hash\n'
+            '  AND pa_statements.mk_hash = readonly.stmt_ids.mk_hash\n'
             '  AND readonly.pa_agent_counts.mk_hash = pa_agents.stmt_mk_hash\n'
             '  AND pa_statements.type = type_map.type\n'
             '  AND pa_agents.role = role_map.role\n'
@@ -492,6 +522,7 @@ def get_schema(Base):
         role_num = Column(SmallInteger)
         type_num = Column(SmallInteger)
         mk_hash = Column(BigInteger, primary_key=True)
+        stmt_id = Column(Integer)
         ev_count = Column(Integer)
         belief = Column(REAL)
         activity = Column(String)
@@ -509,8 +540,9 @@ def get_schema(Base):
                     f'SELECT db_name, db_id, ag_id,\n '
                     f'  generate_series(-1, 1, 2) AS role_num,\n'
                     f'  generate_series(0, 1) AS ag_num,\n'
-                    f'  type_num, mk_hash, ev_count, belief, activity,\n'
-                    f'  is_active, agent_count, true AS is_complex_dup\n'
+                    f'  type_num, mk_hash, stmt_id, ev_count, belief,\n'
+                    f'  activity, is_active, agent_count,\n'
+                    f'  true AS is_complex_dup\n'
                     f'FROM readonly.pa_meta\n'
                     f'WHERE type_num = {ro_type_map.get_int("Complex")}\n')
             if commit:
@@ -537,12 +569,13 @@ def get_schema(Base):
             '    FROM readonly.pa_stmt_src\n'
             '),'
             'meta AS ('
-            '    SELECT distinct mk_hash, type_num, activity, is_active,\n'
-            '                    ev_count, belief, agent_count'
+            '    SELECT distinct mk_hash, stmt_id, type_num, activity,\n'
+            '                    is_active, ev_count, belief, agent_count'
             '    FROM readonly.name_meta'
             '    WHERE NOT is_complex_dup'
             ')\n'
             'SELECT readonly.pa_stmt_src.*, \n'
+            '       meta.stmt_id, \n'
             '       meta.ev_count, \n'
             '       meta.belief, \n'
             '       meta.type_num, \n'
@@ -582,13 +615,19 @@ def get_schema(Base):
             '  ON diversity.mk_hash = meta.mk_hash'
         )
         _indices = [BtreeIndex('source_meta_mk_hash_idx', 'mk_hash'),
+                    BtreeIndex('source_meta_stmt_id_idx', 'stmt_id'),
                     StringIndex('source_meta_only_src_idx', 'only_src'),
                     StringIndex('source_meta_activity_idx', 'activity'),
                     BtreeIndex('source_meta_type_num_idx', 'type_num'),
-                    BtreeIndex('source_meta_num_srcs_idx', 'num_srcs')]
+                    BtreeIndex('source_meta_num_srcs_idx', 'num_srcs'),
+                    BtreeIndex('source_meta_ev_count_mk_hash_idx',
+                               'ev_count, mk_hash'),
+                    BtreeIndex('source_meta_belief_mk_hash_idx',
+                               'belief, mk_hash')]
         loaded = False
 
         mk_hash = Column(BigInteger, primary_key=True)
+        stmt_id = Column(Integer)
         ev_count = Column(Integer)
         belief = Column(REAL)
         num_srcs = Column(Integer)
@@ -622,15 +661,23 @@ def get_schema(Base):
         __table_args__ = {'schema': 'readonly'}
         __dbname__ = 'TEXT'
         _indices = [StringIndex('text_meta_db_id_idx', 'db_id'),
+                    TextPatternIndex('text_meta_db_id_prefix_idx', 'db_id'),
+                    TrigramIndex('text_meta_db_id_trgm_idx', 'db_id'),
                     BtreeIndex('text_meta_type_num_idx', 'type_num'),
                     StringIndex('text_meta_activity_idx', 'activity'),
-                    BtreeIndex('text_meta_mk_hash_idx', 'mk_hash')]
+                    BtreeIndex('text_meta_mk_hash_idx', 'mk_hash'),
+                    BtreeIndex('text_meta_stmt_id_idx', 'stmt_id'),
+                    BtreeIndex('text_meta_db_id_ev_count_idx',
+                               'db_id, ev_count, mk_hash'),
+                    BtreeIndex('text_meta_db_id_belief_idx',
+                               'db_id, belief, mk_hash')]
         ag_id = Column(Integer, primary_key=True)
         ag_num = Column(Integer)
         db_id = Column(String)
         role_num = Column(SmallInteger)
         type_num = Column(SmallInteger)
         mk_hash = Column(BigInteger)
+        stmt_id = Column(Integer)
         ev_count = Column(Integer)
         belief = Column(REAL)
         activity = Column(String)
@@ -646,13 +693,19 @@ def get_schema(Base):
         _indices = [StringIndex('name_meta_db_id_idx', 'db_id'),
                     BtreeIndex('name_meta_type_num_idx', 'type_num'),
                     StringIndex('name_meta_activity_idx', 'activity'),
-                    BtreeIndex('name_meta_mk_hash_idx', 'mk_hash')]
+                    BtreeIndex('name_meta_mk_hash_idx', 'mk_hash'),
+                    BtreeIndex('name_meta_stmt_id_idx', 'stmt_id'),
+                    BtreeIndex('name_meta_db_id_ev_count_idx',
+                               'db_id, ev_count, mk_hash'),
+                    BtreeIndex('name_meta_db_id_belief_idx',
+                               'db_id, belief, mk_hash')]
         ag_id = Column(Integer, primary_key=True)
         ag_num = Column(Integer)
         db_id = Column(String)
         role_num = Column(SmallInteger)
         type_num = Column(SmallInteger)
         mk_hash = Column(BigInteger)
+        stmt_id = Column(Integer)
         ev_count = Column(Integer)
         belief = Column(REAL)
         activity = Column(String)
@@ -665,16 +718,23 @@ def get_schema(Base):
         __tablename__ = 'other_meta'
         __table_args__ = {'schema': 'readonly'}
         __definition__ = ("SELECT db_name, db_id, ag_id, role_num, ag_num,\n"
-                          "       type_num, mk_hash, ev_count, belief,\n"
+                          "       type_num, mk_hash, stmt_id, ev_count, belief,\n"
                           "       activity, is_active, agent_count,\n"
                           "       is_complex_dup\n"
                           "FROM readonly.pa_meta\n"
                           "WHERE db_name NOT IN ('NAME', 'TEXT')")
         _indices = [StringIndex('other_meta_db_id_idx', 'db_id'),
+                    TextPatternIndex('other_meta_db_id_prefix_idx', 'db_id'),
+                    TrigramIndex('other_meta_db_id_trgm_idx', 'db_id'),
                     BtreeIndex('other_meta_type_num_idx', 'type_num'),
                     StringIndex('other_meta_db_name_idx', 'db_name'),
                     StringIndex('other_meta_activity_idx', 'activity'),
-                    BtreeIndex('other_meta_mk_hash_idx', 'mk_hash')]
+                    BtreeIndex('other_meta_mk_hash_idx', 'mk_hash'),
+                    BtreeIndex('other_meta_stmt_id_idx', 'stmt_id'),
+                    BtreeIndex('other_meta_db_id_ev_count_idx',
+                               'db_id, db_name, ev_count, mk_hash'),
+                    BtreeIndex('other_meta_db_id_belief_idx',
+                               'db_id, db_name, belief, mk_hash')]
         ag_id = Column(Integer, primary_key=True)
         ag_num = Column(Integer)
         db_name = Column(String)
@@ -682,6 +742,7 @@ def get_schema(Base):
         role_num = Column(SmallInteger)
         type_num = Column(SmallInteger)
         mk_hash = Column(BigInteger)
+        stmt_id = Column(Integer)
         ev_count = Column(Integer)
         belief = Column(REAL)
         activity = Column(String)
@@ -693,9 +754,9 @@ def get_schema(Base):
     class MeshTermMeta(Base, ReadonlyTable):
         __tablename__ = 'mesh_term_meta'
         __table_args__ = {'schema': 'readonly'}
-        __definition__ = ("SELECT DISTINCT meta.mk_hash, meta.ev_count,\n"
-                          "       meta.belief, mesh_num, type_num, activity,\n"
-                          "       is_active, agent_count\n"
+        __definition__ = ("SELECT DISTINCT meta.mk_hash, meta.stmt_id,\n"
+                          "       meta.ev_count, meta.belief, mesh_num,\n"
+                          "       type_num, activity, is_active, agent_count\n"
                           "FROM readonly.raw_stmt_mesh_terms AS rsmt,\n"
                           "     readonly.source_meta AS meta,\n"
                           "     raw_unique_links AS link\n"
@@ -704,9 +765,11 @@ def get_schema(Base):
         _indices = [BtreeIndex('mesh_term_meta_mesh_num_idx', 'mesh_num',
                                cluster=True),
                     BtreeIndex('mesh_term_meta_mk_hash_idx', 'mk_hash'),
+                    BtreeIndex('mesh_term_meta_stmt_id_idx', 'stmt_id'),
                     BtreeIndex('mesh_term_meta_type_num_idx', 'type_num'),
                     StringIndex('mesh_term_meta_activity_idx', 'activity')]
         mk_hash = Column(BigInteger, primary_key=True)
+        stmt_id = Column(Integer)
         mesh_num = Column(Integer, primary_key=True)
         tr_count = Column(Integer)
         ev_count = Column(Integer)
@@ -720,9 +783,9 @@ def get_schema(Base):
     class MeshConceptMeta(Base, ReadonlyTable):
         __tablename__ = 'mesh_concept_meta'
         __table_args__ = {'schema': 'readonly'}
-        __definition__ = ("SELECT DISTINCT meta.mk_hash, meta.ev_count,\n"
-                          "       meta.belief, mesh_num, type_num, activity,\n"
-                          "       is_active, agent_count\n"
+        __definition__ = ("SELECT DISTINCT meta.mk_hash, meta.stmt_id,\n"
+                          "       meta.ev_count, meta.belief, mesh_num,\n"
+                          "       type_num, activity, is_active, agent_count\n"
                           "FROM readonly.raw_stmt_mesh_concepts AS rsmc,\n"
                           "     readonly.source_meta AS meta,\n"
                           "     raw_unique_links AS link\n"
@@ -730,9 +793,11 @@ def get_schema(Base):
                           "  AND meta.mk_hash = link.pa_stmt_mk_hash")
         _indices = [BtreeIndex('mesh_concept_meta_mesh_num_idx', 'mesh_num'),
                     BtreeIndex('mesh_concept_meta_mk_hash_idx', 'mk_hash'),
+                    BtreeIndex('mesh_concept_meta_stmt_id_idx', 'stmt_id'),
                     BtreeIndex('mesh_concept_meta_type_num_idx', 'type_num'),
                     StringIndex('mesh_concept_meta_activity_idx', 'activity')]
         mk_hash = Column(BigInteger, primary_key=True)
+        stmt_id = Column(Integer)
         mesh_num = Column(Integer, primary_key=True)
         tr_count = Column(Integer)
         ev_count = Column(Integer)
@@ -748,6 +813,7 @@ def get_schema(Base):
         __table_args__ = {'schema': 'readonly'}
         __definition__ = ("SELECT\n" 
                           "  low_level_names.mk_hash AS mk_hash, \n"
+                          "  low_level_names.stmt_id AS stmt_id, \n"
                           "  jsonb_object(\n"
                           "    array_agg(\n"
                           "      CAST(\n"
@@ -768,6 +834,7 @@ def get_schema(Base):
                           "  (\n"
                           "    SELECT \n"
                           "      readonly.name_meta.mk_hash AS mk_hash, \n"
+                          "      readonly.name_meta.stmt_id AS stmt_id, \n"
                           "      readonly.name_meta.db_id AS db_id, \n"
                           "      readonly.name_meta.ag_num AS ag_num, \n"
                           "      readonly.name_meta.type_num AS type_num, \n"
@@ -781,12 +848,13 @@ def get_schema(Base):
                           "      readonly.name_meta, \n"
                           "      readonly.source_meta\n"
                           "    WHERE \n"
-                          "      readonly.name_meta.mk_hash \n"
-                          "        = readonly.source_meta.mk_hash\n"
+                          "      readonly.name_meta.stmt_id \n"
+                          "        = readonly.source_meta.stmt_id\n"
                           "      AND NOT readonly.name_meta.is_complex_dup"
                           "  ) AS low_level_names \n"
                           "GROUP BY \n"
                           "  low_level_names.mk_hash, \n"
+                          "  low_level_names.stmt_id, \n"
                           "  low_level_names.type_num, \n"
                           "  low_level_names.agent_count, \n"
                           "  low_level_names.ev_count, \n"
@@ -795,6 +863,7 @@ def get_schema(Base):
                           "  low_level_names.is_active, \n"
                           "  CAST(low_level_names.src_json AS JSONB)")
         _indices = [BtreeIndex('agent_interactions_mk_hash_idx', 'mk_hash'),
+                    BtreeIndex('agent_interactions_stmt_id_idx', 'stmt_id'),
                     BtreeIndex('agent_interactions_agent_json_idx', 'agent_json'),
                     BtreeIndex('agent_interactions_type_num_idx', 'type_num')]
         _always_disp = ['mk_hash', 'agent_json']
@@ -817,16 +886,19 @@ def get_schema(Base):
                     new_agent_json = {str(i): interaction.agent_json[j]
                                       for i, j in enumerate(pair)}
                     new_interactions.append(
-                        (interaction.mk_hash, interaction.ev_count,
-                         interaction.belief, interaction.type_num, 2,
-                         new_agent_json, interaction.src_json, True)
+                        (interaction.mk_hash, interaction.stmt_id,
+                         interaction.ev_count, interaction.belief,
+                         interaction.type_num, 2, new_agent_json,
+                         interaction.src_json, True)
                     )
             db.copy('readonly.agent_interactions', new_interactions,
-                    ('mk_hash', 'ev_count', 'belief', 'type_num', 'agent_count',
-                     'agent_json', 'src_json', 'is_complex_dup'))
+                    ('mk_hash', 'stmt_id', 'ev_count', 'belief', 'type_num',
+                     'agent_count', 'agent_json', 'src_json',
+                     'is_complex_dup'))
             return
 
         mk_hash = Column(BigInteger, primary_key=True)
+        stmt_id = Column(Integer)
         ev_count = Column(Integer)
         belief = Column(REAL)
         type_num = Column(SmallInteger)
@@ -838,6 +910,134 @@ def get_schema(Base):
         is_complex_dup = Column(Boolean)
     ro_tables[AgentInteractions.__tablename__] = AgentInteractions
 
+    # The source counts of each group are summed key by key, by unpacking the
+    # source JSONs of the group aggregated by the outer query.
+    merged_src_json = ("  (SELECT jsonb_object_agg(srcs.src, srcs.cnt)\n"
+                       "   FROM (\n"
+                       "     SELECT s.key AS src, sum(CAST(s.value AS INTEGER))\n"
+                       "       AS cnt\n"
+                       "     FROM unnest(array_agg(ai.src_json)) AS j(src_json),\n"
+                       "          jsonb_each_text(j.src_json) AS s\n"
+                       "     GROUP BY s.key\n"
+                       "   ) AS srcs\n"
+                       "  ) AS src_json, \n")
+    agent_names = ("  ARRAY(\n"
+                   "    SELECT value FROM jsonb_each_text(ai.agent_json)\n"
+                   "  ) AS agent_names \n")
+
+    class RelationAggregates(Base, ReadonlyTable):
+        __tablename__ = 'relation_aggregates'
+        __table_args__ = {'schema': 'readonly'}
+        __definition__ = ("SELECT\n"
+                          "  ai.agent_json, \n"
+                          "  ai.type_num, \n"
+                          "  ai.agent_count, \n"
+                          "  ai.activity, \n"
+                          "  ai.is_active, \n"
+                          "  sum(ai.ev_count) AS ev_count, \n"
+                          "  max(ai.belief) AS belief, \n"
+                          + merged_src_json +
+                          "  array_agg(ai.mk_hash) AS mk_hashes, \n"
+                          + agent_names +
+                          "FROM readonly.agent_interactions AS ai\n"
+                          "WHERE ai.is_complex_dup IS NOT TRUE\n"
+                          "GROUP BY \n"
+                          "  ai.agent_json, \n"
+                          "  ai.type_num, \n"
+                          "  ai.agent_count, \n"
+                          "  ai.activity, \n"
+                          "  ai.is_active")
+        _indices = [BtreeIndex('relation_aggregates_ev_count_idx',
+                               'ev_count DESC, type_num, agent_json'),
+                    BtreeIndex('relation_aggregates_belief_idx',
+                               'belief DESC, type_num, agent_json'),
+                    GinIndex('relation_aggregates_agent_names_idx',
+                             'agent_names'),
+                    GinIndex('relation_aggregates_agent_json_idx',
+                             'agent_json', 'jsonb_path_ops')]
+        _always_disp = ['agent_json', 'type_num']
+        agent_json = Column(JSONB, primary_key=True)
+        type_num = Column(SmallInteger, primary_key=True)
+        agent_count = Column(Integer, primary_key=True)
+        activity = Column(String, primary_key=True)
+        is_active = Column(Boolean, primary_key=True)
+        ev_count = Column(BigInteger)
+        belief = Column(REAL)
+        src_json = Column(JSONB)
+        mk_hashes = Column(ARRAY(BigInteger))
+        agent_names = Column(ARRAY(String))
+    ro_tables[RelationAggregates.__tablename__] = RelationAggregates
+
+    class AgentStats(Base, ReadonlyTable):
+        __tablename__ = 'agent_stats'
+        __table_args__ = {'schema': 'readonly'}
+        __definition__ = (
+            "WITH stmts AS (\n"
+            "  SELECT db_name, db_id, stmt_id, \n"
+            "         max(ev_count) AS ev_count, max(belief) AS belief,\n"
+            "         array_agg(DISTINCT ag_num)\n"
+            "           FILTER (WHERE NOT is_complex_dup) AS ag_nums,\n"
+            "         array_agg(DISTINCT role_num)\n"
+            "           FILTER (WHERE NOT is_complex_dup) AS role_nums\n"
+            "  FROM readonly.pa_meta\n"
+            "  GROUP BY db_name, db_id, stmt_id\n"
+            "), partners AS (\n"
+            "  SELECT db_name, db_id, partner, count(*) AS num_stmts,\n"
+            "         sum(ev_count) AS ev_count,\n"
+            "         row_number() OVER (\n"
+            "           PARTITION BY db_name, db_id\n"
+            "           ORDER BY sum(ev_count) DESC, partner\n"
+            "         ) AS rank\n"
+            "  FROM (\n"
+            "    SELECT DISTINCT s.db_name, s.db_id, s.stmt_id, s.ev_count,\n"
+            "           nm.db_id AS partner\n"
+            "    FROM stmts AS s\n"
+            "      JOIN readonly.name_meta AS nm\n"
+            "        ON nm.stmt_id = s.stmt_id\n"
+            "        AND NOT nm.is_complex_dup\n"
+            "        AND NOT nm.ag_num = ANY(s.ag_nums)\n"
+            "  ) AS stmt_partners\n"
+            "  GROUP BY db_name, db_id, partner\n"
+            "), top_partners AS (\n"
+            "  SELECT db_name, db_id,\n"
+            "         jsonb_agg(\n"
+            "           jsonb_build_array(partner, num_stmts, ev_count)\n"
+            "           ORDER BY rank\n"
+            "         ) AS top_partners\n"
+            "  FROM partners\n"
+            "  WHERE rank <= 10\n"
+            "  GROUP BY db_name, db_id\n"
+            ")\n"
+            "SELECT s.db_name, s.db_id,\n"
+            "       count(*) AS num_stmts,\n"
+            "       sum(s.ev_count) AS ev_count,\n"
+            "       max(s.belief) AS max_belief,\n"
+            "       jsonb_build_object(\n"
+            "         'SUBJECT', count(*) FILTER (WHERE -1 = ANY(s.role_nums)),\n"
+            "         'OTHER', count(*) FILTER (WHERE 0 = ANY(s.role_nums)),\n"
+            "         'OBJECT', count(*) FILTER (WHERE 1 = ANY(s.role_nums))\n"
+            "       ) AS role_counts,\n"
+            "       coalesce(tp.top_partners, CAST('[]' AS jsonb))\n"
+            "         AS top_partners\n"
+            "FROM stmts AS s\n"
+            "  LEFT JOIN top_partners AS tp\n"
+            "    ON tp.db_name = s.db_name AND tp.db_id = s.db_id\n"
+            "GROUP BY s.db_name, s.db_id, tp.top_partners"
+        )
+        _indices = [BtreeIndex('agent_stats_db_id_idx', 'db_id, db_name'),
+                    TextPatternIndex('agent_stats_db_id_prefix_idx', 'db_id'),
+                    BtreeIndex('agent_stats_ev_count_idx',
+                               'db_name, ev_count DESC, db_id')]
+        _always_disp = ['db_name', 'db_id']
+        db_name = Column(String, primary_key=True)
+        db_id = Column(String, primary_key=True)
+        num_stmts = Column(Integer)
+        ev_count = Column(BigInteger)
+        max_belief = Column(REAL)
+        role_counts = Column(JSONB)
+        top_partners = Column(JSONB)
+    ro_tables[AgentStats.__tablename__] = AgentStats
+
     return ro_tables
 
 
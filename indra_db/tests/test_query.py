@@ -1,15 +1,49 @@
+import os
 import json
 import random
+import sqlite3
+import tempfile
+import threading
+import asyncio
 from collections import defaultdict
 from itertools import combinations, permutations, product
 
+import numpy as np
+from sqlalchemy import MetaData, Table, Column, Integer, BigInteger, \
+    String, desc, select
+from sqlalchemy.orm import Query as OrmQuery
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.dialects import postgresql
+
 from indra.statements import Agent, get_statement_by_name, get_all_descendants, \
     Complex
-from indra_db.client.readonly.query import QueryResult
+from indra_db.client.readonly.query import QueryResult, RelationSQL, \
+    _seek_past_cursor, _make_cursor, _decode_cursor
 from indra_db.schemas.readonly_schema import ro_type_map, ro_role_map, \
     SOURCE_GROUPS
-from indra_db.util import extract_agent_data, get_ro
+from indra_db.util import extract_agent_data, get_ro, loads_json, dumps_json
 from indra_db.client.readonly.query import *
+from indra_db.client.readonly.cache import MemoryResultCache, \
+    DiskResultCache, set_result_cache, get_result_cache
+from indra_db.client.readonly.aio import AsyncReadonlyDatabase
+from indra_db.client.readonly.limits import QueryCancelHandle
+from indra_db.client.readonly.batch import run_batch
+from indra_db.client.readonly.agent_index import AgentIndex, \
+    set_agent_index, get_agent_index, rank_hashes
+from indra_db.client.readonly.bitmap_index import HashBitmapIndex, \
+    set_bitmap_index, get_bitmap_index
+from indra_db.client.readonly.snapshot import SourceMetaSnapshot
+from indra_db.client.readonly.prepared import PreparedQueryCache, \
+    set_prepared_cache, _scan_statement
+from indra_db.client.readonly.agent_stats import get_agent_summary, \
+    get_agent_completions
+from indra_db.client.readonly.router import ReadonlyRouter, set_ro_router, \
+    routed
+from indra_db.exceptions import QueryTimeoutError, QueryCancelledError, \
+    IndraDbException
+from indra_db.pool import MeteredQueuePool, PoolMetrics, \
+    set_pool_metrics_hook
+from indra_db.util.constructors import release_ro_sessions
 
 from indra_db.tests.util import get_temp_db
 
@@ -850,3 +884,830 @@ def test_belief_sorting_intersection():
 def test_belief_sorting_union():
     q = HasAgent('MEK', namespace='NAME') | HasAgent('MAP2K1', namespace='NAME')
     _check_belief_sorted_result(q)
+
+
+def test_cursor_paging():
+    ro = get_ro('primary')
+    query = HasAgent('TP53') - HasOnlySource('medscan')
+    for sort_by in ['ev_count', 'belief']:
+        # Get the first two pages using the offset, and using the cursor.
+        res = query.get_hashes(ro, limit=50, sort_by=sort_by)
+        assert res.next_cursor is not None
+        off_res = query.get_hashes(ro, limit=50, offset=50, sort_by=sort_by)
+        cur_res = query.get_hashes(ro, limit=50, sort_by=sort_by,
+                                   cursor=res.next_cursor)
+        assert cur_res.results == off_res.results
+        assert not cur_res.results & res.results
+
+    # Check that the statements and meta data results can also be paged.
+    res = query.get_statements(ro, limit=10, ev_limit=1)
+    cur_res = query.get_statements(ro, limit=10, ev_limit=1,
+                                   cursor=res.json()['next_cursor'])
+    assert len(cur_res.results) == 10
+    assert not set(cur_res.results) & set(res.results)
+
+    res = query.get_relations(ro, limit=10)
+    cur_res = query.get_relations(ro, limit=10, cursor=res.next_cursor)
+    assert not set(cur_res.results) & set(res.results)
+
+    res = query.get_interactions(ro, limit=10)
+    cur_res = query.get_interactions(ro, limit=10, cursor=res.next_cursor)
+    assert not set(cur_res.results) & set(res.results)
+
+
+def test_cursor_seek():
+    tbl = Table('tbl', MetaData(), Column('ev_count', Integer),
+                Column('mk_hash', BigInteger))
+    query = OrmQuery([tbl.c.ev_count, tbl.c.mk_hash])
+
+    def get_sql(q):
+        return str(q.statement.compile(dialect=postgresql.dialect()))
+
+    order = [desc(tbl.c.ev_count), desc(tbl.c.mk_hash)]
+    cursor = _make_cursor(order, {'ev_count': 7, 'mk_hash': -12})
+    assert _decode_cursor(cursor, 2) == [7, -12]
+    assert _seek_past_cursor(query, order) is query
+
+    # A uniform order is sought with a row comparison...
+    sql = get_sql(_seek_past_cursor(query, order, cursor))
+    assert '(tbl.ev_count, tbl.mk_hash) <' in sql, sql
+
+    # ...and a mixed order with a lexicographic one.
+    mixed = [desc(tbl.c.ev_count), tbl.c.mk_hash]
+    sql = get_sql(_seek_past_cursor(query, mixed, cursor))
+    assert 'tbl.ev_count <' in sql and 'tbl.mk_hash >' in sql, sql
+    assert ' OR ' in sql, sql
+
+    # Cursors of another order, or garbage, are rejected.
+    for bad_cursor in [_make_cursor(order[:1], {'ev_count': 7}), '!!!']:
+        try:
+            _seek_past_cursor(query, order, bad_cursor)
+            assert False, f"Cursor {bad_cursor} was accepted."
+        except ValueError:
+            pass
+
+
+def test_short_statement_page_cursor():
+    # A statement was dropped for lack of evidence, but the page of ranked
+    # hashes was full, so there may be another page.
+    res = StatementQueryResult({1: {'evidence': []}}, 2, 4, {1: 3}, {1: 0.5},
+                               0, {1: {}}, {}, 'cursor', num_ranked=2)
+    assert res.next_cursor == 'cursor'
+    assert res.next_offset == 6
+    res_copy = QueryResult.from_json(res.json())
+    assert res_copy.next_cursor == 'cursor'
+    assert res_copy.next_offset == 6
+
+    # If fewer hashes were ranked than the limit, that was the last page.
+    res = StatementQueryResult({1: {'evidence': []}}, 2, 4, {1: 3}, {1: 0.5},
+                               0, {1: {}}, {}, 'cursor')
+    assert res.next_cursor is None
+    assert res.next_offset is None
+
+
+def test_memory_result_cache():
+    cache = MemoryResultCache(max_bytes=1000)
+    cache.put('a', {'x': 'a' * 400})
+    cache.put('b', {'x': 'b' * 400})
+    assert cache.get('a') == {'x': 'a' * 400}
+
+    # Adding another large entry should evict the least recently used.
+    cache.put('c', {'x': 'c' * 400})
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    assert cache.size <= 1000
+
+    # Entries larger than the whole cache are not stored.
+    cache.put('d', {'x': 'd' * 2000})
+    assert cache.get('d') is None
+
+    cache.clear()
+    assert cache.get('a') is None
+
+
+def test_disk_result_cache():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = DiskResultCache(tmp_dir, max_bytes=2000)
+        cache.put('a', {'x': 'a' * 800})
+        cache.put('b', {'x': 'b' * 800})
+        assert cache.get('a') == {'x': 'a' * 800}
+
+        # Make 'a' the least recently used, so it is evicted first.
+        os.utime(os.path.join(tmp_dir, 'a.pkl'), (0, 0))
+        cache.put('c', {'x': 'c' * 800})
+        assert cache.get('a') is None
+        assert cache.get('b') is not None
+        assert cache.get('c') is not None
+
+        # Entries larger than the whole cache are not stored.
+        cache.put('d', {'x': 'd' * 4000})
+        assert cache.get('d') is None
+
+
+def test_cached_query_results():
+    ro = get_ro('primary')
+    query = HasAgent('TP53') - HasOnlySource('medscan')
+    set_result_cache(MemoryResultCache())
+    try:
+        res1 = query.get_statements(ro, limit=10, ev_limit=2)
+        res2 = query.get_statements(ro, limit=10, ev_limit=2)
+        assert get_result_cache().hits == 1
+        assert res1.json() == res2.json()
+
+        # Different parameters should not get the cached result.
+        res3 = query.get_statements(ro, limit=10, ev_limit=3)
+        assert get_result_cache().hits == 1
+        assert res3.returned_evidence > res1.returned_evidence
+    finally:
+        set_result_cache(None)
+
+
+def test_query_normalization():
+    a = HasAgent('TP53')
+    b = HasAgent('MEK', namespace='FPLX')
+    c = HasType(['Phosphorylation', 'Activation'])
+
+    # Nesting and ordering should not matter.
+    q1 = Intersection([a, Intersection([b, a]), c])
+    q2 = Intersection([c, b, a])
+    assert q1.to_json() == q2.to_json()
+    assert (a | b | c).to_json() == (c | (b | a)).to_json()
+    assert HasType(['Activation', 'Phosphorylation']).to_json() == c.to_json()
+
+    # Constants should be folded away.
+    full = ~HasHash([])
+    empty = HasHash([])
+    assert full.full and empty.empty
+    assert Intersection([a, full]).normalized() == a
+    assert Union([a, empty]).normalized() == a
+    assert Intersection([a, EmptyQuery(), b]) == Intersection([a, b])
+    assert (~~a).normalized().to_json() == a.to_json()
+    assert (~(~a | ~b)).normalized().to_json() == (a & b).to_json()
+
+
+def test_iter_statements():
+    ro = get_ro('primary')
+    query = HasAgent('TP53') - HasOnlySource('medscan')
+    res = query.get_statements(ro, limit=20, ev_limit=3)
+    stmt_jsons = list(query.iter_statements(ro, batch_size=7, limit=20,
+                                            ev_limit=3))
+    assert len(stmt_jsons) == len(res.results)
+    assert {int(s['matches_hash']) for s in stmt_jsons} == set(res.results)
+    for stmt_json in stmt_jsons:
+        h = int(stmt_json['matches_hash'])
+        assert len(stmt_json['evidence']) == len(res.results[h]['evidence'])
+
+
+def test_two_phase_statements():
+    ro = get_ro('primary')
+    query = HasAgent('TP53') - HasOnlySource('medscan')
+    for ev_limit in [None, 0, 2]:
+        res = query.get_statements(ro, limit=15, ev_limit=ev_limit)
+        tp_res = query.get_statements(ro, limit=15, ev_limit=ev_limit,
+                                      strategy='two_phase')
+        assert set(tp_res.results) == set(res.results)
+        assert tp_res.returned_evidence == res.returned_evidence
+        assert tp_res.evidence_counts == res.evidence_counts
+        assert tp_res.next_cursor == res.next_cursor
+
+
+def test_json_helpers():
+    obj = {123: {'text': 'ERK → MEK', 'evidence': [1, 2.5, None]}}
+    dumped = dumps_json(obj)
+    assert json.loads(dumped) == json.loads(json.dumps(obj))
+    assert loads_json(dumped.encode('utf-8')) == {'123': obj[123]}
+
+
+def test_async_queries():
+    ro = get_ro('primary')
+    queries = [HasAgent('TP53') - HasOnlySource('medscan'),
+               HasAgent('MEK', namespace='FPLX')]
+
+    async def get_results():
+        async with AsyncReadonlyDatabase(ro) as ro_async:
+            return await asyncio.gather(
+                *[q.aget_hashes(ro_async, limit=20) for q in queries],
+                *[q.aget_statements(ro_async, limit=5, ev_limit=2)
+                  for q in queries]
+            )
+
+    results = asyncio.get_event_loop().run_until_complete(get_results())
+    for query, res in zip(queries, results[:2]):
+        sync_res = query.get_hashes(ro, limit=20)
+        assert res.results == sync_res.results
+        assert res.next_cursor == sync_res.next_cursor
+    for query, res in zip(queries, results[2:]):
+        sync_res = query.get_statements(ro, limit=5, ev_limit=2)
+        assert set(res.results) == set(sync_res.results)
+        assert res.returned_evidence == sync_res.returned_evidence
+
+
+def test_explain_query():
+    ro = get_ro('primary')
+    query = HasAgent('TP53') - HasOnlySource('medscan')
+    plan_info = query.explain(ro, limit=10, ev_limit=5)
+    for key in ['hash_query', 'content_query']:
+        assert plan_info[key]['rows'] >= 0
+        assert plan_info[key]['cost'] > 0
+    assert len(plan_info['components']) == 2
+
+    analyzed = query.explain(ro, analyze=True, limit=10)
+    assert 'actual_time' in analyzed['hash_query']
+
+    cost = query.estimate_cost(ro, limit=10, ev_limit=5)
+    assert cost == plan_info['content_query']['cost']
+    assert query.estimate_cost(ro, 'hashes', limit=10) > 0
+    assert HasHash([]).estimate_cost(ro) == 0
+
+
+def test_query_timeout():
+    ro = get_ro('primary')
+    query = HasReadings() | HasDatabases()
+    try:
+        query.get_statements(ro, ev_limit=10, timeout=0.001)
+        assert False, "Query did not time out."
+    except QueryTimeoutError:
+        pass
+
+    # The session should still be usable, without the timeout.
+    res = HasAgent('TP53').get_hashes(ro, limit=10, timeout=60)
+    assert len(res.results) == 10
+
+
+def test_query_cancel():
+    ro = get_ro('primary')
+    query = HasReadings() | HasDatabases()
+    cancel_handle = QueryCancelHandle()
+    timer = threading.Timer(0.5, cancel_handle.cancel)
+    timer.start()
+    try:
+        query.get_statements(ro, ev_limit=10, cancel_handle=cancel_handle)
+        assert False, "Query was not cancelled."
+    except QueryCancelledError:
+        pass
+    finally:
+        timer.cancel()
+    assert cancel_handle.cancelled
+
+
+def test_query_count():
+    ro = get_ro('primary')
+    query = HasAgent('TP53') - HasOnlySource('medscan')
+    res = query.get_hashes(ro)
+    assert query.count(ro) == len(res.results)
+    assert query.count(ro, exact=False) > 0
+    assert HasHash([]).count(ro) == 0
+
+
+def test_run_batch():
+    ro = get_ro('primary')
+    queries = [HasAgent('TP53') & HasAgent('MDM2'),
+               HasAgent('MEK', namespace='FPLX') & HasAgent('ERK',
+                                                            namespace='FPLX'),
+               HasHash([]),
+               HasAgent('TP53') - HasOnlySource('medscan')]
+    results = run_batch(queries, ro, limit=20, batch_size=2)
+    assert len(results) == len(queries)
+    for query, res in zip(queries, results):
+        single_res = query.get_hashes(ro, limit=20)
+        assert res.results == single_res.results
+        assert res.next_cursor == single_res.next_cursor
+
+    counts = run_batch(queries, ro, result_type='count')
+    assert counts == [q.count(ro) for q in queries]
+
+
+def test_rank_hashes():
+    hashes = np.array([1, 2, 3, 4], dtype=np.int64)
+    ev_counts = np.array([5, 7, 7, 1], dtype=np.int32)
+    beliefs = np.array([0.5, 0.1, 0.9, 0.3], dtype=np.float32)
+
+    # Ties in the sort value are broken by hash, descending.
+    ranked, ranked_evs, _ = rank_hashes(hashes, ev_counts, beliefs,
+                                        'ev_count')
+    assert ranked.tolist() == [3, 2, 1, 4]
+    assert ranked_evs.tolist() == [7, 7, 5, 1]
+    ranked, _, ranked_beliefs = rank_hashes(hashes, ev_counts, beliefs,
+                                            'belief')
+    assert ranked.tolist() == [3, 1, 4, 2]
+    assert ranked_beliefs[0] == beliefs[2]
+
+    assert rank_hashes(hashes, ev_counts, beliefs, 'ev_count', limit=2,
+                       offset=1)[0].tolist() == [2, 1]
+
+    # Paging by the last row matches paging by offset, even within a tie.
+    assert rank_hashes(hashes, ev_counts, beliefs, 'ev_count',
+                       after=(7, 3))[0].tolist() == [2, 1, 4]
+    assert rank_hashes(hashes, ev_counts, beliefs, 'belief',
+                       after=(float(beliefs[0]), 1))[0].tolist() == [4, 2]
+
+
+def test_agent_index():
+    ro = get_ro('primary')
+    queries = [HasAgent('TP53'),
+               HasAgent('TP53', role='SUBJECT'),
+               HasAgent('MEK', namespace='FPLX') & HasAgent('ERK',
+                                                            namespace='FPLX'),
+               HasAgent('TP53') & ~HasAgent('MDM2'),
+               HasAgent('MDM2') | HasAgent('CDKN1A')]
+    sql_results = [(q.get_hashes(ro, limit=20, sort_by=sort_by), sort_by)
+                   for q in queries for sort_by in ['ev_count', 'belief']]
+
+    with tempfile.TemporaryDirectory() as index_dir:
+        index = AgentIndex.build(index_dir, ro)
+        assert index.dump_id == ro.get_dump_id()
+        set_agent_index(AgentIndex.load(index_dir))
+        try:
+            for sql_res, sort_by in sql_results:
+                query = Query.from_json(sql_res.query_json)
+                assert query.normalized()._get_index_hashes(index) is not None
+                res = query.get_hashes(ro, limit=20, sort_by=sort_by)
+                assert res.results == sql_res.results
+                assert res.evidence_counts == sql_res.evidence_counts
+                assert res.belief_scores == sql_res.belief_scores
+                assert res.next_cursor == sql_res.next_cursor
+
+            # Queries the index cannot answer fall back to the database.
+            query = HasAgent('TP53') & HasOnlySource('reach')
+            assert query.normalized()._get_index_hashes(index) is None
+            assert query.get_hashes(ro, limit=5).results
+
+            # An index of another dump is ignored.
+            assert get_agent_index(ro) is not None
+            index.dump_id = 'another dump'
+            set_agent_index(index)
+            assert get_agent_index(ro) is None
+        finally:
+            set_agent_index(None)
+
+
+def test_source_meta_snapshot():
+    ro = get_ro('primary')
+    queries = [HasSources(['reach', 'sparser']),
+               ~HasSources(['reach']),
+               HasOnlySource('signor'),
+               HasReadings() & ~HasDatabases(),
+               HasType(['Phosphorylation', 'Activation']) & HasNumAgents([2]),
+               HasNumEvidence([1, 2]) | HasOnlySource('medscan'),
+               HasHash([]) | HasDatabases()]
+
+    with tempfile.TemporaryDirectory() as snapshot_dir:
+        snapshot = SourceMetaSnapshot.build(snapshot_dir, ro)
+        assert len(snapshot) == ro.session.query(ro.SourceMeta).count()
+        for query in queries:
+            hashes = snapshot.get_hashes(query)
+            assert set(hashes.tolist()) == query.get_hashes(ro).results, \
+                query
+            assert snapshot.count(query) == len(hashes)
+
+            sql_res = query.get_hashes(ro, limit=10, sort_by='ev_count')
+            top_hashes = snapshot.get_hashes(query, 'ev_count', 10)
+            assert set(top_hashes.tolist()) == sql_res.results
+
+        # Queries on agents need the database.
+        try:
+            snapshot.get_mask(HasAgent('TP53') & HasReadings())
+            assert False, "Agent query should not be evaluated."
+        except ValueError:
+            pass
+
+
+def test_aggregate_tables():
+    ro = get_ro('primary')
+    queries = [HasAgent('TP53'),
+               HasAgent('MDM2', agent_num=1),
+               HasAgent('TP53') & HasAgent('MDM2'),
+               HasAgent('TP53') & ~HasAgent('MDM2')]
+    for query in queries:
+        assert query._get_aggregate_filter(ro.RelationAggregates) is not None
+
+        res = query.get_relations(ro, limit=10, with_hashes=True)
+        results, ev_counts, beliefs, _, _ = \
+            query._run_meta_sql(RelationSQL(ro), ro, 10, None, 'ev_count',
+                                True)
+        assert list(res.results.keys()) == list(results.keys()), query
+        assert res.evidence_counts == ev_counts
+        assert res.belief_scores == beliefs
+        for key, rel in results.items():
+            agg_rel = res.results[key]
+            assert agg_rel['source_counts'] == rel['source_counts']
+            assert set(agg_rel['hashes']) == set(rel['hashes'])
+
+    # Groundings and roles are not part of the aggregates.
+    assert HasAgent('TP53', namespace='HGNC')\
+        ._get_aggregate_filter(ro.RelationAggregates) is None
+    assert HasAgent('TP53', role='SUBJECT')\
+        ._get_aggregate_filter(ro.RelationAggregates) is None
+
+
+def test_agent_match_modes():
+    ro = get_ro('primary')
+    exact = HasAgent('IL-6', namespace='TEXT').get_hashes(ro).results
+    prefix_q = HasAgent('IL-', namespace='TEXT', match='prefix')
+    prefix = prefix_q.get_hashes(ro).results
+    substring_q = HasAgent('L-6', namespace='TEXT', match='substring')
+    substring = substring_q.get_hashes(ro).results
+    assert exact <= prefix
+    assert exact <= substring
+
+    # The match mode is part of the query's identity.
+    assert Query.from_json(prefix_q.to_json()) == prefix_q
+    assert prefix_q != HasAgent('IL-', namespace='TEXT')
+    assert 'starts with' in str(prefix_q)
+
+    try:
+        HasAgent('IL-6', namespace='TEXT', match='fuzzy')
+        assert False, "Invalid match option should fail."
+    except ValueError:
+        pass
+
+
+def test_evidence_filter_pushdown():
+    ro = get_ro('primary')
+    query = HasAgent('TP53')
+    ev_filter = HasOnlySource('reach').ev_filter()
+
+    post = query.get_statements(ro, limit=10, evidence_filter=ev_filter)
+    pushed = query.get_statements(ro, limit=10, evidence_filter=ev_filter,
+                                  evidence_filter_mode='pushdown')
+
+    # With the filter pushed down, no statements are dropped from the page.
+    assert len(pushed.results) == 10, len(pushed.results)
+    assert all(s['evidence'] for s in pushed.results.values())
+    assert set(post.results.keys()) <= set(pushed.results.keys())
+
+    two_phase = query.get_statements(ro, limit=10, evidence_filter=ev_filter,
+                                     evidence_filter_mode='pushdown',
+                                     strategy='two_phase')
+    assert set(two_phase.results.keys()) == set(pushed.results.keys())
+
+    try:
+        query.get_statements(ro, limit=10, evidence_filter=ev_filter,
+                             evidence_filter_mode='pre')
+        assert False, "Invalid evidence filter mode should fail."
+    except ValueError:
+        pass
+
+
+def test_prepared_statement_fingerprints():
+    tbl = Table('tbl', MetaData(), Column('mk_hash', BigInteger),
+                Column('db_id', String), Column('ev_count', Integer))
+
+    def get_sel(db_id, col=tbl.c.db_id, limit=None):
+        sel = select([tbl.c.mk_hash]).where(col == db_id)
+        if limit is not None:
+            sel = sel.limit(limit)
+        return sel
+
+    # Selections that differ only in their values share a fingerprint, with
+    # the values bound in the same positions.
+    binds_a, fp_a = _scan_statement(get_sel('TP53', limit=10))
+    binds_b, fp_b = _scan_statement(get_sel('MEK', limit=20))
+    assert fp_a == fp_b
+    assert {b.value for b in binds_a} == {'TP53', 10}
+    assert {b.value for b in binds_b} == {'MEK', 20}
+
+    # Selections of another shape do not.
+    assert _scan_statement(get_sel('TP53'))[1] != fp_a
+    assert _scan_statement(get_sel(7, col=tbl.c.ev_count, limit=10))[1] \
+        != fp_a
+
+
+def test_prepared_statements():
+    ro = get_ro('primary')
+    queries = [HasAgent('TP53') & HasOnlySource('reach'),
+               HasAgent('MEK') & HasOnlySource('sparser')]
+    expected = [q.get_hashes(ro, limit=10) for q in queries]
+
+    prepared_cache = PreparedQueryCache()
+    set_prepared_cache(prepared_cache)
+    try:
+        results = [q.get_hashes(ro, limit=10) for q in queries]
+    finally:
+        set_prepared_cache(None)
+
+    # The second query has the same shape, so reuses the first's statement.
+    assert queries[0]._get_shape() == queries[1]._get_shape()
+    assert prepared_cache.misses == 1, prepared_cache.misses
+    assert prepared_cache.hits == 1, prepared_cache.hits
+    for res, exp in zip(results, expected):
+        assert res.results == exp.results
+        assert res.evidence_counts == exp.evidence_counts
+        assert res.next_cursor == exp.next_cursor
+
+
+def test_fan_out_hashes():
+    ro = get_ro('primary')
+    queries = [HasAgent('TP53') & HasAgent('MDM2'),
+               HasAgent('TP53') & ~HasOnlySource('reach'),
+               HasAgent('MEK') | HasAgent('ERK') | HasType(['Complex'])]
+    for query in queries:
+        single = query.get_hashes(ro, limit=10, strategy='single')
+        fan_out = query.get_hashes(ro, limit=10, strategy='fan_out')
+        assert fan_out.results == single.results, query
+        assert fan_out.evidence_counts == single.evidence_counts, query
+        assert fan_out.next_cursor == single.next_cursor, query
+
+        # Paging with the cursor works the same way.
+        single = query.get_hashes(ro, limit=10, cursor=single.next_cursor,
+                                  strategy='single')
+        fan_out = query.get_hashes(ro, limit=10, cursor=fan_out.next_cursor,
+                                   strategy='fan_out')
+        assert fan_out.results == single.results, query
+
+    # Inverted queries cannot be fanned out of a union, so it is run as one.
+    assert (HasAgent('MEK') | ~HasAgent('ERK')).normalized()\
+        ._get_fan_out_queries() is None
+
+
+def test_top_k_hashes():
+    ro = get_ro('primary')
+    queries = [HasAgent('TP53') & HasAgent('MDM2'),
+               HasAgent('TP53') & ~HasOnlySource('reach'),
+               HasAgent('MEK') & HasType(['Phosphorylation'])]
+    for query in queries:
+        for sort_by in ['ev_count', 'belief']:
+            single = query.get_hashes(ro, limit=10, sort_by=sort_by,
+                                      strategy='single')
+            top_k = query.get_hashes(ro, limit=10, sort_by=sort_by,
+                                     strategy='top_k')
+            assert top_k.results == single.results, (query, sort_by)
+            assert top_k.next_cursor == single.next_cursor, (query, sort_by)
+
+            # The next page starts where the last left off.
+            single = query.get_hashes(ro, limit=10, sort_by=sort_by,
+                                      cursor=single.next_cursor,
+                                      strategy='single')
+            top_k = query.get_hashes(ro, limit=10, sort_by=sort_by,
+                                     cursor=top_k.next_cursor,
+                                     strategy='top_k')
+            assert top_k.results == single.results, (query, sort_by)
+
+    # A union cannot be walked, so it is run as a single query.
+    assert not (HasAgent('MEK') | HasAgent('ERK')).normalized()\
+        ._get_top_k_drivers()
+
+
+def test_agent_summary():
+    ro = get_ro('primary')
+    summary = get_agent_summary('TP53', ro=ro)
+    assert summary is not None
+    assert summary['num_stmts'] == HasAgent('TP53').count(ro)
+    assert all(n <= summary['num_stmts']
+               for n in summary['role_counts'].values())
+    assert len(summary['top_partners']) <= 10
+    partner_counts = [p[2] for p in summary['top_partners']]
+    assert partner_counts == sorted(partner_counts, reverse=True)
+
+    completions = get_agent_completions('TP5', ro=ro)
+    assert any(c['agent_id'] == 'TP53' for c in completions)
+    assert all(c['agent_id'].startswith('TP5') for c in completions)
+
+    assert get_agent_summary('NOT-AN-AGENT-XYZ', ro=ro) is None
+
+
+def test_bitmap_index():
+    ro = get_ro('primary')
+    queries = [~HasAgent('TP53'),
+               HasAgent('TP53') & ~HasAgent('MDM2'),
+               ~HasSources(['reach']) & HasAgent('MEK', namespace='FPLX'),
+               HasAgent('TP53') | HasSources(['signor'])]
+    sql_results = [(q.get_hashes(ro, limit=20, sort_by=sort_by), sort_by)
+                   for q in queries for sort_by in ['ev_count', 'belief']]
+    sql_counts = [q.count(ro) for q in queries]
+
+    with tempfile.TemporaryDirectory() as index_dir:
+        index = HashBitmapIndex.build(index_dir, ro, min_stmts=1)
+        assert index.dump_id == ro.get_dump_id()
+        set_bitmap_index(HashBitmapIndex.load(index_dir))
+        try:
+            for sql_res, sort_by in sql_results:
+                query = Query.from_json(sql_res.query_json)
+                assert query.normalized()._get_bitmap(index) is not None
+                res = query.get_hashes(ro, limit=20, sort_by=sort_by,
+                                       strategy='auto')
+                assert res.results == sql_res.results, (query, sort_by)
+                assert res.evidence_counts == sql_res.evidence_counts
+                assert res.next_cursor == sql_res.next_cursor
+
+            for query, sql_count in zip(queries, sql_counts):
+                assert query.count(ro) == sql_count, query
+
+            # Queries the index cannot resolve fall back to the database.
+            query = HasAgent('TP53') & HasType(['Phosphorylation'])
+            assert query.normalized()._get_bitmap(index) is None
+            assert query.get_hashes(ro, limit=5).results
+
+            # An index of another dump is ignored.
+            assert get_bitmap_index(ro) is not None
+            index.dump_id = 'another dump'
+            set_bitmap_index(index)
+            assert get_bitmap_index(ro) is None
+        finally:
+            set_bitmap_index(None)
+
+
+def test_stmt_ids():
+    ro = get_ro('primary')
+    rows = (ro.session.query(ro.SourceMeta.stmt_id, ro.SourceMeta.ev_count)
+            .order_by(ro.SourceMeta.stmt_id).all())
+    stmt_ids = [row.stmt_id for row in rows]
+    assert None not in stmt_ids
+    assert len(set(stmt_ids)) == len(stmt_ids)
+
+    # The statements are numbered in order of descending evidence count.
+    ev_counts = [row.ev_count for row in rows]
+    assert ev_counts == sorted(ev_counts, reverse=True)
+
+    # Joins go through the stmt_id, but results are still keyed by hash.
+    query = HasAgent('TP53') & ~HasAgent('MDM2')
+    res = query.get_statements(ro, limit=5, ev_limit=2)
+    hash_res = query.get_hashes(ro, limit=5)
+    assert set(res.results.keys()) == set(hash_res.results)
+
+
+def test_get_evidence():
+    ro = get_ro('primary')
+    mk_hash, ev_count = (ro.session.query(ro.SourceMeta.mk_hash,
+                                          ro.SourceMeta.ev_count)
+                         .order_by(ro.SourceMeta.ev_count.desc())
+                         .first())
+    assert ev_count > 4, ev_count
+
+    full_res = get_evidence(mk_hash, ro)
+    assert len(full_res.results) == ev_count
+    assert full_res.evidence_counts == {mk_hash: ev_count}
+    assert full_res.next_cursor is None
+
+    # Page through the evidence a few at a time.
+    raw_ids = []
+    cursor = None
+    while True:
+        res = get_evidence(mk_hash, ro, limit=2, cursor=cursor)
+        assert len(res.results) <= 2
+        raw_ids.extend(res.results.keys())
+        if res.next_cursor is None:
+            break
+        cursor = res.next_cursor
+    assert raw_ids == list(full_res.results.keys())
+    assert raw_ids == sorted(set(raw_ids))
+
+    # Evidence filters apply to each page.
+    ev_filter = HasOnlySource('medscan').invert().ev_filter()
+    filtered_res = get_evidence(mk_hash, ro, evidence_filter=ev_filter)
+    assert all(ev['source_api'] != 'medscan'
+               for ev in filtered_res.results.values())
+
+    # The results survive a round trip through JSON.
+    res_json = json.loads(json.dumps(full_res.json()))
+    res_copy = QueryResult.from_json(res_json)
+    assert isinstance(res_copy, EvidenceQueryResult)
+    assert res_copy.mk_hash == mk_hash
+    assert list(res_copy.results.keys()) == raw_ids
+
+    missing_res = get_evidence(0, ro, limit=10)
+    assert not missing_res.results
+
+
+def _make_test_router(labels, analytic_label=None):
+    # Skip the constructor, which needs the databases to be configured.
+    router = ReadonlyRouter.__new__(ReadonlyRouter)
+    all_labels = labels + ([analytic_label] if analytic_label else [])
+    router.labels = list(labels)
+    router.analytic_label = analytic_label
+    router._outstanding = dict.fromkeys(all_labels, 0)
+    router._healthy = dict.fromkeys(all_labels, True)
+    router._next = 0
+    router._lock = threading.Lock()
+    return router
+
+
+def test_ro_router_choice():
+    router = _make_test_router(['a', 'b'], analytic_label='c')
+
+    # Queries go to the replica with the fewest outstanding, turn by turn.
+    first = router._choose(False)
+    second = router._choose(False)
+    assert {first, second} == {'a', 'b'}
+    router._release(first)
+    assert router._choose(False) == first
+
+    # Analytic queries go to the analytic replica, and stay off the others.
+    assert router._choose(True) == 'c'
+    assert router._choose(True) == 'c'
+    assert router._outstanding == {'a': 1, 'b': 1, 'c': 2}
+
+    # Unhealthy replicas are skipped, falling back on the analytic replica.
+    router._mark_unhealthy('a')
+    assert router._choose(False) == 'b'
+    router._mark_unhealthy('b')
+    assert router._choose(False) == 'c'
+    router._mark_unhealthy('c')
+    try:
+        router._choose(False)
+        assert False, "A query was routed with no healthy replica."
+    except IndraDbException:
+        pass
+
+
+def test_ro_router():
+    router = ReadonlyRouter(['primary'])
+    label = router.labels[0]
+    assert router.check_health() == {label: True}
+
+    set_ro_router(router)
+    try:
+        query = HasAgent('TP53')
+        res = query.get_hashes(limit=5)
+        assert res.results
+        assert router.get_status()[label]['outstanding'] == 0
+
+        # Queries are counted while they run.
+        with router.acquire() as ro:
+            assert router.get_status()[label]['outstanding'] == 1
+            ro_res = query.get_hashes(ro, limit=5)
+            assert router.get_status()[label]['outstanding'] == 1
+        assert ro_res.results == res.results
+        assert router.get_status()[label]['outstanding'] == 0
+
+        # Streaming queries are analytic, and hold a replica until done.
+        stmt_iter = query.iter_statements(batch_size=2, limit=3)
+        next(stmt_iter)
+        assert router.get_status()[label]['outstanding'] == 1
+        stmt_iter.close()
+        assert router.get_status()[label]['outstanding'] == 0
+
+        # Without a healthy replica, queries cannot be routed.
+        router._mark_unhealthy(label)
+        try:
+            query.get_hashes(limit=5)
+            assert False, "Query was routed to an unhealthy replica."
+        except IndraDbException:
+            pass
+        router.check_health()
+        assert router.get_status()[label]['healthy']
+    finally:
+        set_ro_router(None)
+
+
+def test_metered_pool():
+    events = []
+    set_pool_metrics_hook(lambda label, event, value:
+                          events.append((label, event, value)))
+    try:
+        pool = MeteredQueuePool(lambda: sqlite3.connect(':memory:'),
+                                pool_size=1, max_overflow=1, timeout=0.1)
+        pool.metrics = PoolMetrics('test')
+        conn_1 = pool.connect()
+        conn_2 = pool.connect()
+        assert ('test', 'overflow', 1) in events
+        try:
+            pool.connect()
+            assert False, "A connection was checked out past the overflow."
+        except PoolTimeoutError:
+            pass
+        conn_2.close()
+        conn_1.close()
+        assert ('test', 'checkin', 0) in events
+
+        status = pool.metrics.get_status(pool)
+        assert status['checkouts'] == 2, status
+        assert status['overflows'] == 1, status
+        assert status['timeouts'] == 1, status
+        assert status['max_wait'] > 0, status
+        assert status['checked_out'] == 0, status
+    finally:
+        set_pool_metrics_hook(None)
+
+
+def test_pool_metrics():
+    events = []
+    set_pool_metrics_hook(lambda label, event, value:
+                          events.append((event, value)))
+    try:
+        ro = get_ro('primary')
+        assert get_ro('primary') is ro
+        ro.remove_session()
+        checked_out = ro.get_pool_status()['checked_out']
+
+        # The session of a thread holds a connection until it is removed.
+        ro.session.execute('SELECT 1').scalar()
+        status = ro.get_pool_status()
+        assert status['checked_out'] == checked_out + 1, status
+        assert status['checkouts'] >= 1
+        assert any(event == 'wait' for event, _ in events)
+
+        release_ro_sessions()
+        assert ro.get_pool_status()['checked_out'] == checked_out
+        assert ('checkin', checked_out) in events
+
+        # Each thread has its own session.
+        thread_sessions = []
+        thread = threading.Thread(
+            target=lambda: thread_sessions.append(ro.session)
+        )
+        thread.start()
+        thread.join()
+        assert thread_sessions[0] is not ro.session
+    finally:
+        set_pool_metrics_hook(None)
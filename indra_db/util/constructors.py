@@ -1,6 +1,8 @@
-__all__ = ['get_primary_db', 'get_db', 'get_ro', 'get_ro_host']
+__all__ = ['get_primary_db', 'get_db', 'get_ro', 'get_kept_ro',
+           'get_ro_host', 'release_ro_sessions']
 
 import logging
+from threading import Lock
 
 from indra_db.databases import PrincipalDatabaseManager, \
     ReadonlyDatabaseManager
@@ -12,6 +14,11 @@ logger = logging.getLogger('util-constructors')
 
 __PRIMARY_DB = None
 
+# The readonly database managers, keyed by URL and protection, so that the
+# callers in a process share their connection pools.
+__RO_MANAGERS = {}
+__RO_MANAGERS_LOCK = Lock()
+
 
 @nope_in_test
 def get_primary_db(force_new=False):
@@ -88,30 +95,77 @@ def get_db(db_label, protected=False):
     return db
 
 
+def _resolve_ro_label(ro_label):
+    """Get the label and URL of a readonly database, or a None URL."""
+    defaults = get_readonly_databases()
+    if ro_label == 'primary' and 'override' in defaults:
+        logger.info("Found an override database: using in place of primary.")
+        ro_label = 'override'
+    return ro_label, defaults.get(ro_label)
+
+
 @nope_in_test
-def get_ro(ro_label, protected=True):
+def get_ro(ro_label, protected=True, force_new=False):
     """Get a readonly database instance, based on its name.
 
     If the label does not exist or the database labeled can't be reached, None
     is returned.
+
+    Note: the instance is kept, and returned again by later calls for the same
+    database, so that they share one pool of connections. The session of the
+    instance is scoped to the calling thread.
+
+    Parameters
+    ----------
+    ro_label : str
+        The label of the readonly database in the config file or environment.
+    protected : bool
+        If True (default), the session will not write to the database.
+    force_new : bool
+        If True, a new instance is created and kept, regardless of whether
+        there is an existing instance. Default is False.
     """
     # Instantiate a readonly database.
-    defaults = get_readonly_databases()
-    if ro_label == 'primary' and 'override' in defaults:
-        logger.info("Found an override database: using in place of primary.")
-        ro_label = 'override'
-    if ro_label not in defaults:
+    ro_label, db_url = _resolve_ro_label(ro_label)
+    if db_url is None:
         logger.error(f"No such readonly database available: {ro_label}. Check "
                      f"config file or environment variables.")
         return
-    db_url = defaults[ro_label]
-    ro = ReadonlyDatabaseManager(db_url, label=ro_label, protected=protected)
-    if not ro.available:
-        return
+    key = (db_url, protected)
+    with __RO_MANAGERS_LOCK:
+        ro = __RO_MANAGERS.get(key)
+        if ro is None or force_new:
+            ro = ReadonlyDatabaseManager(db_url, label=ro_label,
+                                         protected=protected)
+            if not ro.available:
+                return
+            __RO_MANAGERS[key] = ro
     ro.grab_session()
     return ro
 
 
+def get_kept_ro(ro_label, protected=True):
+    """Get the kept readonly instance for a label, without making one.
+
+    Returns None if `get_ro` has not yet made an instance for the database.
+    """
+    _, db_url = _resolve_ro_label(ro_label)
+    with __RO_MANAGERS_LOCK:
+        return __RO_MANAGERS.get((db_url, protected))
+
+
+def release_ro_sessions():
+    """Close the sessions of this thread on the kept readonly instances.
+
+    This returns their connections to the pools, e.g. at the end of a request
+    to a web service.
+    """
+    with __RO_MANAGERS_LOCK:
+        managers = list(__RO_MANAGERS.values())
+    for ro in managers:
+        ro.remove_session()
+
+
 def get_ro_host(ro_label):
     """Get the host of the current readonly database."""
     ro = get_ro(ro_label)
@@ -1,6 +1,6 @@
 __all__ = ['unpack', '_get_trids', '_fix_evidence_refs',
            'get_raw_stmts_frm_db_list', '_set_evidence_text_ref',
-           'get_statement_object']
+           'get_statement_object', 'loads_json', 'dumps_json']
 
 import json
 import zlib
@@ -9,9 +9,40 @@ import logging
 from indra.util import clockit
 from indra.statements import Statement
 
+try:
+    import orjson
+    WITH_ORJSON = True
+except ImportError:
+    WITH_ORJSON = False
+
 logger = logging.getLogger('util-helpers')
 
 
+def loads_json(json_bytes):
+    """Load a JSON from bytes, using orjson if it is available."""
+    if WITH_ORJSON:
+        return orjson.loads(json_bytes)
+    if not isinstance(json_bytes, str):
+        json_bytes = bytes(json_bytes).decode('utf-8')
+    return json.loads(json_bytes)
+
+
+def dumps_json(obj):
+    """Dump an object to a JSON string, using orjson if it is available.
+
+    As with `json.dumps`, non-string keys (such as integer hashes) are
+    converted to strings.
+    """
+    if WITH_ORJSON:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)\
+                .decode('utf-8')
+        except TypeError:
+            # orjson is stricter about types, e.g. sets are not serializable.
+            pass
+    return json.dumps(obj)
+
+
 def get_statement_object(db_stmt):
     """Get an INDRA Statement object from a db_stmt."""
     if isinstance(db_stmt, bytes):
@@ -18,12 +18,19 @@ from indra.assemblers.html.assembler import loader as indra_loader
 
 from indra_db.exceptions import BadHashError
 from indra_db.client.principal.curation import *
-from indra_db.client.readonly import AgentJsonExpander
-from indra_db.util.constructors import get_ro_host
+from indra_db.client.readonly import AgentJsonExpander, set_result_cache, \
+    MemoryResultCache, DiskResultCache, AgentIndex, set_agent_index, \
+    PreparedQueryCache, set_prepared_cache, get_agent_summary, \
+    get_agent_completions, HashBitmapIndex, set_bitmap_index, \
+    ReadonlyRouter, set_ro_router, get_ro_router
+from indra_db.util import dumps_json
+from indra_db.util.constructors import get_ro, get_ro_host, get_kept_ro, \
+    release_ro_sessions
 
 from indralab_auth_tools.auth import auth, resolve_auth, config_auth
 from indralab_auth_tools.log import note_in_log, set_log_service_name, \
     user_log_endpoint
+from indralab_auth_tools.src.models import UserDatabaseError
 
 from rest_api.config import *
 from rest_api.call_handlers import *
@@ -75,6 +82,42 @@ else:
 Compress(app)
 CORS(app)
 
+# Cache query results, which do not change for a given readonly dump.
+if RESULT_CACHE_BYTES:
+    set_result_cache(MemoryResultCache(
+        RESULT_CACHE_BYTES,
+        DiskResultCache(RESULT_CACHE_DIR, RESULT_CACHE_DIR_BYTES)
+        if RESULT_CACHE_DIR else None
+    ))
+
+# Answer simple agent queries from a memory-mapped index, if one is available.
+if AGENT_INDEX_DIR:
+    set_agent_index(AgentIndex.load(AGENT_INDEX_DIR, get_ro('primary')))
+
+# Pre-filter queries with precomputed bitmaps, if they are available.
+if BITMAP_INDEX_DIR:
+    set_bitmap_index(HashBitmapIndex.load(BITMAP_INDEX_DIR,
+                                          ro=get_ro('primary')))
+
+# Run the SQL of common query shapes as prepared statements.
+if PREPARED_SHAPES:
+    set_prepared_cache(PreparedQueryCache(PREPARED_SHAPES))
+
+# Spread queries across replicas of the readonly database, if there are any.
+if RO_REPLICAS or RO_ANALYTIC_REPLICA:
+    set_ro_router(ReadonlyRouter(
+        RO_REPLICAS.split(',') if RO_REPLICAS else ['primary'],
+        analytic_label=RO_ANALYTIC_REPLICA
+    ))
+
+
+# Return the database connections of each request to the pool when it ends,
+# whether or not it succeeded.
+@app.teardown_request
+def release_db_sessions(exc):
+    release_ro_sessions()
+
+
 # The directory path to this location (works in any file system).
 HERE = path.abspath(path.dirname(__file__))
 
@@ -124,7 +167,15 @@ def root():
 
 @app.route('/healthcheck', methods=['GET'])
 def i_am_alive():
-    return jsonify({'status': 'testing' if TESTING['status'] else 'healthy'})
+    res_json = {'status': 'testing' if TESTING['status'] else 'healthy'}
+    router = get_ro_router()
+    if router is not None:
+        res_json['replicas'] = router.get_status()
+    # Do not connect to the database just to report on it.
+    ro = get_kept_ro('primary')
+    if ro is not None:
+        res_json['pool'] = ro.get_pool_status()
+    return jsonify(res_json)
 
 
 @app.route('/ground', methods=['GET'])
@@ -134,6 +185,35 @@ def ground():
     return jsonify(res_json)
 
 
+@app.route('/agent_summary', methods=['GET'])
+@jwt_nontest_optional
+@user_log_endpoint
+def agent_summary():
+    ag = request.args.get('agent')
+    if not ag:
+        abort(Response("Parameter 'agent' is required.", 400))
+    ns = request.args.get('namespace', 'NAME')
+    res_json = get_agent_summary(ag, ns)
+    if res_json is None:
+        abort(Response(f"No statements found with agent {ag}@{ns}.", 404))
+    return jsonify(res_json)
+
+
+@app.route('/agent_completions', methods=['GET'])
+@jwt_nontest_optional
+@user_log_endpoint
+def agent_completions():
+    prefix = request.args.get('prefix')
+    if not prefix:
+        abort(Response("Parameter 'prefix' is required.", 400))
+    ns = request.args.get('namespace', 'NAME')
+    try:
+        limit = min(int(request.args.get('limit', 10)), 100)
+    except ValueError:
+        abort(Response("Parameter 'limit' must be an integer.", 400))
+    return jsonify(get_agent_completions(prefix, ns, limit))
+
+
 @app.route('/search', methods=['GET'])
 @jwt_nontest_optional
 @user_log_endpoint
@@ -279,6 +359,22 @@ def get_statements(result_type, method):
     return call.run(result_type=result_type)
 
 
+@app.route('/cancel/<request_id>', methods=['POST'])
+@jwt_nontest_optional
+@user_log_endpoint
+def cancel_request(request_id):
+    """Cancel the database query of a request made with this request_id."""
+    user = None
+    if not TESTING['status']:
+        try:
+            user, _ = resolve_auth(request.args.copy())
+        except UserDatabaseError:
+            abort(Response("Invalid credentials.", 401))
+    cancelled = cancel_query(request_id, user.email if user else None)
+    logger.info(f"Request to cancel {request_id}: cancelled={cancelled}")
+    return jsonify({'request_id': request_id, 'cancelled': cancelled})
+
+
 @app.route('/expand', methods=['POST'])
 def expand_meta_row():
     start_time = datetime.now()
@@ -363,7 +459,7 @@ def expand_meta_row():
     res_json = result.json()
     res_json['relations'] = list(res_json['results'].values())
     res_json.pop('results')
-    resp = Response(json.dumps(res_json), mimetype='application/json')
+    resp = Response(dumps_json(res_json), mimetype='application/json')
     logger.info(f"Returning expansion with {len(result.results)} meta results "
                 f"that represent {result.total_evidence} total evidence. Size "
                 f"is {sys.getsizeof(resp.data) / 1e6} MB after "
@@ -378,6 +474,14 @@ def get_statements_by_query_json(result_type):
     return FallbackQueryApiCall(env).run(result_type)
 
 
+@app.route('/batch/<result_type>', methods=['POST'])
+@user_log_endpoint
+def get_batch_results(result_type):
+    """Get the results for each of a list of query JSONs."""
+    note_in_log(result_type=result_type)
+    return BatchApiCall(env).run(result_type)
+
+
 @app.route('/curation', methods=['GET'])
 def describe_curation():
     return redirect('/statements', code=302)
@@ -1,11 +1,13 @@
 __all__ = ['ApiCall', 'FromAgentsApiCall', 'FromHashApiCall',
            'FromHashesApiCall', 'FromPapersApiCall', 'FromQueryJsonApiCall',
-           'FromAgentJsonApiCall', 'FallbackQueryApiCall']
+           'FromAgentJsonApiCall', 'FallbackQueryApiCall', 'BatchApiCall',
+           'cancel_query']
 
 import sys
 import json
 import logging
 from datetime import datetime
+from threading import Lock
 from collections import defaultdict
 
 from flask import request, Response, abort
@@ -19,11 +21,14 @@ from indra.assemblers.html.assembler import HtmlAssembler, _format_stmt_text, \
 
 from indra_db.client.readonly import *
 from indra_db.client.principal.curation import *
+from indra_db.util import dumps_json
+from indra_db.exceptions import QueryTimeoutError, QueryCancelledError
 from indralab_auth_tools.log import note_in_log, is_log_running
 from indralab_auth_tools.src.models import UserDatabaseError
 
 from rest_api.config import MAX_STMTS, REDACT_MESSAGE, TITLE, TESTING, \
-    jwt_nontest_optional
+    jwt_nontest_optional, STMT_STRATEGY, QUERY_COST_BUDGET, QUERY_TIMEOUT, \
+    MAX_BATCH_QUERIES, EV_FILTER_MODE, HASH_STRATEGY
 from rest_api.util import LogTracker, sec_since, get_source, process_agent, \
     process_mesh_term, DbAPIError, iter_free_agents, _make_english_from_meta, \
     get_html_source_info
@@ -31,6 +36,43 @@ from rest_api.util import LogTracker, sec_since, get_source, process_agent, \
 logger = logging.getLogger('call_handlers')
 
 
+# The cancel handles of the queries running in this process, and the users
+# who made them, keyed by the request ids given by the clients.
+_running_queries = {}
+_running_queries_lock = Lock()
+
+
+def _register_query(request_id, cancel_handle, owner=None):
+    if request_id is None:
+        return
+    with _running_queries_lock:
+        _running_queries[request_id] = (cancel_handle, owner)
+
+
+def _unregister_query(request_id):
+    if request_id is None:
+        return
+    with _running_queries_lock:
+        _running_queries.pop(request_id, None)
+
+
+def cancel_query(request_id, owner=None):
+    """Cancel the query for the given request id, if it is running here.
+
+    A query made by a logged-in user may only be cancelled by that user.
+    """
+    with _running_queries_lock:
+        cancel_handle, query_owner = \
+            _running_queries.get(request_id, (None, None))
+    if cancel_handle is None:
+        return False
+    if query_owner is not None and query_owner != owner:
+        logger.warning(f"Refusing to cancel {request_id} for another user.")
+        return False
+    cancel_handle.cancel()
+    return True
+
+
 class ApiCall:
     default_ev_lim = 10
 
@@ -49,6 +91,18 @@ class ApiCall:
         else:
             self.limit = min(self._pop('max_stmts', MAX_STMTS, int), MAX_STMTS)
 
+        # Get the cursor, if paging by cursor rather than offset.
+        self.cursor = self._pop('cursor', None)
+
+        # The client may give an id for the request, with which to cancel it.
+        # Attaching a cancel handle costs a round trip, so only those
+        # requests get one.
+        self.request_id = self._pop('request_id', None)
+        if self.request_id is not None:
+            self.cancel_handle = QueryCancelHandle()
+        else:
+            self.cancel_handle = None
+
         # Sort out the sorting.
         sort_by = self._pop('sort_by', None)
         best_first = self._pop('best_first', True, bool)
@@ -70,6 +124,7 @@ class ApiCall:
         self.agent_set = None
 
         # Figure out authorization.
+        self.user = None
         self.has = dict.fromkeys(['elsevier', 'medscan'], False)
         if not TESTING['status']:
             try:
@@ -95,7 +150,8 @@ class ApiCall:
         self.special = {}
         return
 
-    valid_result_types = ['statements', 'interactions', 'agents', 'hashes']
+    valid_result_types = ['statements', 'interactions', 'agents', 'hashes',
+                          'count', 'evidence']
 
     def run(self, result_type):
 
@@ -107,41 +163,100 @@ class ApiCall:
         params = dict(offset=self.offs, limit=self.limit,
                       sort_by=self.sort_by)
         logger.info(f"Sending query with params: {params}")
-        if result_type == 'statements':
-            self.special['ev_limit'] = \
-                self._pop('ev_limit', self.default_ev_lim, int)
-            res = self.get_db_query().get_statements(
-                ev_limit=self.special['ev_limit'],
-                evidence_filter=self.ev_filter,
-                **params
-            )
-        elif result_type == 'interactions':
-            res = self.get_db_query().get_interactions(**params)
-        elif result_type == 'relations':
-            self.special['with_hashes'] = self._pop('with_hashes', False, bool)
-            res = self.get_db_query().get_relations(
-                with_hashes=self.special['with_hashes'] or self.w_cur_counts,
-                **params
-            )
-        elif result_type == 'agents':
-            self.special['with_hashes'] = self._pop('with_hashes', False, bool)
-            self.special['complexes_covered'] = \
-                self._pop('complexes_covered', None)
-            res = self.get_db_query().get_agents(
-                with_hashes=self.special['with_hashes'] or self.w_cur_counts,
-                complexes_covered=self.special['complexes_covered'],
-                **params
-            )
-        elif result_type == 'hashes':
-            res = self.get_db_query().get_hashes(**params)
-        else:
-            raise ValueError(f"Invalid result type: {result_type}")
+        limits = dict(timeout=QUERY_TIMEOUT, cancel_handle=self.cancel_handle)
+        _register_query(self.request_id, self.cancel_handle,
+                        self.get_owner())
+        try:
+            if result_type == 'statements':
+                self.special['ev_limit'] = \
+                    self._pop('ev_limit', self.default_ev_lim, int)
+                strategy = self._pop('strategy', STMT_STRATEGY)
+                if strategy not in {'joined', 'two_phase'}:
+                    abort(Response(f"Invalid strategy: {strategy}", 400))
+                ev_filter_mode = self._pop('ev_filter_mode', EV_FILTER_MODE)
+                if ev_filter_mode not in {'post', 'pushdown'}:
+                    abort(Response(f"Invalid evidence filter mode: "
+                                   f"{ev_filter_mode}", 400))
+                self._check_cost(result_type, self.special['ev_limit'])
+                res = self.get_db_query().get_statements(
+                    ev_limit=self.special['ev_limit'],
+                    evidence_filter=self.ev_filter,
+                    cursor=self.cursor,
+                    strategy=strategy,
+                    evidence_filter_mode=ev_filter_mode,
+                    **params, **limits
+                )
+            elif result_type == 'interactions':
+                res = self.get_db_query().get_interactions(cursor=self.cursor,
+                                                           **params, **limits)
+            elif result_type == 'relations':
+                self.special['with_hashes'] = \
+                    self._pop('with_hashes', False, bool)
+                res = self.get_db_query().get_relations(
+                    with_hashes=(self.special['with_hashes']
+                                 or self.w_cur_counts),
+                    cursor=self.cursor,
+                    **params, **limits
+                )
+            elif result_type == 'agents':
+                self.special['with_hashes'] = \
+                    self._pop('with_hashes', False, bool)
+                self.special['complexes_covered'] = \
+                    self._pop('complexes_covered', None)
+                res = self.get_db_query().get_agents(
+                    with_hashes=(self.special['with_hashes']
+                                 or self.w_cur_counts),
+                    complexes_covered=self.special['complexes_covered'],
+                    **params, **limits
+                )
+            elif result_type == 'count':
+                exact = self._pop('exact', True, bool)
+                count = self.get_db_query().count(exact=exact, **limits)
+                return self.produce_count_response(count, exact)
+            elif result_type == 'hashes':
+                strategy = self._pop('strategy', HASH_STRATEGY)
+                if strategy not in {'single', 'auto', 'fan_out', 'top_k'}:
+                    abort(Response(f"Invalid strategy: {strategy}", 400))
+                self._check_cost(result_type)
+                res = self.get_db_query().get_hashes(cursor=self.cursor,
+                                                     strategy=strategy,
+                                                     **params, **limits)
+            elif result_type == 'evidence':
+                res = self.get_evidence(**limits)
+            else:
+                raise ValueError(f"Invalid result type: {result_type}")
+        except QueryTimeoutError as e:
+            abort(Response(f"{e} Try a more specific query, or a smaller "
+                           f"limit.", 504))
+        except QueryCancelledError as e:
+            abort(Response(str(e), 503))
+        finally:
+            _unregister_query(self.request_id)
         logger.info(f"Got results from query after "
                     f"{sec_since(self.start_time)} seconds.")
         self.process_entries(res)
         logger.info(f"Returning for query with params: {params}")
         return self.produce_response(res)
 
+    def get_owner(self):
+        """Get the email of the logged-in user, if any, who made the call."""
+        return self.user.email if self.user else None
+
+    def _check_cost(self, result_type, ev_limit=None, query=None):
+        """Abort if the query is estimated to cost more than the budget."""
+        if QUERY_COST_BUDGET is None:
+            return
+        if query is None:
+            query = self.get_db_query()
+        cost = query.estimate_cost(result_type=result_type,
+                                   sort_by=self.sort_by, limit=self.limit,
+                                   ev_limit=ev_limit)
+        logger.info(f"Query has an estimated cost of {cost}.")
+        if cost > QUERY_COST_BUDGET:
+            abort(Response(f"Query is too expensive (estimated cost {cost} "
+                           f"exceeds {QUERY_COST_BUDGET}). Try a more "
+                           f"specific query, or a smaller limit.", 400))
+
     def _pop(self, key, default=None, type_cast=None):
         if isinstance(default, bool):
             val = self.web_query.pop(key, str(default).lower()).lower() == 'true'
@@ -180,9 +295,13 @@ class ApiCall:
     def _build_db_query(self):
         raise NotImplementedError()
 
+    def get_evidence(self, **limits):
+        abort(Response("Evidence may only be paged for a single statement, "
+                       "with from_hash.", 400))
+
     def produce_response(self, result):
         res_json = result.json()
-        content = json.dumps(res_json)
+        content = dumps_json(res_json)
 
         resp = Response(content, mimetype='application/json')
         logger.info("Exiting with %d results that have %d total evidence, "
@@ -193,11 +312,25 @@ class ApiCall:
                        sec_since(self.start_time)))
         return resp
 
+    def produce_count_response(self, count, exact):
+        res_json = {'count': count, 'exact': exact, 'result_type': 'count',
+                    'query_json': self.db_query.to_json()}
+        logger.info(f"Returning a count of {count} (exact={exact}) after "
+                    f"{sec_since(self.start_time)} seconds.")
+        return Response(dumps_json(res_json), mimetype='application/json')
+
     def process_entries(self, result):
         if result.result_type == 'hashes':
             # There is really nothing to do for hashes.
             return
 
+        if result.result_type == 'evidence':
+            # Medscan evidence was already filtered out by the query.
+            redactions = self._redact_evidence(result.results.values())
+            logger.info(f"Redacted {redactions} pieces of elsevier "
+                        f"evidence.")
+            return
+
         elsevier_redactions = 0
         if not all(self.has.values()) or self.fmt == 'json-js' \
                 or self.w_english:
@@ -259,17 +392,8 @@ class ApiCall:
 
                 if result.result_type == 'statements':
                     # If there is evidence, loop through it if necessary.
-                    for ev_json in entry['evidence'][:]:
-                        if self.fmt == 'json-js':
-                            ev_json['source_hash'] = str(ev_json['source_hash'])
-
-                        # Check for elsevier and redact if necessary
-                        if not self.has['elsevier'] and \
-                                get_source(ev_json) == 'elsevier':
-                            text = ev_json['text']
-                            if len(text) > 200:
-                                ev_json['text'] = text[:200] + REDACT_MESSAGE
-                                elsevier_redactions += 1
+                    elsevier_redactions += \
+                        self._redact_evidence(entry['evidence'])
                 elif result.result_type != 'hashes' and self.fmt == 'json-js':
                     # Stringify lists of hashes.
                     if 'hashes' in entry and entry['hashes'] is not None:
@@ -285,6 +409,21 @@ class ApiCall:
                     f"{sec_since(self.start_time)} seconds.")
         return
 
+    def _redact_evidence(self, ev_jsons):
+        """Format evidence JSONs, and redact them as needed, in place."""
+        redactions = 0
+        for ev_json in ev_jsons:
+            if self.fmt == 'json-js':
+                ev_json['source_hash'] = str(ev_json['source_hash'])
+
+            # Check for elsevier and redact if necessary
+            if not self.has['elsevier'] and get_source(ev_json) == 'elsevier':
+                text = ev_json['text']
+                if len(text) > 200:
+                    ev_json['text'] = text[:200] + REDACT_MESSAGE
+                    redactions += 1
+        return redactions
+
 
 class StatementApiCall(ApiCall):
     def __init__(self, env):
@@ -373,7 +512,7 @@ class StatementApiCall(ApiCall):
             else:  # Return JSON for all other values of the format argument
                 res_json.update(self.tracker.get_level_stats())
                 res_json['statements'] = stmts_json
-                resp_content = json.dumps(res_json)
+                resp_content = dumps_json(res_json)
                 mimetype = 'application/json'
 
             resp = Response(resp_content, mimetype=mimetype)
@@ -384,7 +523,7 @@ class StatementApiCall(ApiCall):
                            res_json['total_evidence'],
                            sys.getsizeof(resp.data) / 1e6,
                            sec_since(self.start_time)))
-        elif result.result_type != 'hashes':
+        elif result.result_type not in {'hashes', 'evidence'}:
             # Look up curations, if result with_curations was set.
             if self.w_cur_counts:
                 rel_hash_lookup = defaultdict(list)
@@ -414,7 +553,7 @@ class StatementApiCall(ApiCall):
                     [str(h) for h in res_json['complexes_covered']]
             res_json.pop('results')
             res_json['query_str'] = str(self.db_query)
-            resp = Response(json.dumps(res_json), mimetype='application/json')
+            resp = Response(dumps_json(res_json), mimetype='application/json')
 
             logger.info("Result prepared after %.2f seconds."
                         % sec_since(self.start_time))
@@ -440,11 +579,21 @@ class StatementApiCall(ApiCall):
         return
 
     def _agent_query_from_web_query(self, db_query):
+        # Get how the agent IDs are matched: exactly, or by prefix/substring.
+        match = self._pop('agent_match', 'exact')
+        if match not in HasAgent.match_options:
+            return abort(Response(f"Invalid agent_match: {match}", 400))
+
+        # Partial matches cannot be checked against the statements.
+        def require_agent(ag, ns, num=None):
+            if match == 'exact':
+                self._require_agent(ag, ns, num)
+
         # Get the agents without specified locations (subject or object).
         for raw_ag in iter_free_agents(self.web_query):
             ag, ns = process_agent(raw_ag)
-            db_query &= HasAgent(ag, namespace=ns)
-            self._require_agent(ag, ns)
+            db_query &= HasAgent(ag, namespace=ns, match=match)
+            require_agent(ag, ns)
 
         # Get the agents with specified roles.
         for ag_num, role in enumerate(['subject', 'object']):
@@ -455,8 +604,9 @@ class StatementApiCall(ApiCall):
                 assert len(raw_ag) == 1, f'Malformed agent for {role}: {raw_ag}'
                 raw_ag = raw_ag[0]
             ag, ns = process_agent(raw_ag)
-            db_query &= HasAgent(ag, namespace=ns, role=role.upper())
-            self._require_agent(ag, ns, ag_num)
+            db_query &= HasAgent(ag, namespace=ns, role=role.upper(),
+                                 match=match)
+            require_agent(ag, ns, ag_num)
 
         # Get agents with specific agent numbers.
         for key in self.web_query.copy().keys():
@@ -470,8 +620,9 @@ class StatementApiCall(ApiCall):
             raw_ag = self._pop(key)
             ag_num = int(ag_num_str)
             ag, ns = process_agent(raw_ag)
-            db_query &= HasAgent(ag, namespace=ns, agent_num=ag_num)
-            self._require_agent(ag, ns, ag_num)
+            db_query &= HasAgent(ag, namespace=ns, agent_num=ag_num,
+                                 match=match)
+            require_agent(ag, ns, ag_num)
 
         return db_query
 
@@ -610,9 +761,25 @@ class FromHashApiCall(StatementApiCall):
     default_ev_lim = 1000
 
     def _build_db_query(self):
-        self.web_query['hashes'] = [self._pop('hash')]
+        self.stmt_hash = self._pop('hash')
+        self.web_query['hashes'] = [self.stmt_hash]
         return self._db_query_from_web_query()
 
+    def get_evidence(self, **limits):
+        # Building the query also builds the evidence filter.
+        self.get_db_query()
+        try:
+            stmt_hash = int(self.stmt_hash)
+        except ValueError:
+            abort(Response(f"Invalid hash: {self.stmt_hash}", 400))
+            return
+        try:
+            return get_evidence(stmt_hash, limit=self.limit,
+                                cursor=self.cursor,
+                                evidence_filter=self.ev_filter, **limits)
+        except ValueError as e:
+            abort(Response(str(e), 400))
+
 
 class FromPapersApiCall(StatementApiCall):
     def _build_db_query(self):
@@ -673,4 +840,71 @@ class FallbackQueryApiCall(ApiCall):
         query_json = json.loads(self._pop('json', '{}'))
         q = Query.from_json(query_json)
         _check_query(q)
-        return q
\ No newline at end of file
+        return q
+
+
+class BatchApiCall(ApiCall):
+    """Get the results of a list of query JSONs, in one batch."""
+    valid_result_types = ['hashes', 'count']
+
+    def __init__(self, env):
+        super(BatchApiCall, self).__init__(env)
+        # The options of a batch are sent in the JSON body, with the queries.
+        body = request.json or {}
+        if body.get('limit') is not None:
+            self.limit = min(int(body['limit']), MAX_STMTS)
+        if body.get('sort_by') is not None:
+            self.sort_by = body['sort_by']
+
+    def _build_db_query(self):
+        abort(Response("A batch has many queries, and no single query.", 400))
+
+    def get_queries(self):
+        query_jsons = (request.json or {}).get('queries')
+        if not query_jsons:
+            abort(Response("No queries given!", 400))
+        if len(query_jsons) > MAX_BATCH_QUERIES:
+            abort(Response(f"Too many queries given, {MAX_BATCH_QUERIES} "
+                           f"allowed.", 400))
+
+        queries = []
+        for query_json in query_jsons:
+            try:
+                query = Query.from_json(query_json)
+            except (KeyError, ValueError, TypeError) as e:
+                abort(Response(f"Problem forming query: {e}", 400))
+                return
+            _check_query(query)
+            if not self.has['medscan']:
+                query &= ~HasOnlySource('medscan')
+            queries.append(query)
+        return queries
+
+    def run(self, result_type):
+        if result_type not in self.valid_result_types:
+            abort(Response(f"Invalid result type for a batch: {result_type}",
+                           400))
+        queries = self.get_queries()
+        if result_type == 'hashes':
+            for query in queries:
+                self._check_cost(result_type, query=query)
+        _register_query(self.request_id, self.cancel_handle,
+                        self.get_owner())
+        try:
+            results = run_batch(queries, result_type=result_type,
+                                limit=self.limit, sort_by=self.sort_by,
+                                timeout=QUERY_TIMEOUT,
+                                cancel_handle=self.cancel_handle)
+        except QueryTimeoutError as e:
+            abort(Response(f"{e} Try more specific queries, or a smaller "
+                           f"limit.", 504))
+        except QueryCancelledError as e:
+            abort(Response(str(e), 503))
+        finally:
+            _unregister_query(self.request_id)
+        logger.info(f"Got results for batch of {len(queries)} queries after "
+                    f"{sec_since(self.start_time)} seconds.")
+        if result_type == 'hashes':
+            results = [res.json() for res in results]
+        res_json = {'result_type': result_type, 'results': results}
+        return Response(dumps_json(res_json), mimetype='application/json')
@@ -8,8 +8,60 @@ if VUE_ROOT is not None and VUE_ROOT.endswith('/'):
     # Peal off the trailing slash.
     VUE_ROOT = VUE_ROOT[:-1]
 MAX_STMTS = int(0.5e3)
+MAX_BATCH_QUERIES = int(1e3)
 REDACT_MESSAGE = '[MISSING/INVALID CREDENTIALS: limited to 200 char for Elsevier]'
 
+# Query results are cached in memory, up to this many bytes, and optionally
+# in a directory that may be shared between workers.
+RESULT_CACHE_BYTES = int(environ.get('INDRA_DB_API_CACHE_BYTES', 2**28))
+RESULT_CACHE_DIR = environ.get('INDRA_DB_API_CACHE_DIR')
+RESULT_CACHE_DIR_BYTES = int(environ.get('INDRA_DB_API_CACHE_DIR_BYTES',
+                                         2**32))
+
+# The default strategy for retrieving statements ('joined' or 'two_phase').
+STMT_STRATEGY = environ.get('INDRA_DB_API_STMT_STRATEGY', 'joined')
+
+# The default strategy for retrieving hashes ('single', 'auto', 'fan_out', or
+# 'top_k'). With 'auto', each query costs an extra round trip for estimates.
+HASH_STRATEGY = environ.get('INDRA_DB_API_HASH_STRATEGY', 'single')
+
+# The default mode of applying evidence filters to statements ('post' or
+# 'pushdown').
+EV_FILTER_MODE = environ.get('INDRA_DB_API_EV_FILTER_MODE', 'post')
+
+# Queries for statements or hashes that PostgreSQL estimates will cost more
+# than this are rejected. If not set, no queries are rejected.
+QUERY_COST_BUDGET = environ.get('INDRA_DB_API_COST_BUDGET')
+if QUERY_COST_BUDGET is not None:
+    QUERY_COST_BUDGET = float(QUERY_COST_BUDGET)
+
+# The maximum time, in seconds, the database may spend on a query.
+QUERY_TIMEOUT = environ.get('INDRA_DB_API_QUERY_TIMEOUT')
+if QUERY_TIMEOUT is not None:
+    QUERY_TIMEOUT = float(QUERY_TIMEOUT)
+
+# The number of query shapes whose SQL is kept compiled and run as prepared
+# statements on the readonly database. If 0 (the default), nothing is prepared.
+PREPARED_SHAPES = int(environ.get('INDRA_DB_API_PREPARED_SHAPES', 0))
+
+# A directory holding an agent index (see AgentIndex.build), used to answer
+# simple agent queries for hashes without the database.
+AGENT_INDEX_DIR = environ.get('INDRA_DB_API_AGENT_INDEX_DIR')
+
+# A directory holding a bitmap index (see HashBitmapIndex.build), used to
+# resolve queries of frequent agents, MeSH IDs, and sources, and especially
+# their inversions, before going to the database.
+BITMAP_INDEX_DIR = environ.get('INDRA_DB_API_BITMAP_INDEX_DIR')
+
+# The labels of readonly databases (replicas of the same dump) across which
+# queries are spread, separated by commas. If not set, all queries go to the
+# primary readonly database.
+RO_REPLICAS = environ.get('INDRA_DB_API_RO_REPLICAS')
+
+# The label of a readonly database to which queries that stream or return all
+# of their results are pinned, away from the other replicas.
+RO_ANALYTIC_REPLICA = environ.get('INDRA_DB_API_RO_ANALYTIC_REPLICA')
+
 TESTING = {}
 if environ.get('TESTING_DB_APP') == '1':
     TESTING['status'] = True
@@ -15,9 +15,12 @@ def main():
           include_package_data=True,
           install_requires=['indra', 'boto3', 'sqlalchemy', 'psycopg2-binary',
                             'pgcopy', 'matplotlib', 'flask', 'nltk',
-                            'reportlab', 'cachetools', 'termcolor'],
+                            'reportlab', 'cachetools', 'termcolor', 'numpy'],
           extras_require={'test': ['nose', 'coverage', 'python-coveralls',
-                                   'nose-timer']},
+                                   'nose-timer'],
+                          'fast_json': ['orjson'],
+                          'async': ['asyncpg'],
+                          'bitmap': ['pyroaring']},
           )
 
 